@@ -28,6 +28,9 @@ class ChainStack:
     def push(self, v):
         self._stacks[-1].append(v)
 
+    def extend(self, vs):
+        self._stacks[-1].extend(vs)
+
     def pop(self, index=-1):
         self._stacks[-1].pop(index)
 
@@ -77,6 +80,16 @@ class ChainStack:
             return s[item]
         raise IndexError(item)
 
+    def __setitem__(self, item, value):
+        for s in self._stacks:
+            s_len = len(s)
+            if s_len <= item:
+                item -= s_len
+                continue
+            s[item] = value
+            return
+        raise IndexError(item)
+
 
 class ChainCounter:
     def __init__(self, *counts):
@@ -1,4 +1,5 @@
 from typing import Iterable
+from itertools import count
 from functools import wraps
 
 from inspect import unwrap
@@ -48,44 +49,156 @@ default_match_result = default_initialize('match_result', MatchResult)
 default_env = default_initialize('env', Env.create_default_env)
 
 
+def _rejects(pattern):
+    try:
+        return pattern.rejects
+    except AttributeError:
+        return lambda _cursor: False
+
+
 def find_all(pattern, cursors: Iterable[Cursor], match_result: MatchResult, **kwargs) -> Iterable[Cursor]:
+    return _find_all(pattern, cursors, match_result, _rejects(pattern), **kwargs)
+
+
+def _scope_positions(cursors):
+    """
+    :returns: If the cursors are the candidates among all cursors of a program (see `candidate_cursors`), their
+        positions among all cursors and the number of these, otherwise None for both.
+    """
+    try:
+        return cursors.positions, cursors.total
+    except AttributeError:
+        return None, None
+
+
+def _find_all(pattern, cursors: Iterable[Cursor], match_result: MatchResult, rejects, **kwargs) -> Iterable[Cursor]:
+    return _match_all(cursors, match_result, rejects, lambda c, scope: c.match(pattern, scope, **kwargs))
+
+
+def _match_all(cursors: Iterable[Cursor], match_result: MatchResult, rejects, match) -> Iterable[Cursor]:
+    """
+    The loop of `find_all`, matching at each cursor that isn't rejected by calling `match(cursor, scope)` (which raises
+    `PatternMismatchException` on a mismatch).
+    """
+    # The multi-scope holds a scope per cursor of the program, also of those skipped as non-candidates, such that
+    # it's the same whether the cursors are all scanned or only the candidates found by an index. The scopes of
+    # skipped and rejected cursors are left empty, so are only created once accessed.
     ms = match_result.new_multi_scope()
-    for c in cursors:
+    positions, total = _scope_positions(cursors)
+    scoped = seen = 0
+    for c, position in zip(cursors, count() if positions is None else positions):
+        seen = position + 1
+        if rejects(c):
+            continue
+        if position > scoped:
+            ms.new_empty_scopes(position - scoped)
+        scoped = position + 1
         scope = ms.new_scope()
         with scope.transact():
             try:
                 with scope.transact():
-                    c.match(pattern, scope, **kwargs)
+                    match(c, scope)
                     yield c
             except PatternMismatchException:
                 pass
+    ms.new_empty_scopes((seen if total is None else total) - scoped)
 
 
-def find_first(pattern, cursors: Iterable[Cursor], match_result: MatchResult, **kwargs) -> Cursor:
-    for c in cursors:
+class Search:
+    """
+    A search for a pattern, fed the cursors to search one at a time (in order), e.g. by `Program.run_searches`.
+    """
+
+    def __init__(self, pattern, match_result: MatchResult, **kwargs):
+        self.pattern = pattern
+        self.match_result = match_result
+        self.kwargs = kwargs
+        self.rejects = _rejects(pattern)
+        # The number of cursors the pattern matched at
+        self.matches = 0
+        # Set once no further cursor would change the result
+        self.done = False
+
+    def feed(self, cursor: Cursor):
+        raise NotImplementedError()
+
+    def result(self) -> Cursor:
+        raise NotImplementedError()
+
+
+class FirstSearch(Search):
+    """
+    The search of `find_first`.
+    """
+
+    def __init__(self, pattern, match_result: MatchResult, **kwargs):
+        super().__init__(pattern, match_result, **kwargs)
+        self._match = None
+
+    def feed(self, cursor: Cursor):
+        if self.rejects(cursor):
+            return
         try:
-            with match_result.transact():
-                c.match(pattern, match_result, **kwargs)
-                return c
+            with self.match_result.transact():
+                cursor.match(self.pattern, self.match_result, **self.kwargs)
         except PatternMismatchException:
-            pass
-    raise NoMatches()
+            return
+        self.matches += 1
+        self._match = cursor
+        self.done = True
 
+    def result(self) -> Cursor:
+        if self._match is None:
+            raise NoMatches()
+        return self._match
 
-def find_single(pattern, cursors: Iterable[Cursor], match_result: MatchResult, **kwargs) -> Cursor:
-    ms = match_result.new_temp_multi_scope()
-    match = None
-    for c in cursors:
+
+class SingleSearch(Search):
+    """
+    The search of `find_single`.
+    """
+
+    def __init__(self, pattern, match_result: MatchResult, **kwargs):
+        super().__init__(pattern, match_result, **kwargs)
+        self._ms = match_result.new_temp_multi_scope()
+        self._match = None
+
+    def feed(self, cursor: Cursor):
+        if self.rejects(cursor):
+            return
+        ms = self._ms
         try:
             with ms.transact():
                 scope = ms.new_scope()
-                c.match(pattern, scope, **kwargs)
+                cursor.match(self.pattern, scope, **self.kwargs)
         except PatternMismatchException:
-            continue
-        if match is not None:
+            return
+        self.matches += 1
+        if self._match is not None:
+            self.done = True
+            return
+        self._match = cursor
+
+    def result(self) -> Cursor:
+        if self.done:
             raise TooManyMatches()
-        match = c
-    if match is None:
-        raise NoMatches()
-    match_result.merge_multi_scope(ms)
-    return match
+        if self._match is None:
+            raise NoMatches()
+        self.match_result.merge_multi_scope(self._ms)
+        return self._match
+
+
+def run_search(search: Search, cursors: Iterable[Cursor]) -> Cursor:
+    for c in cursors:
+        search.feed(c)
+        if search.done:
+            break
+    return search.result()
+
+
+def find_first(pattern, cursors: Iterable[Cursor], match_result: MatchResult, **kwargs) -> Cursor:
+    return run_search(FirstSearch(pattern, match_result, **kwargs), cursors)
+
+
+def find_single(pattern, cursors: Iterable[Cursor], match_result: MatchResult, **kwargs) -> Cursor:
+    return run_search(SingleSearch(pattern, match_result, **kwargs), cursors)
@@ -44,3 +44,16 @@ class Cursor:
         :rtype: Cursor
         """
         raise NotImplementedError()
+
+    def skip(self, count: int):
+        """
+        Skip the given number of instructions, backwards if the count is negative.
+
+        :rtype: Cursor
+        """
+        cursor = self
+        for _ in range(count):
+            cursor = cursor.next()
+        for _ in range(-count):
+            cursor = cursor.prev()
+        return cursor
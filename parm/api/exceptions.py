@@ -75,3 +75,9 @@ class OperandsExhausted(PatternMismatchException):
 class ConstructParsingException(PatternMismatchException):
     def __init__(self, construct_error):
         self.construct_error = construct_error
+
+
+class ProgramFrozen(Exception):
+    """
+    Raised when adding code or data to a frozen program (see `Program.freeze`).
+    """
@@ -39,6 +39,9 @@ class ExecutionContext:
     def fork_prev_instruction(self):
         return self.fork(cursor=self.cursor.prev())
 
+    def fork_skip_instructions(self, count):
+        return self.fork(cursor=self.cursor.skip(count))
+
     def fork_offset(self, offset):
         return self.fork(cursor=self.cursor.get_cursor_by_offset(offset))
 
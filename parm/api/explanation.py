@@ -0,0 +1,55 @@
+from typing import List, Optional, Tuple
+
+
+class PatternExplanation:
+    """
+    How a program searches for a pattern, as given by `Program.explain`, and (if analyzed) how the search went.
+    """
+
+    def __init__(self, estimate: Optional[int], instructions: Optional[int], anchor: Optional[str] = None,
+                 postings: Optional[str] = None, postings_size: Optional[int] = None, checks: List[str] = ()):
+        # The estimated number of candidate cursors, and the number of cursors of the program (None if unknown)
+        self.estimate = estimate
+        self.instructions = instructions
+        # The instruction line whose postings are searched, None when scanning all cursors
+        self.anchor = anchor
+        # Which postings of the line are searched (e.g. 'opcodes'), and the number of instructions in them
+        self.postings = postings
+        self.postings_size = postings_size
+        # How the other lines of the anchor run are checked for each of the postings
+        self.checks = list(checks)
+
+        self.backtracking_points = []  # type: List[Tuple[int, str]]
+        self.code_lines = []  # type: List[Tuple[int, str]]
+
+        # Set by analyzing
+        self.candidates = None  # type: Optional[int]
+        self.matches = None  # type: Optional[int]
+        self.elapsed = None  # type: Optional[float]
+
+    @property
+    def analyzed(self):
+        return self.candidates is not None
+
+    def __str__(self):
+        lines = []
+        if self.anchor is None:
+            lines.append('search: scan all cursors')
+        else:
+            lines.append(f'search: {self.postings} index of `{self.anchor}` ({self.postings_size} instructions)')
+        lines.extend(f'  check: {check}' for check in self.checks)
+
+        of = '' if self.instructions is None else f' of {self.instructions}'
+        estimate = 'unknown' if self.estimate is None else str(self.estimate)
+        lines.append(f'estimated candidates: {estimate}{of}')
+
+        for title, points in [('backtracking', self.backtracking_points), ('code per candidate', self.code_lines)]:
+            if points:
+                lines.append(f'{title}:')
+                lines.extend(f'  line {i + 1}: {description}' for i, description in points)
+
+        if self.analyzed:
+            lines.append(f'actual candidates: {self.candidates}')
+            lines.append(f'matches: {self.matches}')
+            lines.append(f'elapsed: {self.elapsed * 1000:.3f} ms')
+        return '\n'.join(lines)
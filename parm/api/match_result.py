@@ -80,10 +80,17 @@ class MultiMatchResult(Transactable):
             yield
 
     def __iter__(self):
-        return iter(self._scopes)
+        for i, scope in enumerate(self._scopes):
+            yield self._scope_at(i) if scope is None else scope
 
     def __getitem__(self, item):
-        return self._scopes[item]
+        scope = self._scopes[item]
+        return self._scope_at(item) if scope is None else scope
+
+    def _scope_at(self, index):
+        scope = MatchResult(self.parent)
+        self._scopes[index] = scope
+        return scope
 
     def __len__(self):
         return len(self._scopes)
@@ -93,8 +100,14 @@ class MultiMatchResult(Transactable):
         self._scopes.push(scope)
         return scope
 
+    def new_empty_scopes(self, count: int):
+        """
+        Add scopes that are left empty (e.g. of cursors that were skipped), each created only once accessed.
+        """
+        self._scopes.extend([None] * count)
+
     def to_obj(self):
-        return [v.to_obj() for v in self._scopes]
+        return [v.to_obj() for v in self]
 
     def to_json(self):
         return obj_to_json(self.to_obj())
@@ -0,0 +1,467 @@
+import gc
+import io
+import os
+import pickle
+import threading
+import multiprocessing
+from itertools import chain, count
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from parm.api.common import Search, _match_all, _rejects, find_all, find_single
+from parm.api.cursor import Cursor
+from parm.api.exceptions import PatternMismatchException, NoMatches, TooManyMatches
+from parm.api.match_result import MatchResult
+
+# Shards per worker, balancing the load of shards having more (or costlier) candidates
+SHARDS_PER_WORKER = 4
+
+
+class _Search(NamedTuple):
+    """
+    The search of the forked workers, inherited from the parent process as is (patterns aren't picklable).
+    """
+    pattern: Any
+    cursors: Any
+    match_result: MatchResult
+    kwargs: dict
+    # If given, a counter of the matches shared by all workers, which stop once there are several
+    matches: Optional[Any] = None
+
+
+# The search of a forked worker, set as it starts
+_search = None  # type: Optional[_Search]
+
+
+def can_fork() -> bool:
+    """
+    Whether worker processes can be forked, which parallel searches require (e.g. not on Windows).
+    """
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def _shard(cursors, start, end) -> Iterable[Cursor]:
+    return cursors[start:end]
+
+
+def _shard_ranges(size, workers):
+    shard_size = max(1, -(-size // (workers * SHARDS_PER_WORKER)))
+    return [(start, min(start + shard_size, size)) for start in range(0, size, shard_size)]
+
+
+def _cursor_address(cursor: Cursor) -> int:
+    address = cursor.address
+    address = getattr(address, 'address', address)
+    try:
+        same = cursor.program.create_cursor(address) == cursor
+    except (PatternMismatchException, NotImplementedError):
+        same = False
+    if not same:
+        raise pickle.PicklingError(f'{cursor!r} cannot be found by its address')
+    return address
+
+
+class _ScopePickler(pickle.Pickler):
+    """
+    Pickles the scope of a match in a worker, referring to the match result the scope was opened in and to the
+    cursors of the program (by their addresses), which the parent process holds as well.
+    """
+
+    def __init__(self, file, match_result: MatchResult):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._match_result = match_result
+
+    def persistent_id(self, obj):
+        if obj is self._match_result:
+            return 'match_result'
+        if isinstance(obj, Cursor):
+            return 'cursor', _cursor_address(obj)
+        return None
+
+
+class _ScopeUnpickler(pickle.Unpickler):
+    def __init__(self, file, program, match_result: MatchResult):
+        super().__init__(file)
+        self._program = program
+        self._match_result = match_result
+
+    def persistent_load(self, pid):
+        if pid == 'match_result':
+            return self._match_result
+        _, address = pid
+        return self._program.create_cursor(address)
+
+
+def _dump_scope(scope: MatchResult, match_result: MatchResult) -> Optional[bytes]:
+    """
+    :returns: The pickled scope, or None if it holds values that can't be pickled.
+    """
+    f = io.BytesIO()
+    try:
+        _ScopePickler(f, match_result).dump(scope)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return f.getvalue()
+
+
+def _load_scope(data: bytes, program, match_result: MatchResult) -> MatchResult:
+    return _ScopeUnpickler(io.BytesIO(data), program, match_result).load()
+
+
+def _match_shard(start, end) -> List[Tuple[int, Optional[bytes]]]:
+    pattern, cursors, match_result, kwargs, matches = _search
+    return _match_cursors(pattern, cursors, start, end, match_result, kwargs, matches, dump_scopes=matches is None)
+
+
+def _match_cursors(pattern, cursors, start, end, match_result: MatchResult, kwargs: dict, matches,
+                   dump_scopes=False) -> List[Tuple[int, Optional[bytes]]]:
+    """
+    Match at the cursors of a shard in a worker, each in a new scope (as `find_all` does).
+
+    :param dump_scopes: Also pickle the scopes of the matches (see `_dump_scope`), for the parent process to merge.
+    :returns: The positions of the cursors the pattern matched at, each with its pickled scope (None if not dumped,
+        or not picklable).
+    """
+    rejects = _rejects(pattern)
+    matched = []
+    for position, c in zip(count(start), _shard(cursors, start, end)):
+        if matches is not None and matches.value > 1:
+            break
+        if rejects(c):
+            continue
+        scope = match_result.new_temp_scope()
+        try:
+            with scope.transact():
+                c.match(pattern, scope, **kwargs)
+        except PatternMismatchException:
+            continue
+        matched.append((position, _dump_scope(scope, match_result) if dump_scopes else None))
+        if matches is not None:
+            with matches.get_lock():
+                matches.value += 1
+    return matched
+
+
+def _init_search(search: _Search):
+    global _search
+    _search = search
+
+
+def _forked_pool(search: _Search, workers: int) -> ProcessPoolExecutor:
+    # The search is inherited by the workers as they're forked, rather than pickled, and this process (where several
+    # threads may search at once) is left as is
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=_init_search,
+        initargs=(search, ))
+
+
+def _sized(cursors):
+    """
+    :returns: The cursors as a sequence that can be sliced into shards (listing them if they can't be, rather than
+        skipping through them for every shard), and their number.
+    """
+    try:
+        cursors[0:0]
+        return cursors, len(cursors)
+    except TypeError:
+        cursors = list(cursors)
+        return cursors, len(cursors)
+
+
+def _scope_matcher(pattern, matched: Dict[int, Optional[bytes]], kwargs: dict):
+    """
+    :returns: A test rejecting the cursors at positions other than the matched ones (of cursors tested in order), and
+        a match filling the scope of a matched cursor: merging the scope pickled by the worker, or matching again if
+        the scope couldn't be pickled.
+    """
+    positions = count()
+    position = None
+
+    def rejects(_cursor):
+        nonlocal position
+        position = next(positions)
+        return position not in matched
+
+    def match(cursor, scope: MatchResult):
+        data = matched[position]
+        if data is None:
+            cursor.match(pattern, scope, **kwargs)
+        else:
+            scope.merge_scope(_load_scope(data, cursor.program, scope.parent))
+
+    return rejects, match
+
+
+def parallel_find_all(pattern, cursors: Iterable[Cursor], match_result: MatchResult, workers: int,
+                      **kwargs) -> Iterable[Cursor]:
+    """
+    Same as `find_all`, but the cursors are split into contiguous shards matched by a pool of forked processes, each
+    holding a copy-on-write view of the program.
+
+    Workers report which cursors the pattern matched at, with the scopes of these pickled (referring to cursors by
+    their addresses). These are merged in order, such that the results are the same as those of `find_all`, with
+    the pattern matched again only at cursors whose scopes can't be pickled. Unlike `find_all`, the cursors are all
+    matched before returning.
+
+    Where processes can't be forked (see `can_fork`), the cursors are matched serially in this process instead.
+    """
+    if not can_fork():
+        return find_all(pattern, cursors, match_result, **kwargs)
+    cursors, _size = _sized(cursors)
+    matched = _parallel_matches(pattern, cursors, match_result, workers, kwargs)
+    return _merge_matches(pattern, cursors, match_result, matched, kwargs)
+
+
+def _parallel_matches(pattern, cursors: Sequence[Cursor], match_result: MatchResult, workers: int,
+                      kwargs: dict) -> Dict[int, Optional[bytes]]:
+    """
+    The part of `parallel_find_all` run by the workers.
+
+    :returns: The positions of the cursors the pattern matched at, with their pickled scopes.
+    """
+    ranges = _shard_ranges(len(cursors), workers)
+    if not ranges:
+        return {}
+    with _forked_pool(_Search(pattern, cursors, match_result, kwargs), workers) as executor:
+        return dict(chain.from_iterable(executor.map(_match_shard, *zip(*ranges))))
+
+
+def _merge_matches(pattern, cursors: Sequence[Cursor], match_result: MatchResult, matched: Dict[int, Optional[bytes]],
+                   kwargs: dict) -> Iterable[Cursor]:
+    """
+    The part of `parallel_find_all` run by this process, merging the matches of the workers.
+    """
+    rejects, match = _scope_matcher(pattern, matched, kwargs)
+    return _match_all(cursors, match_result, rejects, match)
+
+
+def parallel_find_single(pattern, cursors: Iterable[Cursor], match_result: MatchResult, workers: int,
+                         **kwargs) -> Cursor:
+    """
+    Same as `find_single`, but the cursors are split into contiguous shards matched by a pool of forked processes
+    (as with `parallel_find_all`). The workers share a counter of the matches, and all stop as soon as there is a
+    second one.
+
+    The pattern is matched again at the single match, merging its scope into the match result. Where processes
+    can't be forked, the cursors are matched serially instead (as with `parallel_find_all`).
+    """
+    if not can_fork():
+        return find_single(pattern, cursors, match_result, **kwargs)
+    cursors, size = _sized(cursors)
+    matches = multiprocessing.get_context('fork').Value('i', 0)
+    matched = []
+    with _forked_pool(_Search(pattern, cursors, match_result, kwargs, matches), workers) as executor:
+        futures = [executor.submit(_match_shard, start, end) for start, end in _shard_ranges(size, workers)]
+        for future in as_completed(futures):
+            matched.extend(position for position, _scope in future.result())
+            if len(matched) > 1:
+                break
+        # Skip the shards that haven't started yet, the others stop on their own once there are several matches
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+    if len(matched) > 1:
+        raise TooManyMatches()
+    if not matched:
+        raise NoMatches()
+    (position, ) = matched
+    return find_single(pattern, _shard(cursors, position, position + 1), match_result, **kwargs)
+
+
+class _Pool(NamedTuple):
+    """
+    The program of a `ProgramPool`, inherited by its workers when forked.
+    """
+    program: Any
+    # A counter of the matches shared by all workers (see `parallel_find_single`)
+    matches: Any
+    ready: Any
+
+
+_pool = None  # type: Optional[_Pool]
+_pool_lock = threading.Lock()
+
+
+def _pool_ready(_) -> int:
+    # Occupy the worker until all the others are forked, so that each of them runs one of these
+    _pool.ready.wait()
+    return os.getpid()
+
+
+def _pool_match_result(imports: Dict[str, Any]) -> MatchResult:
+    match_result = MatchResult()
+    for name, value in imports.items():
+        match_result[name] = value
+    return match_result
+
+
+@lru_cache(maxsize=4)
+def _pool_candidates(text):
+    # Shared by the shards of a search run by the same worker
+    program = _pool.program
+    pattern = program.create_pattern(text)
+    cursors, _size = _sized(program.candidate_cursors(pattern))
+    return pattern, cursors
+
+
+def _pool_match_shard(text, imports, start, end, single) -> List[Tuple[int, Optional[bytes]]]:
+    pattern, cursors = _pool_candidates(text)
+    matches = _pool.matches if single else None
+    return _match_cursors(
+        pattern, cursors, start, end, _pool_match_result(imports), {}, matches, dump_scopes=not single)
+
+
+def _pool_run_search(search_type, text, imports) -> List[int]:
+    """
+    Run a search in a worker.
+
+    :returns: The positions of the candidate cursors the pattern matched at, until the search was done.
+    """
+    program = _pool.program
+    pattern = program.create_pattern(text)
+    search = search_type(pattern, _pool_match_result(imports))
+    matched = []
+    for position, c in enumerate(program.candidate_cursors(pattern)):
+        matches = search.matches
+        search.feed(c)
+        if search.matches != matches:
+            matched.append(position)
+        if search.done:
+            break
+    return matched
+
+
+def _picklable(imports: Dict[str, Any]) -> bool:
+    try:
+        pickle.dumps(imports)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return False
+    return True
+
+
+class ProgramPool:
+    """
+    A pool of worker processes forked (once) from this one, each holding a copy-on-write view of a frozen program, to
+    run many searches in parallel without paying for forking and warming up the program in each.
+
+    Before forking, the garbage collector is frozen (see `gc.freeze`), moving the objects of the program out of its
+    reach. Collections in the workers would otherwise write to all of them, copying every page of the program into
+    each worker.
+
+    As patterns and cursors aren't picklable, searches are given by the text of their patterns, which the workers
+    compile (using the caches of the program), and the values of the match result that the patterns read (their
+    imports). Workers report the positions of the candidate cursors the patterns matched at (with their scopes, as in
+    `parallel_find_all`), such that the results are the same as of searching the program itself. Searches whose
+    imports aren't picklable (e.g. cursors) run in this process, as do all searches where processes can't be forked
+    (see `can_fork`), in which case the pool has no workers.
+    """
+
+    def __init__(self, program, workers: Optional[int] = None, freeze_gc=True):
+        global _pool
+        self.program = program
+        self.workers = workers or os.cpu_count()
+        program.freeze()
+
+        self._executor = None  # type: Optional[ProcessPoolExecutor]
+        self.pids = []  # type: List[int]
+        if not can_fork():
+            return
+
+        context = multiprocessing.get_context('fork')
+        self._matches = context.Value('i', 0)
+        self._single_lock = threading.Lock()
+        with _pool_lock:
+            _pool = _Pool(program, self._matches, context.Barrier(self.workers))
+            gc.collect()
+            if freeze_gc:
+                gc.freeze()
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                # Fork all workers now, rather than as the first searches are submitted
+                self.pids = list(self._executor.map(_pool_ready, range(self.workers)))
+            finally:
+                _pool = None
+                if freeze_gc:
+                    gc.unfreeze()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _shards(self, text, imports, single):
+        pattern = self.program.create_pattern(text)
+        cursors, size = _sized(self.program.candidate_cursors(pattern))
+        futures = [self._executor.submit(_pool_match_shard, text, imports, start, end, single)
+                   for start, end in _shard_ranges(size, self.workers)]
+        return pattern, cursors, futures
+
+    def find_all(self, text: str, match_result: MatchResult, imports: Dict[str, Any] = None) -> Iterable[Cursor]:
+        """
+        Same as `Program.find_all` (see `parallel_find_all`).
+
+        :param imports: The values of the match result the pattern reads, given to the workers.
+        """
+        imports = imports or {}
+        if self._executor is None or not _picklable(imports):
+            return self.program.find_all(text, match_result)
+        pattern, cursors, futures = self._shards(text, imports, single=False)
+        matched = dict(chain.from_iterable(future.result() for future in futures))
+        return _merge_matches(pattern, cursors, match_result, matched, {})
+
+    def find_single(self, text: str, match_result: MatchResult, imports: Dict[str, Any] = None) -> Cursor:
+        """
+        Same as `Program.find_single` (see `parallel_find_single`).
+
+        :param imports: The values of the match result the pattern reads, given to the workers.
+        """
+        imports = imports or {}
+        if self._executor is None or not _picklable(imports):
+            return self.program.find_single(text, match_result)
+        # The workers share a single counter, so a search must end before the next one starts
+        with self._single_lock:
+            self._matches.value = 0
+            pattern, cursors, futures = self._shards(text, imports, single=True)
+            matched = []
+            for future in as_completed(futures):
+                matched.extend(position for position, _scope in future.result())
+                if len(matched) > 1:
+                    break
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+        if len(matched) > 1:
+            raise TooManyMatches()
+        if not matched:
+            raise NoMatches()
+        (position, ) = matched
+        return find_single(pattern, _shard(cursors, position, position + 1), match_result)
+
+    def run_searches(self, searches: Sequence[Tuple[Search, str, Dict[str, Any]]]):
+        """
+        Same as `Program.run_searches`, running each search in a worker.
+
+        :param searches: The searches, each with the text of its pattern and the values of its match result the
+        pattern reads.
+        """
+        futures = []
+        local = []
+        for search, text, imports in searches:
+            if self._executor is not None and _picklable(imports):
+                futures.append((search, self._executor.submit(_pool_run_search, type(search), text, imports)))
+            else:
+                local.append(search)
+        self.program.run_searches(local)
+
+        for search, future in futures:
+            cursors, _size = _sized(self.program.candidate_cursors(search.pattern))
+            for position in future.result():
+                search.feed(cursors[position])
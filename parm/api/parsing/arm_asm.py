@@ -1,3 +1,5 @@
+import sys
+
 from lark import Token, Transformer
 
 REGS = ('r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r7', 'r8', 'r9', 'r10',
@@ -61,16 +63,53 @@ class Line:
         return address_str + instruction_str
 
 
-class Reg:
-    def __init__(self, name):
+class _Frozen:
+    """
+    Base of the immutable operand types, which may be hashed and used as dict keys.
+    """
+    __slots__ = ()
+
+    def _init(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+
+class Reg(_Frozen):
+    """
+    A core register.
+
+    Registers are interned: there is a single object per register name (regardless of its case), so registers are
+    compared by identity. Synonyms (e.g. `sp` and `r13`) are distinct registers that share the same `index`.
+    """
+    __slots__ = ('name', 'index')
+
+    _interned = {}
+
+    def __new__(cls, name):
+        try:
+            return cls._interned[name]
+        except (KeyError, TypeError):
+            pass
         assert isinstance(name, str)
         assert name in REG_INDEX
-        self.name = name
+        lower = name.lower()
+        try:
+            reg = cls._interned[lower]
+        except KeyError:
+            reg = super().__new__(cls)
+            reg._init(name=lower, index=REG_INDEX[lower])
+            cls._interned[lower] = reg
+        cls._interned[name] = reg
+        return reg
 
-    def __eq__(self, other):
-        if not isinstance(other, Reg):
-            return False
-        return self.name.lower() == other.name.lower()
+    def __reduce__(self):
+        return Reg, (self.name, )
 
     def __str__(self):
         return self.name
@@ -79,15 +118,26 @@ class Reg:
         return f'Reg({self.name!r})'
 
 
-class ShiftedReg:
-    def __init__(self, reg, shift=None):
-        self.reg = reg
-        self.shift = shift
+class ShiftedReg(_Frozen):
+    """
+    A register with an optional shift, hash-consed like registers.
+    """
+    __slots__ = ('reg', 'shift')
 
-    def __eq__(self, other):
-        if not isinstance(other, ShiftedReg):
-            return False
-        return other.reg == self.reg and other.shift == self.shift
+    _interned = {}
+
+    def __new__(cls, reg, shift=None):
+        key = (reg, shift)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            shifted_reg = super().__new__(cls)
+            shifted_reg._init(reg=reg, shift=shift)
+            cls._interned[key] = shifted_reg
+            return shifted_reg
+
+    def __reduce__(self):
+        return ShiftedReg, (self.reg, self.shift)
 
     def __repr__(self):
         if self.shift is None:
@@ -102,10 +152,15 @@ class ShiftedReg:
             return '{}, {}'.format(self.reg, self.shift)
 
 
-class Instruction:
+class Instruction(_Frozen):
+    """
+    An instruction. Immutable like its operands, as programs may build a new instruction on every access (e.g. from
+    the columns of a `CodeStore`), so changes to one wouldn't persist.
+    """
+    __slots__ = ('opcode', 'operands')
+
     def __init__(self, opcode, operands):
-        self.opcode = opcode
-        self.operands = operands
+        self._init(opcode=sys.intern(opcode), operands=tuple(operands))
 
     def __eq__(self, other):
         if not isinstance(other, Instruction):
@@ -116,23 +171,37 @@ class Instruction:
             return False
         return True
 
+    def __hash__(self):
+        return hash((self.opcode.lower(), self.operands))
+
+    def __reduce__(self):
+        return Instruction, (self.opcode, self.operands)
+
     def __repr__(self):
-        return f'Instruction({self.opcode!r}, {self.operands!r})'
+        return f'Instruction({self.opcode!r}, {list(self.operands)!r})'
 
     def __str__(self):
         ps = ', '.join([str(o) for o in self.operands])
         return ' '.join([self.opcode, ps])
 
 
-class Address:
+class Address(_Frozen):
+    __slots__ = ('address', )
+
     def __init__(self, address):
-        self.address = address
+        self._init(address=address)
 
     def __eq__(self, other):
         if not isinstance(other, Address):
             return False
         return self.address == other.address
 
+    def __hash__(self):
+        return hash(self.address)
+
+    def __reduce__(self):
+        return Address, (self.address, )
+
     def __str__(self):
         return f'0x{self.address:X}'
 
@@ -140,14 +209,45 @@ class Address:
         return f'Address(0x{self.address:X})'
 
 
-class Immediate:
-    def __init__(self, value):
-        self.value = value
+SMALL_IMMEDIATES = range(-0x100, 0x1000)
+
+
+class Immediate(_Frozen):
+    """
+    An immediate value. Small integers are shared through a table, as they make up most immediates in code.
+    """
+    __slots__ = ('value', )
+
+    _small = {}
+
+    def __new__(cls, value):
+        if type(value) is int and value in SMALL_IMMEDIATES:
+            try:
+                return cls._small[value]
+            except KeyError:
+                immediate = cls._small[value] = cls._create(value)
+                return immediate
+        return cls._create(value)
+
+    @classmethod
+    def _create(cls, value):
+        immediate = super().__new__(cls)
+        immediate._init(value=value)
+        return immediate
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Immediate):
             return False
-        return self.value == other.value
+        # `#1` and `#1.0` are different operands
+        return type(self.value) is type(other.value) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __reduce__(self):
+        return Immediate, (self.value, )
 
     def __repr__(self):
         return f'Immediate({self.value!r})'
@@ -156,12 +256,14 @@ class Immediate:
         return '#{}'.format(self.value)
 
 
-class RegList:
+class RegList(_Frozen):
+    __slots__ = ('regs', )
+
     def __init__(self, regs):
-        self.regs = regs  # type: list[Reg]
+        self._init(regs=tuple(regs))  # type: tuple[Reg, ...]
 
     def __repr__(self):
-        return f'RegList({self.regs!r})'
+        return f'RegList({list(self.regs)!r})'
 
     def __len__(self):
         return len(self.regs)
@@ -174,6 +276,12 @@ class RegList:
             return False
         return self.regs == other.regs
 
+    def __hash__(self):
+        return hash(self.regs)
+
+    def __reduce__(self):
+        return RegList, (self.regs, )
+
     def __getitem__(self, item):
         return self.regs[item]
 
@@ -181,7 +289,7 @@ class RegList:
         ps = []
 
         range_len = 1
-        range_prev = REG_INDEX[self.regs[0].name]
+        range_prev = self.regs[0].index
 
         def _handle_complete_range():
             if range_len == 0:
@@ -195,7 +303,7 @@ class RegList:
                 ps.append('{}-{}'.format(REGS[range_prev - range_len + 1], REGS[range_prev]))
 
         for r in self.regs[1:]:
-            current_index = REG_INDEX[r.name]
+            current_index = r.index
             if current_index - 1 == range_prev:
                 range_len += 1
             else:
@@ -207,15 +315,23 @@ class RegList:
         return ', '.join(ps)
 
 
-class MemMulti:
+class MemMulti(_Frozen):
+    __slots__ = ('reg_list', )
+
     def __init__(self, reg_list):
-        self.reg_list = reg_list
+        self._init(reg_list=reg_list)
 
     def __eq__(self, other):
         if not isinstance(other, MemMulti):
             return False
         return self.reg_list == other.reg_list
 
+    def __hash__(self):
+        return hash(self.reg_list)
+
+    def __reduce__(self):
+        return MemMulti, (self.reg_list, )
+
     def __repr__(self):
         return f'MemMulti({self.reg_list!r})'
 
@@ -223,10 +339,11 @@ class MemMulti:
         return '{{{}}}'.format(self.reg_list)
 
 
-class MemAccess:
+class MemAccess(_Frozen):
+    __slots__ = ('reg', 'offset')
+
     def __init__(self, reg, offset=None):
-        self.reg = reg
-        self.offset = offset
+        self._init(reg=reg, offset=offset)
 
     def __eq__(self, other):
         if type(other) is not type(self):
@@ -237,8 +354,16 @@ class MemAccess:
             return False
         return True
 
+    def __hash__(self):
+        return hash((type(self), self.reg, self.offset))
+
+    def __reduce__(self):
+        return type(self), (self.reg, self.offset)
+
 
 class MemAccessOffset(MemAccess):
+    __slots__ = ()
+
     def __str__(self):
         return f'[{self.reg}, {self.offset}]'
 
@@ -250,6 +375,8 @@ class MemAccessOffset(MemAccess):
 
 
 class MemAccessPreIndexed(MemAccess):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         assert self.offset != 0
@@ -262,6 +389,8 @@ class MemAccessPreIndexed(MemAccess):
 
 
 class MemAccessPostIndexed(MemAccess):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         assert self.offset != 0
@@ -328,6 +457,41 @@ class ArmTransformer(Transformer):
         assert isinstance(rn, Reg)
         return [rd, rn, rm_shift]
 
+    bitwise_operands = arithmetic_operands
+
+    def compare_operands(self, operands):
+        rn, op2 = operands
+        assert isinstance(rn, Reg)
+        return [rn, op2]
+
+    def two_reg_operands(self, operands):
+        rd, rn = operands
+        assert isinstance(rd, Reg)
+        assert isinstance(rn, Reg)
+        return [rd, rn]
+
+    def reg_only_operands(self, operands):
+        regs, rm = operands
+        if rm is None:
+            return regs
+        assert isinstance(rm, Reg)
+        return regs + [rm]
+
+    def multiply_operands(self, operands):
+        (regs, ) = operands
+        return regs
+
+    shift_unary_operands = multiply_operands
+
+    def shift_operands(self, operands):
+        rd, rm, shift_val = operands
+        assert isinstance(rd, Reg)
+        assert isinstance(rm, Reg)
+        assert isinstance(shift_val, Token)
+        if shift_val.value.startswith('#'):
+            return [rd, rm, Immediate(int(shift_val.value[1:], 0))]
+        return [rd, rm, Reg(shift_val.value)]
+
     def mem_single_operand(self, operands):
         return operands
 
@@ -383,8 +547,8 @@ class ArmTransformer(Transformer):
         assert isinstance(start_reg, Reg)
         assert isinstance(end_reg, Reg)
 
-        start_ix = REG_INDEX[start_reg.name]
-        end_ix = REG_INDEX[end_reg.name]
+        start_ix = start_reg.index
+        end_ix = end_reg.index
         assert start_ix < end_ix
 
         result = []
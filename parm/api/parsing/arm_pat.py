@@ -3,6 +3,7 @@ from typing import List, Literal
 
 from fnmatch import fnmatch
 from functools import wraps
+from itertools import count
 from collections import OrderedDict
 from construct import ConstructError
 
@@ -212,6 +213,8 @@ class MemMultiPat:
 
 
 class RegRangePat:
+    tries = 'tries every range end'
+
     def __init__(self, start, end):
         self.start = start
         self.end = end
@@ -232,12 +235,12 @@ class RegRangePat:
             raise PatternTypeMismatch(self, s)
 
         self.start.consume([s], ctx, _expect_done)
-        s_index = arm_asm.REG_INDEX[s.name]
+        s_index = s.index
 
         for i, o in enumerate(operands[1:]):
             if not isinstance(o, arm_asm.Reg):
                 raise PatternTypeMismatch(self, o)
-            if arm_asm.REG_INDEX[o.name] != s_index + i + 1:
+            if o.index != s_index + i + 1:
                 break
             try:
                 with ctx.match_result.transact():
@@ -289,7 +292,7 @@ class Reg(ContainerBase):
     def consume(self, op, _ctx: ExecutionContext):
         if not isinstance(op, arm_asm.Reg):
             raise PatternTypeMismatch(self.value, op)
-        if self.value.lower() != op.name.lower():
+        if arm_asm.Reg(self.value) is not op:
             raise PatternValueMismatch(self.value, op)
 
 
@@ -326,13 +329,14 @@ class WildcardBase:
 
 class WildcardMulti(WildcardBase):
     symbol = '*'
+    tries = 'tries every number of operands'
 
     def consume(self, operands, ctx: ExecutionContext, complete):
         for i in range(len(operands) + 1):
             try:
                 with ctx.match_result.transact():
                     complete(operands[i:])
-                    ctx.match_result[self.capture] = operands[:i]
+                    ctx.match_result[self.capture] = list(operands[:i])
                     return
             except PatternMismatchException:
                 continue
@@ -341,6 +345,7 @@ class WildcardMulti(WildcardBase):
 
 class WildcardOptional(WildcardBase):
     symbol = '?'
+    tries = 'tries with and without an operand'
 
     def consume(self, operands: list, ctx: ExecutionContext, complete):
         match_result = ctx.match_result
@@ -457,6 +462,48 @@ class Label(ContainerBase):
 class BlockPat(BlockPattern):
     def __init__(self, lines, anchor_index=0):
         super().__init__(lines, anchor_index)
+        self._compiled = None
+
+    def relink_lines(self):
+        super().relink_lines()
+        self._compiled = None
+
+    def compile(self):
+        """
+        :returns: The pattern compiled into closures, which `match` uses (see `arm_pat_compiler`).
+        """
+        if self._compiled is None:
+            from parm.api.parsing.arm_pat_compiler import CompiledBlockPat
+            self._compiled = CompiledBlockPat(self)
+        return self._compiled
+
+    def match(self, cursor, match_result, **kwargs):
+        self.compile().match(cursor, match_result, **kwargs)
+
+    def rejects(self, cursor):
+        return self.compile().rejects(cursor)
+
+    def anchor_run(self):
+        return self.compile().anchor_run
+
+    def backtracking_points(self):
+        points = []
+        for i, line in enumerate(self.lines):
+            value = line.value if isinstance(line, CommandPat) else line
+            if isinstance(value, SkipPat):
+                points.append((i, value.describe()))
+            elif isinstance(value, InstructionPat):
+                for pat in _iter_operand_pats(value.operand_pats):
+                    if isinstance(pat, (WildcardMulti, WildcardOptional, RegRangePat)):
+                        points.append((i, f'`{pat}` in `{value}` {pat.tries}'))
+        return points
+
+    def code_lines(self):
+        return [(i, str(line.value)) for i, line in enumerate(self.lines)
+                if isinstance(line, CommandPat) and isinstance(line.value, CodeLineBase)]
+
+    def match_interpreted(self, cursor, match_result, **kwargs):
+        super().match(cursor, match_result, **kwargs)
 
     def __repr__(self):
         if self.anchor_index == 0:
@@ -482,6 +529,30 @@ class BlockPat(BlockPattern):
         return self.lines == other.lines and self.anchor_index == other.anchor_index
 
 
+def _iter_operand_pats(pat):
+    """
+    Yield the operand pattern and the patterns nested in it.
+    """
+    yield pat
+    if isinstance(pat, OperandsPat):
+        children = pat.ops
+    elif isinstance(pat, MemMultiPat):
+        children = pat.reg_list
+    elif isinstance(pat, ShiftedRegPat):
+        children = [pat.reg_pat, pat.shift_pat]
+    elif isinstance(pat, MemSinglePatBase):
+        children = pat.parts
+    elif isinstance(pat, RegRangePat):
+        children = [pat.start, pat.end]
+    elif isinstance(pat, ContainerBase):
+        children = [pat.value]
+    else:
+        children = []
+    for child in children:
+        if child is not None:
+            yield from _iter_operand_pats(child)
+
+
 class InstructionPat(Matchable):
     def __init__(self, opcode_pat, operand_pats):
         self.opcode_pat = opcode_pat
@@ -518,7 +589,8 @@ class InstructionPat(Matchable):
 
 
 class PythonCodeBase(CodeLineBase, ABC):
-    var_ix = 0
+    # Shared by all patterns, drawing from a count is atomic so patterns may be created concurrently
+    _var_ids = count(1)
 
     def __init__(self, parts):
         self.parts = parts
@@ -534,9 +606,7 @@ class PythonCodeBase(CodeLineBase, ABC):
 
     @classmethod
     def _gen_var(cls):
-        ix = cls.var_ix + 1
-        cls.var_ix = ix
-        return f'var_{ix}'
+        return f'var_{next(cls._var_ids)}'
 
     @staticmethod
     def _fix_indentation(code):
@@ -594,7 +664,8 @@ class PythonCodeLines(PythonCodeBase, CodeLinePatternBase):
 
 
 class PythonMatchableGenerator(PythonCodeBase, CodeLineMatchableGenerator):
-    pass
+    def __str__(self):
+        return f'!{self.unquote()}'
 
 
 class PythonDataObj(PythonCodeBase):
@@ -727,17 +798,11 @@ class ExactSkipPat:
     def __init__(self, skip_count):
         self.skip_count = skip_count
 
-    def match_logic(self, advance, ctx: ExecutionContext, **kwargs):
-        next_ctx = ctx.fork_next_line()
-        for i in range(self.skip_count):
-            next_ctx = advance(next_ctx)
-        next_ctx.match(**kwargs)
-
     def match(self, ctx: ExecutionContext, **kwargs):
-        return self.match_logic(lambda x: x.fork_next_instruction(), ctx, **kwargs)
+        ctx.fork_next_line().fork_skip_instructions(self.skip_count).match(**kwargs)
 
     def match_reverse(self, ctx: ExecutionContext, **kwargs):
-        return self.match_logic(lambda x: x.fork_prev_instruction(), ctx, **kwargs)
+        ctx.fork_next_line().fork_skip_instructions(-self.skip_count).match(**kwargs)
 
 
 class SkipPat:
@@ -773,6 +838,12 @@ class SkipPat:
     def match(self, ctx: ExecutionContext, **kwargs):
         return self.match_logic(lambda x: x.fork_next_instruction(), ctx, **kwargs)
 
+    def describe(self):
+        min_skip = self.min_skip or 0
+        if self.max_skip is None:
+            return f'`...` tries skipping {min_skip} or more instructions, up to the block edge'
+        return f'`...` tries skipping {min_skip} to {self.max_skip} instructions'
+
     def match_reverse(self, ctx: ExecutionContext, **kwargs):
         return self.match_logic(lambda x: x.fork_prev_instruction(), ctx, **kwargs)
 
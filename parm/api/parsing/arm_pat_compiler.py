@@ -0,0 +1,479 @@
+"""
+Compiles `BlockPat`s into closures.
+
+The interpreter walks the pattern through `ForwardLine`/`BackwardLine` links, forks an `ExecutionContext` per line
+and consumes operands through chains of `complete` callbacks. The compiler specializes the common lines
+(instructions, addresses and skips) into closures taking `(cursor, match_result, kwargs)`, each calling the closure
+of the following line. Lines that can't be specialized (code lines, data lines, ...) are interpreted as usual,
+and continue into the compiled closure of the following line when done.
+
+Compiled patterns match exactly like interpreted ones, in the same order and with the same captures. They can also
+tell cheaply that they can't match at a cursor (by the opcode of their first instruction), which lets searches skip
+most cursors without setting up a transaction.
+"""
+import re
+from fnmatch import translate
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from parm.api.exceptions import PatternMismatchException, PatternTypeMismatch, PatternValueMismatch
+from parm.api.exceptions import OperandsExhausted, NotAllOperandsMatched
+from parm.api.execution_context import ExecutionContext
+from parm.api.parsing import arm_asm
+from parm.api.parsing.arm_pat import AddressPat, Address, Label, CommandPat, InstructionPat, OpcodePat, OperandsPat
+from parm.api.parsing.arm_pat import ExactSkipPat, SkipPat, RegPat, Reg, WildcardSingle, ImmediatePat, IntegerVal
+from parm.api.parsing.arm_pat import ShiftedRegPat, MemMultiPat, _consume_list, _expect_done
+from parm.api.pattern import ForwardLine, BackwardLine, AnchorLine
+
+# The operand patterns consuming exactly one operand, which may be checked without a continuation
+SINGLE_CONSUMERS = (Reg, WildcardSingle, ImmediatePat, AddressPat, ShiftedRegPat, MemMultiPat)
+
+Step = Callable[[object, object, dict], None]
+OperandCheck = Callable[[object, object, object], None]
+
+
+def _done(_cursor, _match_result, _kwargs):
+    pass
+
+
+def _any_operand(_op, _match_result, _cursor):
+    pass
+
+
+class _Continuation:
+    """
+    The line following an interpreted line, continuing into compiled code.
+    """
+
+    def __init__(self, step: Step):
+        self._step = step
+
+    @property
+    def next_line(self):
+        raise NotImplementedError()
+
+    def match(self, ctx: ExecutionContext, **kwargs):
+        self._step(ctx.cursor, ctx.match_result, kwargs)
+
+
+def _capture(capture) -> OperandCheck:
+    if capture is None:
+        return _any_operand
+
+    def check(op, match_result, _cursor):
+        match_result[capture] = op
+
+    return check
+
+
+def _compile_reg(pat: Reg) -> OperandCheck:
+    reg = arm_asm.Reg(pat.value)
+
+    def check(op, _match_result, _cursor):
+        if op is not reg:
+            if not isinstance(op, arm_asm.Reg):
+                raise PatternTypeMismatch(pat.value, op)
+            raise PatternValueMismatch(pat.value, op)
+
+    return check
+
+
+def _compile_immediate(pat: ImmediatePat) -> Optional[OperandCheck]:
+    value = pat.value
+    if isinstance(value, IntegerVal):
+        expected = value.value
+
+        def check(op, _match_result, _cursor):
+            if not isinstance(op, arm_asm.Immediate):
+                raise PatternTypeMismatch(pat, op)
+            v = op.value
+            if not isinstance(v, int):
+                raise PatternTypeMismatch(expected, v)
+            if v != expected:
+                raise PatternValueMismatch(expected, v)
+
+        return check
+
+    if isinstance(value, WildcardSingle):
+        capture = value.capture
+
+        def check(op, match_result, _cursor):
+            if not isinstance(op, arm_asm.Immediate):
+                raise PatternTypeMismatch(pat, op)
+            match_result[capture] = op.value
+
+        return check
+
+    return None
+
+
+def _compile_address(pat: AddressPat) -> Optional[OperandCheck]:
+    value = pat.value
+    if isinstance(value, Address):
+        expected = value.address
+
+        def check(op, _match_result, _cursor):
+            # Like `Address.match`, other operand types are not a mismatch
+            if isinstance(op, arm_asm.Address) and op.address != expected:
+                raise PatternValueMismatch(expected, op)
+
+        return check
+
+    if isinstance(value, WildcardSingle):
+        return _capture(value.capture)
+    if isinstance(value, Label):
+        return _capture(value.value)
+    return None
+
+
+def _compile_shifted_reg(pat: ShiftedRegPat) -> Optional[OperandCheck]:
+    if pat.shift_pat is not None:
+        return None
+    reg_check = _compile_operand(pat.reg_pat)
+    if reg_check is None:
+        return None
+
+    def check(op, match_result, cursor):
+        if isinstance(op, arm_asm.ShiftedReg):
+            reg_check(op.reg, match_result, cursor)
+            if op.shift is not None:
+                raise PatternValueMismatch(pat, op)
+        elif isinstance(op, arm_asm.Reg):
+            reg_check(op, match_result, cursor)
+        else:
+            raise PatternTypeMismatch(pat, op)
+
+    return check
+
+
+def _compile_mem_multi(pat: MemMultiPat) -> Optional[OperandCheck]:
+    match_regs = _compile_operand_list(pat.reg_list)
+    if match_regs is None:
+        return None
+
+    def check(op, match_result, cursor):
+        if not isinstance(op, arm_asm.MemMulti):
+            raise PatternTypeMismatch(pat, op)
+        match_regs(op.reg_list, match_result, cursor)
+
+    return check
+
+
+def _compile_operand(pat) -> Optional[OperandCheck]:
+    """
+    :returns: A check of a single operand, or None for patterns that may consume any number of operands.
+    """
+    if isinstance(pat, RegPat):
+        return _compile_operand(pat.value)
+
+    check = None
+    if isinstance(pat, Reg):
+        check = _compile_reg(pat)
+    elif isinstance(pat, WildcardSingle):
+        check = _capture(pat.capture)
+    elif isinstance(pat, ImmediatePat):
+        check = _compile_immediate(pat)
+    elif isinstance(pat, AddressPat):
+        check = _compile_address(pat)
+    elif isinstance(pat, ShiftedRegPat):
+        check = _compile_shifted_reg(pat)
+    elif isinstance(pat, MemMultiPat):
+        check = _compile_mem_multi(pat)
+
+    if check is None and isinstance(pat, SINGLE_CONSUMERS):
+        def check(op, match_result, cursor):
+            pat.consume([op], ExecutionContext(cursor, match_result, None), _expect_done)
+
+    return check
+
+
+def _compile_operand_list(pats):
+    """
+    :returns: A match of a list of operands, or None if it can't be matched by a fixed sequence of checks.
+    """
+    checks = [_compile_operand(p) for p in pats]
+    if any(check is None for check in checks):
+        return None
+    count = len(checks)
+
+    def match_operands(operands, match_result, cursor):
+        if len(operands) == count:
+            for check, op in zip(checks, operands):
+                check(op, match_result, cursor)
+            return
+
+        # Fail like the interpreter, after the operands that do match
+        for i, check in enumerate(checks):
+            if i >= len(operands):
+                raise OperandsExhausted(pats[i])
+            check(operands[i], match_result, cursor)
+        raise NotAllOperandsMatched(operands[count:])
+
+    return match_operands
+
+
+def _compile_operands(operand_pats):
+    if isinstance(operand_pats, OperandsPat):
+        match_operands = _compile_operand_list(operand_pats.ops)
+        if match_operands is not None:
+            return match_operands
+
+        pats = operand_pats.ops
+
+        def match_operands(operands, match_result, cursor):
+            _consume_list(pats, operands, ExecutionContext(cursor, match_result, None), _expect_done)
+
+        return match_operands
+
+    def match_operands(operands, match_result, cursor):
+        operand_pats.match(operands, ExecutionContext(cursor, match_result, None))
+
+    return match_operands
+
+
+def _compile_opcode_test(pat: OpcodePat) -> Callable[[str], bool]:
+    """
+    :returns: A test of lower case opcodes.
+    """
+    name = pat.name.lower()
+    if any(c in name for c in '*?['):
+        return re.compile(translate(name)).match
+    return name.__eq__
+
+
+def _compile_opcode(pat: OpcodePat):
+    matches = _compile_opcode_test(pat)
+    capture = pat.capture
+
+    def match_opcode(opcode, match_result):
+        if not isinstance(opcode, str):
+            raise PatternTypeMismatch(pat.name, opcode)
+        if not matches(opcode.lower()):
+            raise PatternValueMismatch(pat.name, opcode)
+        if capture is not None:
+            match_result[capture] = opcode
+
+    return match_opcode
+
+
+def _compile_instruction(pat: InstructionPat, step: Step, reverse: bool) -> Step:
+    match_opcode = _compile_opcode(pat.opcode_pat)
+    match_operands = _compile_operands(pat.operand_pats)
+
+    def match_logic(cursor, match_result):
+        inst = cursor.instruction
+        if inst is None:
+            raise PatternValueMismatch(pat, cursor)
+        match_opcode(inst.opcode, match_result)
+        match_operands(inst.operands, match_result, cursor)
+
+    if reverse:
+        def match_instruction(cursor, match_result, kwargs):
+            cursor = cursor.prev()
+            match_logic(cursor, match_result)
+            step(cursor, match_result, kwargs)
+    else:
+        def match_instruction(cursor, match_result, kwargs):
+            match_logic(cursor, match_result)
+            step(cursor.next(), match_result, kwargs)
+
+    return match_instruction
+
+
+def _compile_address_line(pat: AddressPat, step: Step) -> Optional[Step]:
+    value = pat.value
+    if isinstance(value, Address):
+        expected = value.address
+
+        def match_address(cursor, match_result, kwargs):
+            address = cursor.address
+            if isinstance(address, arm_asm.Address) and address.address != expected:
+                raise PatternValueMismatch(expected, address)
+            step(cursor, match_result, kwargs)
+
+        return match_address
+
+    if isinstance(value, Label):
+        name = value.value
+
+        def match_label(cursor, match_result, kwargs):
+            match_result[name] = cursor.address
+            step(cursor, match_result, kwargs)
+
+        return match_label
+
+    return None
+
+
+def _compile_exact_skip(pat: ExactSkipPat, step: Step, reverse: bool) -> Step:
+    count = -pat.skip_count if reverse else pat.skip_count
+
+    def skip(cursor, match_result, kwargs):
+        step(cursor.skip(count), match_result, kwargs)
+
+    return skip
+
+
+def _compile_skip(pat: SkipPat, step: Step, reverse: bool) -> Step:
+    min_skip = pat.min_skip
+    max_skip = pat.max_skip
+
+    def skip(cursor, match_result, kwargs):
+        next_cursor = cursor
+        skip_ix = 0
+        while True:
+            if max_skip is not None and skip_ix > max_skip:
+                raise PatternValueMismatch(pat, cursor)
+
+            if min_skip is None or skip_ix >= min_skip:
+                try:
+                    with match_result.transact():
+                        step(next_cursor, match_result, kwargs)
+                    return
+                except PatternMismatchException:
+                    pass
+
+            skip_ix += 1
+            next_cursor = next_cursor.prev() if reverse else next_cursor.next()
+
+    return skip
+
+
+def _interpret_line(line, step: Step, reverse: bool) -> Step:
+    line_type = BackwardLine if reverse else ForwardLine
+    current_line = line_type(line, _Continuation(step))
+
+    def interpret(cursor, match_result, kwargs):
+        ExecutionContext(cursor, match_result, current_line).match(**kwargs)
+
+    return interpret
+
+
+def compile_line(line, step: Step, reverse=False) -> Step:
+    """
+    Compile a line of a block pattern.
+
+    :param step: The compiled rest of the pattern, to continue with once the line matches.
+    :param reverse: Whether the line is matched backwards, as are the lines before the anchor.
+    """
+    compiled = None
+    if isinstance(line, CommandPat) and isinstance(line.value, InstructionPat):
+        compiled = _compile_instruction(line.value, step, reverse)
+    elif isinstance(line, AddressPat) and not reverse:
+        compiled = _compile_address_line(line, step)
+    elif isinstance(line, ExactSkipPat):
+        compiled = _compile_exact_skip(line, step, reverse)
+    elif isinstance(line, SkipPat):
+        compiled = _compile_skip(line, step, reverse)
+
+    if compiled is None:
+        compiled = _interpret_line(line, step, reverse)
+    return compiled
+
+
+def _never_rejects(_cursor):
+    return False
+
+
+def _anchor_line(pat: InstructionPat, offset, window) -> AnchorLine:
+    opcode_pat = pat.opcode_pat
+    opcode_test = None if opcode_pat.name == '*' else _compile_opcode_test(opcode_pat)
+
+    immediates = []
+    addresses = []
+    if isinstance(pat.operand_pats, OperandsPat):
+        # Each of these consumes a single operand of the instruction, wherever wildcards place it
+        for op in pat.operand_pats.ops:
+            if isinstance(op, ImmediatePat) and isinstance(op.value, IntegerVal):
+                immediates.append(op.value.value)
+            elif isinstance(op, AddressPat) and isinstance(op.value, Address):
+                addresses.append(op.value.address)
+    return AnchorLine(offset, opcode_test, tuple(immediates), tuple(addresses), window, str(pat))
+
+
+def _collect_anchor_lines(lines: Iterable, reverse: bool) -> Tuple[List[AnchorLine], bool]:
+    """
+    Collect the anchor lines of the instructions among the given lines, in matching order from the cursor, up to the
+    first line that isn't an instruction or a skip (and so may run code).
+
+    :returns: The anchor lines, and whether all lines were collected.
+    """
+    run = []
+    direction = -1 if reverse else 1
+    offset = 0
+    window = 0
+    for line in lines:
+        if isinstance(line, ExactSkipPat):
+            offset += direction * line.skip_count
+            continue
+        if isinstance(line, SkipPat):
+            min_skip = line.min_skip or 0
+            offset += direction * min_skip
+            if window is not None:
+                window = None if line.max_skip is None else window + line.max_skip - min_skip
+            continue
+        if not isinstance(line, CommandPat) or not isinstance(line.value, InstructionPat):
+            return run, False
+
+        if reverse:
+            offset -= 1
+        anchor_line = _anchor_line(line.value, offset, window)
+        if anchor_line.opcode_test is not None or anchor_line.immediates or anchor_line.addresses:
+            run.append(anchor_line)
+        if not reverse:
+            offset += 1
+    return run, True
+
+
+def _compile_anchor_run(block_pat) -> List[AnchorLine]:
+    """
+    Collect what the instructions of the pattern require around the cursor, from either side of the anchor.
+    The pattern can't match at cursors where any requirement fails, and would fail before any side effect of matching.
+    """
+    anchor_ix = block_pat.anchor_index
+    run, complete = _collect_anchor_lines(reversed(block_pat.lines[:anchor_ix]), reverse=True)
+    if not complete:
+        # The remaining lines before the anchor are matched next, and may run code
+        return run
+    forward, _ = _collect_anchor_lines(block_pat.lines[anchor_ix:], reverse=False)
+    return run + forward
+
+
+def _compile_rejects(run: List[AnchorLine]) -> Callable[[object], bool]:
+    """
+    Compile a test of cursors the pattern can't match at, that fails before any side effect of matching.
+    """
+    anchor_line = next((line for line in run if line.offset == 0 and line.window == 0), None)
+    if anchor_line is None or anchor_line.opcode_test is None:
+        return _never_rejects
+    matches = anchor_line.opcode_test
+
+    def rejects(cursor):
+        try:
+            inst = cursor.instruction
+        except PatternMismatchException:
+            return False
+        return inst is None or not matches(inst.opcode.lower())
+
+    return rejects
+
+
+class CompiledBlockPat:
+    def __init__(self, block_pat):
+        anchor_ix = block_pat.anchor_index
+
+        backward = _done
+        for line in block_pat.lines[:anchor_ix]:
+            backward = compile_line(line, backward, reverse=True)
+
+        forward = _done
+        for line in reversed(block_pat.lines[anchor_ix:]):
+            forward = compile_line(line, forward)
+
+        self._backward = backward
+        self._forward = forward
+        self.anchor_run = _compile_anchor_run(block_pat)
+        self.rejects = _compile_rejects(self.anchor_run)
+
+    def match(self, cursor, match_result, **kwargs):
+        self._backward(cursor, match_result, kwargs)
+        self._forward(cursor, match_result, kwargs)
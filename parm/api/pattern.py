@@ -1,4 +1,5 @@
 from abc import ABC
+from typing import Callable, List, NamedTuple, Optional, Tuple
 
 from parm.api.program import Program
 from parm.api.cursor import Cursor
@@ -9,6 +10,26 @@ from parm.api.matchable import Matchable
 from parm.api.execution_context import ExecutionContext
 
 
+class AnchorLine(NamedTuple):
+    """
+    What a pattern requires of an instruction near the cursor it matches at.
+
+    The instruction is at `offset` from the cursor, or (past skips) up to `window` instructions further away from it,
+    i.e. after it for non-negative offsets and before it for negative ones.
+    """
+    offset: int
+    # A test of the lower case opcode, None for any opcode
+    opcode_test: Optional[Callable[[str], bool]]
+    # Integer immediates that must be operands of the instruction
+    immediates: Tuple[int, ...] = ()
+    # Addresses that must be operands of the instruction, unless it has operands of other types (see `AddressPat`)
+    addresses: Tuple[int, ...] = ()
+    # None for any number of instructions, up to the end of the block
+    window: Optional[int] = 0
+    # The instruction line, for explanations
+    source: str = ''
+
+
 class LinePattern:
     @property
     def code(self):
@@ -163,6 +184,40 @@ class BlockPattern:
 
         return b_line, f_line
 
+    def rejects(self, cursor: Cursor) -> bool:
+        """
+        Whether the pattern surely doesn't match at the cursor, such that matching would fail without side effects.
+        This is a cheap test, that may not reject all mismatching cursors.
+        """
+        return False
+
+    def anchor_run(self) -> List[AnchorLine]:
+        """
+        What the pattern requires of the instructions at fixed offsets from the cursor, such that it surely doesn't
+        match at cursors where any requirement fails (as with `rejects`). Programs may use them to only visit the
+        cursors starting a run of matching instructions, e.g. through an index.
+
+        :returns: The requirements, empty if the pattern may match at any instruction.
+        """
+        return []
+
+    def backtracking_points(self) -> List[Tuple[int, str]]:
+        """
+        The lines that may match in several ways, each tried in turn (in a transaction) until the rest of the pattern
+        matches. Every candidate cursor reaching them may match the rest of the pattern several times.
+
+        :returns: The indices of the lines, with descriptions of what they try.
+        """
+        return []
+
+    def code_lines(self) -> List[Tuple[int, str]]:
+        """
+        The lines running code, for every candidate cursor matching the lines matched before them.
+
+        :returns: The indices of the lines, with their code.
+        """
+        return [(i, str(line)) for i, line in enumerate(self.lines) if isinstance(line, CodeLineBase)]
+
     def match(self, cursor: Cursor, match_result: MatchResult, **kwargs):
         ctx = ExecutionContext(cursor, match_result, current_line=self.b_line)
         ctx.match(**kwargs)
@@ -1,12 +1,18 @@
-from parm.api.exceptions import UnresolvedSymbolException
+from time import perf_counter
+from typing import Optional, Sequence
+
+from parm.api.exceptions import ProgramFrozen, UnresolvedSymbolException
 from parm.api.type_hints import ReversibleIterable
 
 from parm.api.env import Env
 from parm.api.match_result import MatchResult
 from parm.api.cursor import Cursor
 from parm.api.null_cursor import NullCursor
-from parm.api.common import find_all, find_first, find_single
+from parm.api.common import Search, find_all, find_first, find_single
+from parm.api.explanation import PatternExplanation
+from parm.api.parallel import parallel_find_all, parallel_find_single
 from parm.api.program_base import ProgramBase
+from parm.api.symbols import Symbol
 
 
 def _repeat(initial, func, count):
@@ -23,6 +29,23 @@ class Program(ProgramBase):
 
         self.env = env
         self.register_default_extensions()
+        self._frozen = False
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    def freeze(self):
+        """
+        Make the program read-only, building any state it would otherwise build lazily while matching. A frozen
+        program may be shared by threads matching concurrently (e.g. in a `ThreadPoolExecutor`), while adding code or
+        data to it raises `ProgramFrozen`.
+        """
+        self._frozen = True
+
+    def _check_not_frozen(self):
+        if self._frozen:
+            raise ProgramFrozen()
 
     def register_extension_type(self, ext_type):
         self.env.register_extension_type(ext_type)
@@ -31,29 +54,102 @@ class Program(ProgramBase):
         from parm.extensions.default_extensions import DefaultExtension
         self.register_extension_type(DefaultExtension)
 
-    def find_all(self, pattern, match_result: MatchResult):
+    def find_all(self, pattern, match_result: MatchResult, workers: Optional[int] = None):
+        """
+        :param workers: If given, match in that many forked worker processes (see `parallel_find_all`), with the same
+            results as matching serially. Ignored where processes can't be forked.
+        """
         if isinstance(pattern, str):
             pattern = self.create_pattern(pattern)
 
-        return find_all(pattern, cursors=self.asm_cursors, match_result=match_result)
+        cursors = self.candidate_cursors(pattern)
+        if workers is not None:
+            return parallel_find_all(pattern, cursors, match_result, workers)
+        return find_all(pattern, cursors=cursors, match_result=match_result)
 
     def find_first(self, pattern, match_result: MatchResult):
         if isinstance(pattern, str):
             pattern = self.create_pattern(pattern)
 
-        return find_first(pattern, cursors=self.asm_cursors, match_result=match_result)
+        return find_first(pattern, cursors=self.candidate_cursors(pattern), match_result=match_result)
 
-    def find_single(self, pattern, match_result: MatchResult):
+    def find_single(self, pattern, match_result: MatchResult, workers: Optional[int] = None):
+        """
+        :param workers: If given, match in that many forked worker processes (see `parallel_find_single`), stopping
+            them all once there are several matches. Ignored where processes can't be forked.
+        """
         if isinstance(pattern, str):
             pattern = self.create_pattern(pattern)
 
-        return find_single(pattern, cursors=self.asm_cursors, match_result=match_result)
+        cursors = self.candidate_cursors(pattern)
+        if workers is not None:
+            return parallel_find_single(pattern, cursors, match_result, workers)
+        return find_single(pattern, cursors=cursors, match_result=match_result)
 
     def find_last(self, pattern, match_result):
         if isinstance(pattern, str):
             pattern = self.create_pattern(pattern)
 
-        return find_first(pattern, cursors=reversed(self.asm_cursors), match_result=match_result)
+        return find_first(pattern, cursors=reversed(self.candidate_cursors(pattern)), match_result=match_result)
+
+    def run_searches(self, searches: Sequence[Search]):
+        """
+        Feed the searches their candidate cursors (see `candidate_cursors`) in a single pass over the program, rather
+        than a pass per search. Each search is fed its cursors in order, as by `find_first` or `find_single`.
+        """
+        active = [s for s in searches if not s.done]
+        for c in self.asm_cursors:
+            if not active:
+                break
+            for search in active:
+                search.feed(c)
+            active = [s for s in active if not s.done]
+
+    def explain(self, pattern, match_result: MatchResult = None, analyze=False) -> PatternExplanation:
+        """
+        Explain how `find_all` searches for the pattern: how its candidate cursors are found and how many there are,
+        and what is tried or run for each of them.
+
+        :param match_result: The match result to match in when analyzing (e.g. holding the values of imports), which
+            is left unchanged.
+        :param analyze: Also search for the pattern, reporting the actual numbers of candidates and matches.
+        """
+        if isinstance(pattern, str):
+            pattern = self.create_pattern(pattern)
+
+        explanation = self._explain_search(pattern)
+        for name in ['backtracking_points', 'code_lines']:
+            points = getattr(pattern, name, None)
+            if points is not None:
+                setattr(explanation, name, points())
+
+        if analyze:
+            if match_result is None:
+                match_result = MatchResult()
+            candidates = 0
+
+            def counted(cursors):
+                nonlocal candidates
+                for c in cursors:
+                    candidates += 1
+                    yield c
+
+            start = perf_counter()
+            cursors = counted(self.candidate_cursors(pattern))
+            explanation.matches = sum(1 for _ in find_all(pattern, cursors, match_result.new_temp_scope()))
+            explanation.elapsed = perf_counter() - start
+            explanation.candidates = candidates
+        return explanation
+
+    def _explain_search(self, pattern) -> PatternExplanation:
+        """
+        Explain how `candidate_cursors` finds the cursors searched for the pattern.
+        """
+        try:
+            count = len(self.asm_cursors)
+        except TypeError:
+            count = None
+        return PatternExplanation(count, count)
 
     def create_cursor(self, address) -> Cursor:
         raise NotImplementedError()
@@ -76,6 +172,18 @@ class Program(ProgramBase):
     def find_symbol(self, symbol_name) -> Cursor:
         raise UnresolvedSymbolException(symbol_name)
 
+    def nearest_symbol(self, address: int) -> Optional[Symbol]:
+        """
+        :returns: The symbol at or closest before the address (e.g. the function holding it), if any.
+        """
+        return None
+
     @property
     def asm_cursors(self) -> ReversibleIterable[Cursor]:
         raise NotImplementedError()
+
+    def candidate_cursors(self, pattern) -> ReversibleIterable[Cursor]:
+        """
+        The cursors searched for the pattern, a subset of `asm_cursors` excluding cursors it surely doesn't match at.
+        """
+        return self.asm_cursors
@@ -0,0 +1,53 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class Symbol(NamedTuple):
+    name: str
+    address: int
+    # 0 if unknown
+    size: int = 0
+
+    def contains(self, address) -> bool:
+        return self.address <= address < self.address + max(self.size, 1)
+
+
+class SymbolTable:
+    """
+    The symbols of a program, indexed by name (through a dict) and by address (sorted, searched by bisection).
+
+    Where several symbols have the same name, the first one added is kept.
+    """
+
+    def __init__(self, symbols: Iterable[Symbol] = ()):
+        self._by_name = {}  # type: Dict[str, Symbol]
+        self._by_address = []  # type: List[Symbol]
+        self._addresses = []  # type: List[int]
+        self.update(symbols)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def update(self, symbols: Iterable[Symbol]):
+        for symbol in symbols:
+            if symbol.name in self._by_name:
+                continue
+            self._by_name[symbol.name] = symbol
+            self._by_address.append(symbol)
+
+        # Of symbols at the same address, the largest (e.g. a function rather than a label within it) comes last
+        self._by_address.sort(key=lambda s: (s.address, s.size))
+        self._addresses = [symbol.address for symbol in self._by_address]
+
+    def find(self, name: str) -> Optional[Symbol]:
+        return self._by_name.get(name)
+
+    def nearest(self, address: int) -> Optional[Symbol]:
+        """
+        :returns: The symbol at or closest before the address, which encloses it unless it's past the symbol's size.
+        """
+        ix = bisect_right(self._addresses, address) - 1
+        return self._by_address[ix] if ix >= 0 else None
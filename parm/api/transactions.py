@@ -1,3 +1,4 @@
+import pickle
 from contextlib import contextmanager
 
 from parm.api.chaining import ChainMap, ChainStack, ChainCounter
@@ -69,6 +70,13 @@ class Transaction:
     def commit(self):
         self._finish_transaction(self._inherit_rollback)
 
+    def __reduce__(self):
+        # Pickled (e.g. with the scope of a match) as a new transaction, as the rollback operations inherited from
+        # committed children are never run, and aren't picklable
+        if self._parent is not None or self._children:
+            raise pickle.PicklingError('Transactions in progress cannot be pickled')
+        return Transaction, ()
+
 
 class Transactable:
     def __init__(self, transaction=None):
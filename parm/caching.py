@@ -0,0 +1,38 @@
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Callable, IO
+
+CACHE_DIR_ENV = 'PARM_CACHE_DIR'
+
+
+def default_cache_dir() -> Path:
+    try:
+        return Path(os.environ[CACHE_DIR_ENV])
+    except KeyError:
+        return Path.home() / '.cache' / 'parm'
+
+
+def hash_file(path: Path, digest=None) -> str:
+    if digest is None:
+        digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(0x100000), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomically(path: Path, write: Callable[[IO[bytes]], None]):
+    """
+    Write a file through a temporary one, so concurrent readers never see a partial file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
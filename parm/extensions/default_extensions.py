@@ -1,4 +1,4 @@
-from typing import Iterable
+from typing import Iterable, Optional
 
 from parm.api.execution_context import ExecutionContext
 from parm.api.common import find_single
@@ -7,6 +7,7 @@ from parm.api.match_result import MatchResult
 from parm.api.exceptions import PatternMismatchException
 from parm.api.matchable import Matchable
 from parm.api.parsing.arm_asm import Address
+from parm.api.symbols import Symbol
 
 from parm.extensions.extension_base import ExecutionExtensionBase
 from parm.extensions.extension_base import injected_func, magic_getter, magic_setter
@@ -19,17 +20,11 @@ class InstructionSkipper(Matchable):
 
     def match(self, ctx: ExecutionContext, **kwargs):
         assert ctx.cursor is self.ext.cursor
-        n = self.skip_count
-        for _ in range(n):
-            ctx = ctx.fork_next_instruction()
-        ctx.fork_next_line().match(**kwargs)
+        ctx.fork_skip_instructions(self.skip_count).fork_next_line().match(**kwargs)
 
     def match_reverse(self, ctx: ExecutionContext, **kwargs):
         assert ctx.cursor is self.ext.cursor
-        n = self.skip_count
-        for _ in range(n):
-            ctx = ctx.fork_prev_instruction()
-        ctx.fork_next_line().match(**kwargs)
+        ctx.fork_skip_instructions(-self.skip_count).fork_next_line().match(**kwargs)
 
 
 class DefaultExtension(ExecutionExtensionBase):
@@ -124,6 +119,14 @@ class DefaultExtension(ExecutionExtensionBase):
         assert isinstance(location, Cursor)
         return location
 
+    @injected_func
+    def nearest_symbol(self, location=None) -> Optional[Symbol]:
+        """
+        :returns: The symbol at or closest before a location (as given to `ptr`), defaulting to the cursor.
+        """
+        cursor = self.cursor if location is None else self.ptr(location)
+        return self.program.nearest_symbol(cursor.address_val)
+
 
 class AnalysisExtension(ExecutionExtensionBase):
     def get_xrefs_to(self, cursor):
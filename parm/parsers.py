@@ -1,5 +1,19 @@
+import sys
+import types
+import pickle
+import hashlib
+import importlib
+from pathlib import Path
+from functools import lru_cache
+from typing import Optional
+
+import lark
 from lark import Lark
 
+from parm.caching import default_cache_dir, hash_file, write_atomically
+
+PARSER_CACHE_SUBDIR = 'parsers'
+
 
 def create_parser(path, rel_to, start, postlex=None, parser='earley', lexer=None, **kwargs):
     if postlex is not None:
@@ -12,9 +26,91 @@ def create_parser(path, rel_to, start, postlex=None, parser='earley', lexer=None
     return Lark.open(path, rel_to=rel_to, start=start, **kwargs)
 
 
+class _ParserPickler(pickle.Pickler):
+    # Lark parsers keep a reference to the `re` module, which cannot be pickled as is
+    def reducer_override(self, obj):
+        if isinstance(obj, types.ModuleType):
+            return importlib.import_module, (obj.__name__,)
+        return NotImplemented
+
+
+def _parser_cache_path(path, rel_to, start, cache_dir: Path, **kwargs) -> Path:
+    grammar_path = Path(rel_to).parent / path
+
+    # Grammars may import each other, so any change to a sibling grammar invalidates the cache
+    digest = hashlib.sha256()
+    digest.update(repr((start, sorted(kwargs.items()), lark.__version__, sys.version_info[:2])).encode())
+    for grammar_file in sorted(grammar_path.parent.glob('*.lark')):
+        hash_file(grammar_file, digest)
+
+    return cache_dir / PARSER_CACHE_SUBDIR / f'{grammar_path.stem}-{digest.hexdigest()}.pickle'
+
+
+def load_parser(path, rel_to, start, cache_dir: Optional[Path] = None, **kwargs):
+    """
+    Same as :func:`create_parser`, but reuses a parser previously built from the same grammar files and
+    pickled to the given cache directory (which defaults to $PARM_CACHE_DIR or ~/.cache/parm).
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    cache_path = _parser_cache_path(path, rel_to, start, cache_dir, **kwargs)
+
+    if kwargs.get('parser') == 'lalr':
+        # Lark caches LALR parsers by itself (the parse table cannot simply be pickled, as it relies on identity)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return create_parser(path, rel_to, start, **kwargs)
+        return create_parser(path, rel_to, start, cache=str(cache_path.with_suffix('.lalr')), **kwargs)
+
+    try:
+        with cache_path.open('rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        cache_path.unlink(missing_ok=True)
+
+    parser = create_parser(path, rel_to, start, **kwargs)
+    try:
+        write_atomically(cache_path, lambda f: _ParserPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(parser))
+    except OSError:
+        pass  # The cache is only an optimization
+    return parser
+
+
 def create_arm_parser():
     return create_parser('lark_files/arm_asm.lark', rel_to=__file__, start='block')
 
 
+def create_arm_lalr_parser():
+    return create_parser('lark_files/arm_asm_lalr.lark', rel_to=__file__, start='block', parser='lalr', lexer='contextual')
+
+
 def create_arm_pattern_parser():
     return create_parser('lark_files/arm_pat.lark', rel_to=__file__, start='block_pat')
+
+
+@lru_cache(maxsize=None)
+def get_arm_parser():
+    """
+    :returns: The ARM parser shared by the whole process.
+    """
+    return load_parser('lark_files/arm_asm.lark', rel_to=__file__, start='block')
+
+
+@lru_cache(maxsize=None)
+def get_arm_lalr_parser():
+    """
+    :returns: The LALR variant of the ARM parser, shared by the whole process.
+    """
+    return load_parser(
+        'lark_files/arm_asm_lalr.lark', rel_to=__file__, start='block', parser='lalr', lexer='contextual')
+
+
+@lru_cache(maxsize=None)
+def get_arm_pattern_parser():
+    """
+    :returns: The ARM pattern parser shared by the whole process.
+    """
+    return load_parser('lark_files/arm_pat.lark', rel_to=__file__, start='block_pat')
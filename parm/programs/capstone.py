@@ -1,19 +1,35 @@
-from typing import IO, Tuple, Optional
+import gc
+import os
+import mmap
+import threading
+from typing import IO, Tuple, Optional, Union, List, Callable
 
+from bisect import bisect_right
 from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait
 from capstone import CS_ARCH_ARM, CS_ARCH_X86, CS_MODE_ARM, Cs
+from elftools.elf.constants import SH_FLAGS
 from elftools.elf.elffile import ELFFile
 
 from parm.api.cursor import Cursor
+from parm.api.parsing.arm_asm import Block, Line
+from parm.api.symbols import Symbol
 from parm.extensions.extension_base import magic_getter
 from parm.extensions.default_extensions import AnalysisExtension
 from parm.programs.snippet import ArmSnippetProgram
+from parm.programs.capstone_decoder import decode_instructions, decode_line
+from parm.programs.disassembly_cache import DisassemblyCache
+from parm.programs.paging import PageCache, LazyCodeRegion, LazyCursorSequence, DEFAULT_PAGE_SIZE, DEFAULT_MAX_PAGES
 
 CAPSTONE_ARCH = {
     "arm": CS_ARCH_ARM,
     "x86": CS_ARCH_X86,  # Not supported yet
 }
 
+ARM_INSTRUCTION_SIZE = 4
+DEFAULT_CHUNK_SIZE = 0x10000
+
 
 def translate_mode(arch, mode):
     if arch != 'arm':
@@ -35,7 +51,7 @@ class CapstoneAnalysisExt(AnalysisExtension):
 
 
 class CapstoneProgram(ArmSnippetProgram):
-    def __init__(self, code: str = "", auto_analyze: bool = False):
+    def __init__(self, code: Union[str, Block] = "", auto_analyze: bool = False):
         super().__init__()
 
         self.auto_analyze = auto_analyze
@@ -46,27 +62,42 @@ class CapstoneProgram(ArmSnippetProgram):
         super(CapstoneProgram, self).register_default_extensions()
         self.register_extension_type(CapstoneAnalysisExt)
 
-    def find_symbol(self, symbol_name) -> Cursor:
-        raise NotImplementedError()
-
     def _analyze(self, cursors):
         raise NotImplementedError()
 
     @classmethod
-    def load_elf(cls, path: Path, arch: str, mode: int):
-        return cls(disassemble_elf(path, arch, mode))
+    def load_elf(
+            cls,
+            path: Path,
+            arch: str,
+            mode: int,
+            workers: Optional[int] = None,
+            cache: Optional[DisassemblyCache] = None):
+        program = cls(decode_elf(path, arch, mode, workers, cache))
+        program.add_mapped_data(map_elf_data(path))
+        program.add_symbols(read_elf_symbols(path))
+        return program
 
     @classmethod
-    def load_arm_elf(cls, path: Path):
-        return cls.load_elf(path, 'arm', 32)
+    def load_arm_elf(cls, path: Path, workers: Optional[int] = None, cache: Optional[DisassemblyCache] = None):
+        return cls.load_elf(path, 'arm', 32, workers, cache)
 
     @classmethod
-    def load_binary(cls, path: Path, arch, mode, offset=0, size=None):
-        return cls(disassemble_binary(path, arch, mode, offset, size))
+    def load_binary(cls, path: Path, arch, mode, offset=0, size=None, workers: Optional[int] = None):
+        program = cls(decode_binary(path, arch, mode, offset, size, workers))
+        program.add_mapped_data(map_binary_data(path, offset, size))
+        return program
 
     @classmethod
-    def load_arm_binary(cls, path: Path, offset=0, size=None):
-        return cls.load_binary(path, 'arm', 32, offset, size)
+    def load_arm_binary(cls, path: Path, offset=0, size=None, workers: Optional[int] = None):
+        return cls.load_binary(path, 'arm', 32, offset, size, workers)
+
+    def add_mapped_data(self, blocks: List[Tuple[int, memoryview]]):
+        """
+        Add the data of a loaded file (see `map_elf_data`), such that data patterns may read it.
+        """
+        for address, data in blocks:
+            self.add_data_block(address, data)
 
     def analyze(self, cursors=None):
         if cursors is None:
@@ -82,6 +113,105 @@ class CapstoneProgram(ArmSnippetProgram):
             self.analyze(self._asm_cursors[before:after])
 
 
+class LazyCapstoneProgram(CapstoneProgram):
+    """
+    A capstone program that only disassembles its code when it is first touched.
+
+    The code is split into fixed-size pages, decoded whenever a cursor in them is requested (either
+    directly, or by walking or iterating over cursors). At most `max_pages` decoded pages are cached,
+    the least recently used ones being evicted (and decoded again if touched later on).
+    """
+
+    def __init__(
+            self,
+            arch: str = 'arm',
+            mode: int = 32,
+            page_size: int = DEFAULT_PAGE_SIZE,
+            max_pages: int = DEFAULT_MAX_PAGES):
+        super().__init__()
+        if page_size % ARM_INSTRUCTION_SIZE:
+            raise ValueError(f'Page size must be a multiple of {ARM_INSTRUCTION_SIZE}')
+
+        self.page_size = page_size
+        self.page_cache = PageCache(max_pages)
+        self._cs = create_disassembler(arch, mode, detail=True)
+        # Capstone handles can't be used by several threads at once
+        self._cs_lock = threading.Lock()
+        self._code_regions = []  # type: List[LazyCodeRegion]
+
+    def add_lazy_code(self, address: int, ops: bytes):
+        self._check_not_frozen()
+        if not ops:
+            raise ValueError("Nothing to disassemble")
+
+        region = LazyCodeRegion(
+            self, address, len(ops), lambda start, end: self._decode_page(address, ops, start, end),
+            self.page_cache, self.page_size)
+
+        starts = [r.start_address for r in self._code_regions]
+        ix = bisect_right(starts, address)
+        for other in self._code_regions[max(ix - 1, 0):ix + 1]:
+            if other.start_address < region.end_address and region.start_address < other.end_address:
+                raise ValueError(f'Code region {region!s} overlaps {other!s}')
+        self._code_regions.insert(ix, region)
+
+    def _decode_page(self, region_address, ops, start, end) -> List[Line]:
+        page_ops = ops[start - region_address:end - region_address]
+        with self._cs_lock:
+            return [decode_line(inst) for inst in iter_disassembly(self._cs, page_ops, start)]
+
+    def _find_code_region(self, address) -> Optional[LazyCodeRegion]:
+        starts = [r.start_address for r in self._code_regions]
+        ix = bisect_right(starts, address) - 1
+        if ix >= 0:
+            region = self._code_regions[ix]
+            if region.contains(address):
+                return region
+        return None
+
+    def create_cursor(self, address) -> Cursor:
+        if address is not None:
+            region = self._find_code_region(address)
+            if region is not None:
+                cursor = region.find_cursor(address)
+                if cursor is not None:
+                    return cursor
+        return super().create_cursor(address)
+
+    @property
+    def asm_cursors(self):
+        return LazyCursorSequence(self._asm_cursors, self._code_regions)
+
+    @property
+    def has_code_index(self) -> bool:
+        # The code index only covers decoded code
+        return False
+
+    @classmethod
+    def load_elf(cls, path: Path, arch: str, mode: int, **kwargs):
+        offset, ops = read_elf_code(path)
+        program = cls(arch, mode, **kwargs)
+        program.add_lazy_code(offset, ops)
+        program.add_mapped_data(map_elf_data(path))
+        program.add_symbols(read_elf_symbols(path))
+        return program
+
+    @classmethod
+    def load_arm_elf(cls, path: Path, **kwargs):
+        return cls.load_elf(path, 'arm', 32, **kwargs)
+
+    @classmethod
+    def load_binary(cls, path: Path, arch, mode, offset=0, size=None, **kwargs):
+        program = cls(arch, mode, **kwargs)
+        program.add_lazy_code(offset, read_binary_code(path, offset, size))
+        program.add_mapped_data(map_binary_data(path, offset, size))
+        return program
+
+    @classmethod
+    def load_arm_binary(cls, path: Path, offset=0, size=None, **kwargs):
+        return cls.load_binary(path, 'arm', 32, offset, size, **kwargs)
+
+
 def read_elf_text_section(binary: IO[bytes], size: int = None) -> Tuple[int, bytes]:
     """
     Read a requested number of bytes from the text section of a given elf file.
@@ -112,13 +242,34 @@ def is_elf_file(binary_file: IO[bytes]):
     return is_elf
 
 
+def create_disassembler(arch, mode, detail=False) -> Cs:
+    cs_arch = CAPSTONE_ARCH[arch]
+    cs_mode = translate_mode(arch, mode)
+    cs = Cs(cs_arch, cs_mode)
+    cs.detail = detail
+    return cs
+
+
+def iter_disassembly(cs: Cs, ops: bytes, offset: int):
+    """
+    Disassemble all the given opcodes, skipping over words that capstone fails to decode.
+
+    Unlike a plain `cs.disasm`, this does not stop at the first undecodable word (e.g. a literal pool).
+    """
+    pos = 0
+    while pos < len(ops):
+        for inst in cs.disasm(ops[pos:], offset + pos):
+            yield inst
+            pos = inst.address - offset + inst.size
+        else:
+            pos += ARM_INSTRUCTION_SIZE
+
+
 def perform_disassembly(offset, ops, arch, mode):
     if not ops:
         raise ValueError("Nothing to disassemble")
 
-    cs_arch = CAPSTONE_ARCH[arch]
-    cs_mode = translate_mode(arch, mode)
-    cs = Cs(cs_arch, cs_mode)
+    cs = create_disassembler(arch, mode)
     instructions = cs.disasm(ops, offset)
 
     if not instructions:
@@ -127,11 +278,203 @@ def perform_disassembly(offset, ops, arch, mode):
     return '\n'.join(f'0x{inst.address:x}: {inst.mnemonic} {inst.op_str}' for inst in instructions)
 
 
-def disassemble_elf(path: Path, arch: str, mode: int):
+def perform_decoding(offset, ops, arch, mode) -> Block:
+    """
+    Disassemble the given opcodes, building the instructions directly from capstone's operand details.
+
+    Unlike :func:`perform_disassembly`, the result does not need to be re-parsed by an :class:`ArmCodeLoader`.
+    """
+    if not ops:
+        raise ValueError("Nothing to disassemble")
+
+    cs = create_disassembler(arch, mode, detail=True)
+    block = decode_instructions(cs.disasm(ops, offset))
+
+    if not block.lines:
+        raise ValueError('Disassembly was empty!')
+
+    return block
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the garbage collector while building (or unpickling) lots of small objects that never form cycles.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _decode_chunk(offset, ops, arch, mode) -> Tuple[List[Line], bool]:
+    """
+    Decode a single chunk in a worker process.
+
+    :returns: The decoded lines, and whether the whole chunk was decoded (capstone stops at the first invalid word).
+    """
+    cs = create_disassembler(arch, mode, detail=True)
+    lines = []
+    end = offset
+    with _gc_paused():
+        for inst in cs.disasm(ops, offset):
+            lines.append(decode_line(inst))
+            end = inst.address + inst.size
+    return lines, end == offset + len(ops)
+
+
+def perform_parallel_decoding(
+        offset,
+        ops,
+        arch,
+        mode,
+        workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE) -> Block:
+    """
+    Same as :func:`perform_decoding`, but splits the opcodes into aligned chunks decoded by a pool of processes.
+
+    The chunks are stitched back in order into a single block, so the program built from it has one cursor chain.
+    Just like the serial decoding, the result ends at the first word that capstone fails to decode.
+
+    :param workers: The number of worker processes, defaults to the number of CPUs.
+    :param chunk_size: The size of each chunk, must be a multiple of the instruction size.
+    """
+    if not ops:
+        raise ValueError("Nothing to disassemble")
+    if chunk_size <= 0 or chunk_size % ARM_INSTRUCTION_SIZE:
+        raise ValueError(f'Chunk size must be a positive multiple of {ARM_INSTRUCTION_SIZE}')
+
+    starts = range(0, len(ops), chunk_size)
+    lines = []
+    with _gc_paused(), ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_decode_chunk, offset + start, ops[start:start + chunk_size], arch, mode)
+                   for start in starts]
+        for future in futures:
+            chunk_lines, complete = future.result()
+            lines.extend(chunk_lines)
+            if not complete:
+                break
+        # Skip the chunks after the first incomplete one that haven't started yet
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+    if not lines:
+        raise ValueError('Disassembly was empty!')
+
+    return Block(lines)
+
+
+def _decode(offset, ops, arch, mode, workers: Optional[int]) -> Block:
+    if workers is None:
+        return perform_decoding(offset, ops, arch, mode)
+    return perform_parallel_decoding(offset, ops, arch, mode, workers)
+
+
+def read_elf_code(path: Path) -> Tuple[int, bytes]:
     with path.open('rb') as bf:
         # TODO: In case of an elf maybe perform relocations and resolve symbols...
         assert is_elf_file(bf), f'File starts with {bf.read(0x10)!r}'
-        offset, ops = read_elf_text_section(bf)
+        return read_elf_text_section(bf)
+
+
+def _map_file(path: Path) -> memoryview:
+    with path.open('rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return memoryview(b'')
+        # The mapping outlives the file, and is unmapped once no views of it remain
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def map_elf_data(path: Path) -> List[Tuple[int, memoryview]]:
+    """
+    Map the loadable segments of an elf file (or its allocated sections, if it has no segments, as relocatable
+    objects) into memory, rather than reading them. Pages of the file are only read once accessed, and are shared
+    with any other process mapping it.
+
+    Only the contents of the segments in the file are mapped, not the zeros filling them up to their size in memory
+    (e.g. of .bss). The sections of relocatable objects are not placed yet (all of them are at 0), so sections
+    overlapping a previous one are skipped, leaving the first (usually .text).
+
+    :returns: The address of each segment, and a read-only view of its contents.
+    """
+    with path.open('rb') as bf:
+        elf = ELFFile(bf)
+        ranges = [(segment['p_vaddr'], segment['p_offset'], segment['p_filesz'])
+                  for segment in elf.iter_segments() if segment['p_type'] == 'PT_LOAD' and segment['p_filesz']]
+        if not ranges:
+            ranges = _disjoint_ranges([(section['sh_addr'], section['sh_offset'], section['sh_size'])
+                                       for section in elf.iter_sections()
+                                       if section['sh_flags'] & SH_FLAGS.SHF_ALLOC and
+                                       section['sh_type'] != 'SHT_NOBITS' and section['sh_size']])
+
+    data = _map_file(path)
+    return [(address, data[offset:offset + size]) for address, offset, size in ranges]
+
+
+def _disjoint_ranges(ranges: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """
+    The (address, offset, size) ranges that do not overlap any range before them.
+    """
+    disjoint = []
+    for address, offset, size in ranges:
+        if all(address + size <= other or other + other_size <= address for other, _offset, other_size in disjoint):
+            disjoint.append((address, offset, size))
+    return disjoint
+
+
+# Symbol types naming locations in the program, rather than e.g. source files and sections
+ELF_SYMBOL_TYPES = {'STT_FUNC', 'STT_OBJECT', 'STT_NOTYPE'}
+
+
+def read_elf_symbols(path: Path) -> List[Symbol]:
+    """
+    Read the symbols defined by an elf file, of its .symtab (if not stripped) and then of its .dynsym.
+
+    ARM mapping symbols (e.g. `$a` and `$d`) are skipped, and the addresses of thumb functions are those of their
+    first instruction (without the thumb bit).
+    """
+    symbols = []
+    with path.open('rb') as bf:
+        elf = ELFFile(bf)
+        for table_name in ['.symtab', '.dynsym']:
+            table = elf.get_section_by_name(table_name)
+            if table is None:
+                continue
+            for symbol in table.iter_symbols():
+                if (not symbol.name or symbol.name.startswith('$') or symbol['st_shndx'] == 'SHN_UNDEF' or
+                        symbol['st_info']['type'] not in ELF_SYMBOL_TYPES):
+                    continue
+                address = symbol['st_value']
+                if symbol['st_info']['type'] == 'STT_FUNC':
+                    address &= ~1
+                symbols.append(Symbol(symbol.name, address, symbol['st_size']))
+    return symbols
+
+
+def map_binary_data(binary_path: Path, offset: int = 0, size: Optional[int] = None) -> List[Tuple[int, memoryview]]:
+    """
+    Map (a range of) a raw binary into memory, at its offset in the file (as it is decoded, see `decode_binary`).
+
+    :returns: The address and a read-only view of the range, if not empty.
+    """
+    data = _map_file(binary_path)[offset:]
+    if size is not None:
+        data = data[:size]
+    return [(offset, data)] if len(data) else []
+
+
+def read_binary_code(binary_path: Path, offset: int = 0, size: Optional[int] = None) -> bytes:
+    with binary_path.open('rb') as bf:
+        bf.seek(offset)
+        return bf.read(size)
+
+
+def disassemble_elf(path: Path, arch: str, mode: int) -> str:
+    offset, ops = read_elf_code(path)
     return perform_disassembly(offset, ops, arch, mode)
 
 
@@ -141,7 +484,51 @@ def disassemble_binary(
         mode: int,
         offset: int = 0,
         size: Optional[int] = None) -> str:
-    with binary_path.open('rb') as bf:
-        bf.seek(offset)
-        ops = bf.read(size)
+    ops = read_binary_code(binary_path, offset, size)
     return perform_disassembly(offset, ops, arch, mode)
+
+
+def decode_cached(path: Path, arch: str, mode: int, cache: DisassemblyCache, decode: Callable[[], Block]) -> Block:
+    """
+    Load the decoded program of the given file from the cache, or decode it and store it in the cache.
+    """
+    key = cache.key(path, arch, mode)
+    with _gc_paused():
+        block = cache.load(key)
+    if block is None:
+        block = decode()
+        cache.store(key, block)
+    return block
+
+
+def decode_elf(
+        path: Path,
+        arch: str,
+        mode: int,
+        workers: Optional[int] = None,
+        cache: Optional[DisassemblyCache] = None) -> Block:
+    """
+    :param workers: If given, decode in parallel using that many worker processes.
+    :param cache: If given, reuse the result of previous runs on the same file.
+    """
+    def decode():
+        offset, ops = read_elf_code(path)
+        return _decode(offset, ops, arch, mode, workers)
+
+    if cache is None:
+        return decode()
+    return decode_cached(path, arch, mode, cache, decode)
+
+
+def decode_binary(
+        binary_path: Path,
+        arch: str,
+        mode: int,
+        offset: int = 0,
+        size: Optional[int] = None,
+        workers: Optional[int] = None) -> Block:
+    """
+    :param workers: If given, decode in parallel using that many worker processes.
+    """
+    ops = read_binary_code(binary_path, offset, size)
+    return _decode(offset, ops, arch, mode, workers)
@@ -0,0 +1,226 @@
+from typing import Iterable
+
+from capstone import CsInsn
+from capstone import arm as cs_arm
+
+from parm.api.parsing.arm_asm import REG_INDEX, Instruction, Line, Block, Address, Reg, ShiftedReg, Immediate
+from parm.api.parsing.arm_asm import RegList, MemMulti, MemAccessOffset, MemAccessPreIndexed, MemAccessPostIndexed
+
+# Instructions whose last operand is a flexible second operand (shifted register or immediate)
+FLEXIBLE_OPERAND_INSNS = frozenset([
+    cs_arm.ARM_INS_MOV, cs_arm.ARM_INS_MVN,
+    cs_arm.ARM_INS_ADD, cs_arm.ARM_INS_SUB, cs_arm.ARM_INS_RSB,
+    cs_arm.ARM_INS_ADC, cs_arm.ARM_INS_SBC, cs_arm.ARM_INS_RSC,
+    cs_arm.ARM_INS_AND, cs_arm.ARM_INS_ORR, cs_arm.ARM_INS_EOR, cs_arm.ARM_INS_BIC,
+    cs_arm.ARM_INS_CMP, cs_arm.ARM_INS_CMN, cs_arm.ARM_INS_TST, cs_arm.ARM_INS_TEQ,
+])
+
+SHIFT_INSNS = frozenset([
+    cs_arm.ARM_INS_LSL, cs_arm.ARM_INS_LSR, cs_arm.ARM_INS_ASR, cs_arm.ARM_INS_ROR, cs_arm.ARM_INS_RRX,
+])
+
+BRANCH_REL_INSNS = frozenset([
+    cs_arm.ARM_INS_B, cs_arm.ARM_INS_BL, cs_arm.ARM_INS_BLX,
+])
+
+STACK_MEM_MULTI_INSNS = frozenset([
+    cs_arm.ARM_INS_PUSH, cs_arm.ARM_INS_POP,
+])
+
+MEM_MULTI_INSNS = frozenset([
+    cs_arm.ARM_INS_LDM, cs_arm.ARM_INS_LDMDA, cs_arm.ARM_INS_LDMDB, cs_arm.ARM_INS_LDMIB,
+    cs_arm.ARM_INS_STM, cs_arm.ARM_INS_STMDA, cs_arm.ARM_INS_STMDB, cs_arm.ARM_INS_STMIB,
+])
+
+SHIFT_NAMES = {
+    cs_arm.ARM_SFT_ASR: 'asr',
+    cs_arm.ARM_SFT_LSL: 'lsl',
+    cs_arm.ARM_SFT_LSR: 'lsr',
+    cs_arm.ARM_SFT_ROR: 'ror',
+    cs_arm.ARM_SFT_RRX: 'rrx',
+    cs_arm.ARM_SFT_ASR_REG: 'asr',
+    cs_arm.ARM_SFT_LSL_REG: 'lsl',
+    cs_arm.ARM_SFT_LSR_REG: 'lsr',
+    cs_arm.ARM_SFT_ROR_REG: 'ror',
+    cs_arm.ARM_SFT_RRX_REG: 'rrx',
+}
+
+REG_SHIFTS = frozenset([
+    cs_arm.ARM_SFT_ASR_REG, cs_arm.ARM_SFT_LSL_REG, cs_arm.ARM_SFT_LSR_REG,
+    cs_arm.ARM_SFT_ROR_REG, cs_arm.ARM_SFT_RRX_REG,
+])
+
+# Capstone names r10 "sl", which parm does not treat as a synonym
+CAPSTONE_REG_NAMES = {
+    'sl': 'r10',
+}
+
+
+class UnsupportedOperand(Exception):
+    pass
+
+
+def _u32(value):
+    return value & 0xFFFFFFFF
+
+
+def _decode_reg(inst: CsInsn, reg_id):
+    """
+    Translate a capstone register id into a parm register.
+
+    Registers that parm does not model (VFP, NEON, coprocessor and status registers) are returned
+    as their plain capstone names.
+    """
+    name = inst.reg_name(reg_id)
+    name = CAPSTONE_REG_NAMES.get(name, name)
+    if name in REG_INDEX:
+        return Reg(name)
+    return name
+
+
+def _decode_shift(inst: CsInsn, op):
+    shift_type = op.shift.type
+    if shift_type == cs_arm.ARM_SFT_INVALID:
+        return None
+    name = SHIFT_NAMES[shift_type]
+    if shift_type in (cs_arm.ARM_SFT_RRX, cs_arm.ARM_SFT_RRX_REG):
+        return name
+    if shift_type in REG_SHIFTS:
+        return f'{name} {inst.reg_name(op.shift.value)}'
+    return f'{name} #{op.shift.value}'
+
+
+def _decode_shifted_reg(inst: CsInsn, op, reg_id):
+    if op.subtracted:
+        raise UnsupportedOperand(op)
+    reg = _decode_reg(inst, reg_id)
+    if not isinstance(reg, Reg):
+        raise UnsupportedOperand(op)
+    return ShiftedReg(reg, _decode_shift(inst, op))
+
+
+def _decode_flexible_operand(inst: CsInsn, op):
+    if op.type == cs_arm.ARM_OP_REG:
+        return _decode_shifted_reg(inst, op, op.reg)
+    return _decode_operand(inst, op)
+
+
+def _decode_operand(inst: CsInsn, op):
+    if op.type == cs_arm.ARM_OP_REG:
+        if op.shift.type != cs_arm.ARM_SFT_INVALID:
+            return _decode_shifted_reg(inst, op, op.reg)
+        return _decode_reg(inst, op.reg)
+    if op.type == cs_arm.ARM_OP_IMM:
+        if op.subtracted:
+            return Immediate(-op.imm)
+        return Immediate(_u32(op.imm))
+    if op.type == cs_arm.ARM_OP_FP:
+        return Immediate(op.fp)
+    raise UnsupportedOperand(op)
+
+
+def _decode_mem_operand(inst: CsInsn, op, post_offset=None):
+    mem = op.mem
+    base = _decode_reg(inst, mem.base)
+    if not isinstance(base, Reg):
+        raise UnsupportedOperand(op)
+
+    if post_offset is not None:
+        return MemAccessPostIndexed(base, _decode_flexible_operand(inst, post_offset))
+
+    if mem.index != 0:
+        offset = _decode_shifted_reg(inst, op, mem.index)
+    elif mem.disp != 0:
+        offset = Immediate(mem.disp)
+    else:
+        offset = None
+
+    if inst.writeback:
+        return MemAccessPreIndexed(base, offset)
+    return MemAccessOffset(base, offset)
+
+
+def _mem_is_unindexed(op):
+    return op.mem.index == 0 and op.mem.disp == 0
+
+
+def _decode_generic_operands(inst: CsInsn, ops):
+    result = []
+    i = 0
+    while i < len(ops):
+        op = ops[i]
+        if op.type == cs_arm.ARM_OP_MEM:
+            # A post-indexed access is followed by a separate offset operand.
+            # Capstone does not always report the writeback of post-indexed accesses, so it is not checked here.
+            post_offset = None
+            if i + 1 < len(ops) and _mem_is_unindexed(op):
+                post_offset = ops[i + 1]
+                i += 1
+            result.append(_decode_mem_operand(inst, op, post_offset))
+        else:
+            result.append(_decode_operand(inst, op))
+        i += 1
+    return result
+
+
+def _decode_reg_list(inst: CsInsn, ops):
+    regs = [_decode_reg(inst, op.reg) for op in ops]
+    if not all(isinstance(r, Reg) for r in regs):
+        raise UnsupportedOperand(ops)
+    return MemMulti(RegList(regs))
+
+
+def _decode_operands(inst: CsInsn):
+    ops = inst.operands
+    insn_id = inst.id
+
+    if insn_id in STACK_MEM_MULTI_INSNS:
+        return [_decode_reg_list(inst, ops)]
+
+    if insn_id in MEM_MULTI_INSNS:
+        base, regs = ops[0], ops[1:]
+        return [_decode_reg(inst, base.reg), _decode_reg_list(inst, regs)]
+
+    if insn_id in BRANCH_REL_INSNS and len(ops) == 1 and ops[0].type == cs_arm.ARM_OP_IMM:
+        return [Address(_u32(ops[0].imm))]
+
+    if insn_id in SHIFT_INSNS:
+        if len(ops) == 2 and ops[1].type == cs_arm.ARM_OP_REG and ops[1].shift.type != cs_arm.ARM_SFT_INVALID:
+            rd, rm = ops
+            shift = rm.shift
+            result = [_decode_reg(inst, rd.reg), _decode_reg(inst, rm.reg)]
+            if shift.type in (cs_arm.ARM_SFT_RRX, cs_arm.ARM_SFT_RRX_REG):
+                return result
+            if shift.type in REG_SHIFTS:
+                return result + [_decode_reg(inst, shift.value)]
+            return result + [Immediate(shift.value)]
+        return _decode_generic_operands(inst, ops)
+
+    if insn_id in FLEXIBLE_OPERAND_INSNS and ops:
+        *head, last = ops
+        return _decode_generic_operands(inst, head) + [_decode_flexible_operand(inst, last)]
+
+    return _decode_generic_operands(inst, ops)
+
+
+def decode_instruction(inst: CsInsn) -> Instruction:
+    """
+    Build an instruction directly from the operand details of a capstone instruction.
+
+    The capstone instruction must have been disassembled in detail mode.
+    Operands that parm does not model (e.g. coprocessor operands, or subtracted index registers)
+    cause the operands to be kept as the raw capstone operand string.
+    """
+    try:
+        operands = _decode_operands(inst)
+    except UnsupportedOperand:
+        operands = [inst.op_str]
+    return Instruction(inst.mnemonic, operands)
+
+
+def decode_line(inst: CsInsn) -> Line:
+    return Line(decode_instruction(inst), Address(inst.address))
+
+
+def decode_instructions(instructions: Iterable[CsInsn]) -> Block:
+    return Block([decode_line(inst) for inst in instructions])
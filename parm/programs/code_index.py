@@ -0,0 +1,345 @@
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from math import ceil
+from typing import Callable, FrozenSet, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from parm.api.parsing.arm_asm import Address, Immediate, MemAccessOffset, REG_INDEX
+from parm.api.pattern import AnchorLine
+from parm.programs.code_store import CodeStore, NO_ADDRESS, NO_OPCODE
+
+# In ARM state, reading PC gives the address of the current instruction plus 8
+PC_READ_OFFSET = 8
+PC_INDEX = REG_INDEX['pc']
+
+
+class RunPlan(NamedTuple):
+    """
+    How the cursors matching a run of anchor lines are searched for.
+    """
+    # The line whose postings are searched, all other lines being checked for each of them
+    line: AnchorLine
+    # Which postings of the line are searched: 'opcodes', 'immediate', 'address' (or 'none', if no instruction can
+    # satisfy the run)
+    postings: str
+    # The number of instructions in the postings
+    estimate: int
+
+
+class _LineTest(NamedTuple):
+    """
+    An `AnchorLine`, resolved against the opcodes and operands of a store.
+    """
+    offset: int
+    opcode_ids: Optional[FrozenSet[int]]
+    immediate_ids: Tuple[int, ...]
+    address_ids: Tuple[Optional[int], ...]
+
+
+def _literal_address(operand, address) -> Optional[int]:
+    if not isinstance(operand, MemAccessOffset) or operand.reg.index != PC_INDEX or address == NO_ADDRESS:
+        return None
+    offset = operand.offset
+    if offset is None:
+        return address + PC_READ_OFFSET
+    if isinstance(offset, Immediate) and isinstance(offset.value, int):
+        return address + PC_READ_OFFSET + offset.value
+    return None
+
+
+class CodeIndex:
+    """
+    Inverted indexes over the instructions of a `CodeStore`, from their opcodes, their operands and the addresses
+    they reference (branch targets and PC-relative literals) to their (ascending) indices.
+
+    The indexes are built on first use, and extended with the instructions added to the store since. Building them
+    is thread-safe, though adding instructions while other threads search isn't (see `Program.freeze`).
+    """
+
+    def __init__(self, store: CodeStore):
+        self._store = store
+        self._indexed = 0
+
+        # Per opcode id and per operand id
+        self._opcode_postings = []  # type: List[array]
+        self._operand_postings = []  # type: List[array]
+        # Per opcode id, the instructions having operands other than addresses, which address patterns accept
+        self._non_address_postings = []  # type: List[array]
+        self._reference_postings = {}
+        self._merged_postings = {}
+        self._lock = threading.Lock()
+
+    def update(self):
+        if self._indexed == len(self._store):
+            return
+        with self._lock:
+            self._update()
+
+    def _update(self):
+        store = self._store
+        if self._indexed == len(store):
+            return
+
+        for postings, count in [
+                (self._opcode_postings, len(store.opcodes)),
+                (self._non_address_postings, len(store.opcodes)),
+                (self._operand_postings, len(store.operands))]:
+            while len(postings) < count:
+                postings.append(array('I'))
+
+        opcode_ids = store.opcode_ids
+        for index in range(self._indexed, len(store)):
+            opcode_id = opcode_ids[index]
+            if opcode_id == NO_OPCODE:
+                continue
+            self._opcode_postings[opcode_id].append(index)
+            if self._index_operands(index):
+                self._non_address_postings[opcode_id].append(index)
+
+        self._indexed = len(store)
+        self._merged_postings.clear()
+
+    def _index_operands(self, index) -> bool:
+        """
+        Add an instruction to the postings of its operands and of the addresses it references.
+
+        :returns: Whether the instruction has operands other than addresses.
+        """
+        store = self._store
+        references = set()
+        non_address = False
+        for operand_id in set(store.operand_ids[store.operand_starts[index]:store.operand_starts[index + 1]]):
+            self._operand_postings[operand_id].append(index)
+            operand = store.operands[operand_id]
+            if isinstance(operand, Address):
+                references.add(operand.address)
+                continue
+            non_address = True
+            literal = _literal_address(operand, store.addresses[index])
+            if literal is not None:
+                references.add(literal)
+
+        for address in references:
+            self._reference_postings.setdefault(address, array('I')).append(index)
+        return non_address
+
+    def _matching_opcode_ids(self, matches: Callable[[str], bool]):
+        return tuple(i for i, opcode in enumerate(self._store.opcodes) if matches(opcode.lower()))
+
+    def _merge(self, key, postings: Sequence[array]) -> Sequence[int]:
+        if len(postings) == 1:
+            return postings[0]
+        try:
+            return self._merged_postings[key]
+        except KeyError:
+            merged = array('I', sorted(set(chain.from_iterable(postings))))
+            with self._lock:
+                return self._merged_postings.setdefault(key, merged)
+
+    def _opcodes_postings(self, opcode_ids) -> Sequence[int]:
+        return self._merge(('opcodes', opcode_ids), [self._opcode_postings[i] for i in opcode_ids])
+
+    def opcode_postings(self, matches: Callable[[str], bool]) -> Sequence[int]:
+        """
+        :param matches: A test of lower case opcodes, e.g. of a wildcard such as `ldr*`.
+        :returns: The indices of the instructions whose opcode passes the test.
+        """
+        self.update()
+        # A copy, as postings keep growing when instructions are added
+        return self._opcodes_postings(self._matching_opcode_ids(matches))[:]
+
+    def operand_postings(self, operand) -> Sequence[int]:
+        """
+        :returns: The indices of the instructions having the operand (e.g. an `Immediate`).
+        """
+        self.update()
+        operand_id = self._store.operand_id(operand)
+        if operand_id is None:
+            return array('I')
+        return self._operand_postings[operand_id][:]
+
+    def reference_postings(self, address: int) -> Sequence[int]:
+        """
+        :returns: The indices of the instructions referencing the address, as an address operand (e.g. a branch
+            target) or as a PC-relative literal.
+        """
+        self.update()
+        return self._reference_postings.get(address, array('I'))[:]
+
+    def _resolve(self, line: AnchorLine) -> Optional[_LineTest]:
+        """
+        :returns: The test of the line, or None if no instruction satisfies it.
+        """
+        store = self._store
+        opcode_ids = None
+        if line.opcode_test is not None:
+            opcode_ids = frozenset(self._matching_opcode_ids(line.opcode_test))
+
+        immediate_ids = tuple(store.operand_id(Immediate(value)) for value in line.immediates)
+        if None in immediate_ids:
+            return None
+        address_ids = tuple(store.operand_id(Address(address)) for address in line.addresses)
+        return _LineTest(line.offset, opcode_ids, immediate_ids, address_ids)
+
+    def _drivers(self, test: _LineTest) -> Iterator[Tuple[int, str, Callable[[], Sequence[int]]]]:
+        """
+        Yield the sizes and kinds of posting lists including every instruction that satisfies the test, with their
+        builders.
+        """
+        if test.opcode_ids is not None:
+            matching = tuple(sorted(test.opcode_ids))
+            yield (sum(len(self._opcode_postings[i]) for i in matching), 'opcodes',
+                   lambda: self._opcodes_postings(matching))
+
+        for operand_id in test.immediate_ids:
+            postings = self._operand_postings[operand_id]
+            yield len(postings), 'immediate', lambda p=postings: p
+
+        opcode_ids = range(len(self._store.opcodes)) if test.opcode_ids is None else sorted(test.opcode_ids)
+        non_address = [self._non_address_postings[i] for i in opcode_ids]
+        for address_id in test.address_ids:
+            postings = non_address if address_id is None else non_address + [self._operand_postings[address_id]]
+            key = ('addresses', address_id, tuple(opcode_ids))
+            yield sum(len(p) for p in postings), 'address', lambda k=key, p=postings: self._merge(k, p)
+
+    def _satisfies(self, test: _LineTest, index) -> bool:
+        store = self._store
+        if test.opcode_ids is not None and store.opcode_ids[index] not in test.opcode_ids:
+            return False
+        if not test.immediate_ids and not test.address_ids:
+            return True
+
+        operand_ids = store.operand_ids[store.operand_starts[index]:store.operand_starts[index + 1]]
+        if any(operand_id not in operand_ids for operand_id in test.immediate_ids):
+            return False
+        for address_id in test.address_ids:
+            if address_id not in operand_ids and all(isinstance(store.operands[i], Address) for i in operand_ids):
+                return False
+        return True
+
+    def _satisfying(self, test: _LineTest) -> Sequence[int]:
+        """
+        :returns: The indices of the instructions satisfying the test.
+        """
+        _, _, build = min(self._drivers(test), key=lambda driver: driver[0])
+        postings = build()
+        if not test.immediate_ids and not test.address_ids:
+            return postings
+        return array('I', (index for index in postings if self._satisfies(test, index)))
+
+    def plan(self, run: Sequence[AnchorLine]) -> Optional[RunPlan]:
+        """
+        Choose the most selective line of the run to search by, as given by the number of instructions having its
+        opcodes or operands (which are the sizes of their posting lists).
+
+        :returns: The plan, or None if no line of the run is at a fixed offset.
+        """
+        self.update()
+        tests = [self._resolve(line) for line in run]
+        fixed = [(line, test) for line, test in zip(run, tests) if line.window == 0]
+        if not fixed:
+            return None
+        if None in tests:
+            return RunPlan(fixed[0][0], 'none', 0)
+
+        line, (estimate, kind, _) = min(
+            ((line, driver) for line, test in fixed for driver in self._drivers(test)), key=lambda d: d[1][0])
+        return RunPlan(line, kind, estimate)
+
+    def estimate(self, run: Sequence[AnchorLine], plan: RunPlan) -> int:
+        """
+        Estimate the number of cursors satisfying the run: the instructions in the postings of the plan, in the
+        proportion of instructions satisfying each other line at a fixed offset (as if the lines were independent).
+        Lines past skips are not accounted for.
+        """
+        total = sum(len(postings) for postings in self._opcode_postings)
+        estimate = plan.estimate
+        for line in run:
+            if estimate == 0:
+                break
+            if line is plan.line or line.window != 0:
+                continue
+            test = self._resolve(line)
+            if test is None:
+                return 0
+            estimate *= min(size for size, _, _ in self._drivers(test)) / total
+        return ceil(estimate)
+
+    def run_postings(self, run: Sequence[AnchorLine]) -> Sequence[int]:
+        """
+        Find the cursors around which the instructions satisfy the run (as k-grams, possibly with gaps), e.g. of the
+        instructions a pattern starts with.
+
+        The smallest posting list of an opcode or operand of a line at a fixed offset (see `plan`) is intersected with
+        the (shifted) other lines of the run. Other lines at fixed offsets are looked up in the columns of the store,
+        and lines past skips are looked up in their postings, within their window.
+
+        :returns: The indices of the cursors, having the whole run within their block.
+        """
+        plan = self.plan(run)
+        assert plan is not None
+        tests = [self._resolve(line) for line in run]
+        if None in tests:
+            return array('I')
+
+        fixed = [test for line, test in zip(run, tests) if line.window == 0]
+        driver_test = next(test for line, test in zip(run, tests) if line is plan.line)
+        _, _, build = min(self._drivers(driver_test), key=lambda driver: driver[0])
+        driver = build()
+        if len(tests) == 1 and driver_test.offset == 0 and plan.postings == 'opcodes' and \
+                not driver_test.immediate_ids and not driver_test.address_ids:
+            return driver[:]
+
+        windowed = [(line, self._satisfying(test)) for line, test in zip(run, tests) if line.window != 0]
+        windowed.sort(key=lambda w: len(w[1]))
+        first_offset = min(test.offset for test in fixed)
+        last_offset = max(test.offset for test in fixed)
+
+        store = self._store
+        result = array('I')
+        block_start = block_end = 0
+        for index in driver:
+            if not block_start <= index < block_end:
+                block = store.block_of(index)
+                block_start, block_end = store.block_start(block), store.block_end(block)
+            start = index - driver_test.offset
+            if start + first_offset < block_start or start + last_offset >= block_end:
+                continue
+            if not all(self._satisfies(test, start + test.offset) for test in fixed):
+                continue
+            if all(_any_within(postings, *_window_range(line, start, block_start, block_end))
+                   for line, postings in windowed):
+                result.append(start)
+        return result
+
+
+def describe_check(line: AnchorLine) -> str:
+    """
+    Describe how `run_postings` checks a line other than the one of the plan.
+    """
+    if line.window == 0:
+        return f'`{line.source}` at offset {line.offset}, in the columns of the store'
+    direction = 'after' if line.offset >= 0 else 'before'
+    if line.window is None:
+        within = f'up to the block edge {direction} offset {line.offset}'
+    else:
+        within = f'within {line.window} instructions {direction} offset {line.offset}'
+    return f'`{line.source}` {within}, in its postings'
+
+
+def _window_range(line: AnchorLine, start, block_start, block_end) -> Tuple[int, int]:
+    """
+    :returns: The range of indices the line may be at, for the cursor at the start index.
+    """
+    position = start + line.offset
+    if line.offset >= 0:
+        end = block_end if line.window is None else min(position + line.window + 1, block_end)
+        return position, end
+    first = block_start if line.window is None else max(position - line.window, block_start)
+    return first, position + 1
+
+
+def _any_within(postings: Sequence[int], first, end) -> bool:
+    ix = bisect_left(postings, first)
+    return ix < len(postings) and postings[ix] < end
@@ -0,0 +1,227 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from parm.api.parsing.arm_asm import Instruction, Address, Line
+
+NO_ADDRESS = 0xFFFFFFFF
+NO_OPCODE = 0xFFFF
+
+
+class CodeStore:
+    """
+    Columnar storage of the instructions of a program.
+
+    Rather than keeping an object graph per instruction, the store keeps:
+        * The addresses of all instructions in an array.
+        * An array of opcode ids, indexing a table of interned opcodes.
+        * A pool of unique operands, and an array of operand ids per instruction.
+
+    Instructions are grouped into blocks, each being a separate chain of cursors (as added by `add_code_block`).
+    """
+
+    def __init__(self):
+        self.addresses = array('I')
+        self.opcode_ids = array('H')
+        self.operand_starts = array('I', [0])
+        self.operand_ids = array('I')
+
+        self.opcodes = []  # type: List[str]
+        self._opcode_index = {}
+        self.operands = []
+        self._operand_index = {}
+
+        self.block_starts = array('I')
+        self.terminals = []  # type: List[Optional[Address]]
+
+        # Blocks with ascending addresses are searched by bisection, others through a dict
+        self._range_starts = []
+        self._range_blocks = []
+        self._address_index = {}
+
+    @classmethod
+    def from_columns(cls, addresses, opcode_ids, operand_starts, operand_ids, opcodes, operands, block_starts,
+                     terminals):
+        """
+        Create a store of existing columns (e.g. read-only views of shared memory), which mustn't be extended.
+        """
+        store = cls()
+        store.addresses = addresses
+        store.opcode_ids = opcode_ids
+        store.operand_starts = operand_starts
+        store.operand_ids = operand_ids
+        store.opcodes = opcodes
+        store._opcode_index = {opcode: i for i, opcode in enumerate(opcodes)}
+        store.operands = operands
+        store._operand_index = {operand: i for i, operand in enumerate(operands)}
+        store.block_starts = block_starts
+        store.terminals = terminals
+        for block in range(store.block_count):
+            start = store.block_start(block)
+            store._index_block(block, start, addresses[start:store.block_end(block)])
+        return store
+
+    def __len__(self):
+        return len(self.addresses)
+
+    @property
+    def block_count(self):
+        return len(self.block_starts)
+
+    def block_start(self, block):
+        return self.block_starts[block]
+
+    def block_end(self, block):
+        if block + 1 < len(self.block_starts):
+            return self.block_starts[block + 1]
+        return len(self.addresses)
+
+    def block_of(self, index):
+        return bisect_right(self.block_starts, index) - 1
+
+    def _intern_opcode(self, opcode):
+        try:
+            return self._opcode_index[opcode]
+        except KeyError:
+            opcode_id = len(self.opcodes)
+            assert opcode_id < NO_OPCODE
+            self.opcodes.append(opcode)
+            self._opcode_index[opcode] = opcode_id
+            return opcode_id
+
+    def _intern_operand(self, operand):
+        try:
+            return self._operand_index[operand]
+        except KeyError:
+            operand_id = len(self.operands)
+            self.operands.append(operand)
+            self._operand_index[operand] = operand_id
+            return operand_id
+
+    def add_block(self, lines: List[Line], terminal: Optional[Address] = None) -> int:
+        """
+        Append the given lines as a new block.
+
+        :returns: The index of the first instruction of the block
+        """
+        assert lines
+        start = len(self.addresses)
+        self.block_starts.append(start)
+        self.terminals.append(terminal)
+        self.extend_block(lines)
+        return start
+
+    def extend_block(self, lines: List[Line]):
+        """
+        Append the given lines to the last block.
+        """
+        assert self.block_starts
+        start = len(self.addresses)
+        block = len(self.block_starts) - 1
+
+        addresses = []
+        for line in lines:
+            if line.address is None:
+                address = NO_ADDRESS
+            else:
+                address = line.address.address
+                assert address != NO_ADDRESS
+            addresses.append(address)
+
+            instruction = line.instruction
+            if instruction is None:
+                self.opcode_ids.append(NO_OPCODE)
+            else:
+                self.opcode_ids.append(self._intern_opcode(instruction.opcode))
+                self.operand_ids.extend(self._intern_operand(op) for op in instruction.operands)
+            self.operand_starts.append(len(self.operand_ids))
+
+        self.addresses.extend(addresses)
+        if start == self.block_starts[block]:
+            self._index_block(block, start, addresses)
+        else:
+            self._index_extension(block, start, addresses)
+
+    def set_terminal(self, terminal: Optional[Address]):
+        self.terminals[-1] = terminal
+
+    @staticmethod
+    def _is_ascending(addresses):
+        return addresses[-1] != NO_ADDRESS and all(a < b for a, b in zip(addresses, addresses[1:]))
+
+    def _index_block(self, block, start, addresses):
+        first, last = addresses[0], addresses[-1]
+        if self._is_ascending(addresses) and not self._overlaps(first, last):
+            assert not any(first <= a <= last for a in self._address_index)
+            ix = bisect_right(self._range_starts, first)
+            self._range_starts.insert(ix, first)
+            self._range_blocks.insert(ix, block)
+            return
+
+        self._index_addresses(start, addresses)
+
+    def _index_extension(self, block, start, addresses):
+        ix = bisect_left(self._range_starts, self.addresses[self.block_starts[block]])
+        if ix == len(self._range_starts) or self._range_blocks[ix] != block:
+            self._index_addresses(start, addresses)
+            return
+
+        first, last = addresses[0], addresses[-1]
+        next_start = self._range_starts[ix + 1] if ix + 1 < len(self._range_starts) else None
+        if (self._is_ascending(addresses) and self.addresses[start - 1] < first and
+                (next_start is None or last < next_start) and
+                not any(first <= a <= last for a in self._address_index)):
+            return
+
+        # The block can no longer be bisected, index it like any other unordered block
+        del self._range_starts[ix]
+        del self._range_blocks[ix]
+        block_start = self.block_starts[block]
+        self._index_addresses(block_start, self.addresses[block_start:])
+
+    def _index_addresses(self, start, addresses):
+        for i, address in enumerate(addresses, start):
+            if address == NO_ADDRESS:
+                continue
+            assert self.find(address) is None
+            self._address_index[address] = i
+
+    def _overlaps(self, first, last):
+        ix = bisect_right(self._range_starts, last) - 1
+        if ix < 0:
+            return False
+        block = self._range_blocks[ix]
+        return self.addresses[self.block_end(block) - 1] >= first
+
+    def find(self, address) -> Optional[int]:
+        """
+        :returns: The index of the instruction at the given address, if any.
+        """
+        ix = bisect_right(self._range_starts, address) - 1
+        if ix >= 0:
+            block = self._range_blocks[ix]
+            end = self.block_end(block)
+            index = bisect_left(self.addresses, address, self.block_starts[block], end)
+            if index < end and self.addresses[index] == address:
+                return index
+        return self._address_index.get(address)
+
+    def operand_id(self, operand) -> Optional[int]:
+        """
+        :returns: The id of the operand in the pool of operands, if any instruction uses it.
+        """
+        return self._operand_index.get(operand)
+
+    def address(self, index) -> Optional[Address]:
+        address = self.addresses[index]
+        if address == NO_ADDRESS:
+            return None
+        return Address(address)
+
+    def instruction(self, index) -> Optional[Instruction]:
+        opcode_id = self.opcode_ids[index]
+        if opcode_id == NO_OPCODE:
+            return None
+        operands = self.operands
+        operand_ids = self.operand_ids[self.operand_starts[index]:self.operand_starts[index + 1]]
+        return Instruction(self.opcodes[opcode_id], [operands[i] for i in operand_ids])
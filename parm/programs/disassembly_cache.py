@@ -0,0 +1,64 @@
+import pickle
+from pathlib import Path
+from typing import Optional, Union
+
+import capstone
+
+import parm
+from parm.api.parsing.arm_asm import Block
+from parm.caching import default_cache_dir, hash_file, write_atomically
+
+CACHE_FORMAT_VERSION = 3
+CACHE_SUFFIX = '.pickle'
+
+
+class DisassemblyCache:
+    """
+    An on-disk cache of decoded programs, keyed by the content hash of the binary.
+
+    Each entry records the capstone and parm versions that produced it, entries written by other
+    versions are considered stale and are removed when looked up.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path, None] = None):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def versions():
+        return CACHE_FORMAT_VERSION, capstone.__version__, parm.__version__
+
+    @staticmethod
+    def key(path: Path, arch: str, mode: int) -> str:
+        return f'{hash_file(path)}-{arch}{mode}'
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}{CACHE_SUFFIX}'
+
+    def load(self, key: str) -> Optional[Block]:
+        entry = self.entry_path(key)
+        try:
+            with entry.open('rb') as f:
+                versions = pickle.load(f)
+                if versions == self.versions():
+                    return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            pass
+
+        # Stale or corrupt
+        entry.unlink(missing_ok=True)
+        return None
+
+    def store(self, key: str, block: Block):
+        def write(f):
+            pickle.dump(self.versions(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        write_atomically(self.entry_path(key), write)
+
+    def clear(self):
+        for entry in self.cache_dir.glob(f'*{CACHE_SUFFIX}'):
+            entry.unlink(missing_ok=True)
@@ -0,0 +1,211 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from parm.api.cursor import Cursor
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_asm import Instruction, Line
+from parm.programs.snippet import PreInitCursor, PostTermCursor
+
+DEFAULT_PAGE_SIZE = 0x1000
+DEFAULT_MAX_PAGES = 256
+
+
+class PageCache:
+    """
+    A bounded, thread-safe LRU cache of decoded code pages.
+    """
+
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES):
+        assert max_pages > 0
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __contains__(self, key):
+        return key in self._pages
+
+    def get(self, key, load):
+        with self._lock:
+            try:
+                page = self._pages[key]
+            except KeyError:
+                pass
+            else:
+                self._pages.move_to_end(key)
+                return page
+
+        # Decode outside the lock, a concurrent miss on the same page decodes it twice but keeps the first result
+        page = load()
+        with self._lock:
+            page = self._pages.setdefault(key, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return page
+
+
+class LazyCursor(Cursor):
+    """
+    A cursor pointing into a lazily decoded code page.
+
+    Since evicted pages are decoded again when touched, several cursor objects may exist for the
+    same instruction, so lazy cursors compare by their address.
+    """
+
+    def __init__(self, program, page, index, line: Line):
+        super().__init__(program)
+        self.env = program.env
+        self._page = page
+        self._index = index
+        self._address = line.address
+        self._instruction = line.instruction
+
+    def __eq__(self, other):
+        if not isinstance(other, LazyCursor):
+            return False
+        return self.program is other.program and self.address_val == other.address_val
+
+    def __hash__(self):
+        return hash(self.address_val)
+
+    def __str__(self):
+        return f'LazyCursor[{self._address}: {self._instruction}]'
+
+    @property
+    def instruction(self) -> Instruction:
+        return self._instruction
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def address_val(self):
+        return self._address.address
+
+    def read_bytes(self, count) -> bytes:
+        return self.program.read_bytes(self.address_val, count)
+
+    def get_cursor_by_offset(self, offset) -> Cursor:
+        return self.program.create_cursor(self.address_val + offset)
+
+    def match(self, pattern, match_result: MatchResult, **kwargs):
+        return pattern.match(self, match_result, **kwargs)
+
+    def next(self):
+        cursors = self._page.cursors
+        ix = self._index + 1
+        if ix < len(cursors):
+            return cursors[ix]
+        return self._page.region.cursor_after(self._page.number, self)
+
+    def prev(self):
+        ix = self._index - 1
+        if ix >= 0:
+            return self._page.cursors[ix]
+        return self._page.region.cursor_before(self._page.number, self)
+
+
+class CodePage:
+    def __init__(self, region, number, lines: List[Line]):
+        self.region = region
+        self.number = number
+        self.cursors = [LazyCursor(region.program, self, i, line) for i, line in enumerate(lines)]
+        self.addresses = [c.address_val for c in self.cursors]
+
+    def find_cursor(self, address) -> Optional[LazyCursor]:
+        ix = bisect_left(self.addresses, address)
+        if ix < len(self.addresses) and self.addresses[ix] == address:
+            return self.cursors[ix]
+        return None
+
+
+class LazyCodeRegion:
+    """
+    A contiguous range of code, split into fixed-size pages that are only decoded when first touched.
+
+    :param decode_page: Called with the start and end addresses of a page, and returns its lines.
+    """
+
+    def __init__(
+            self,
+            program,
+            address: int,
+            size: int,
+            decode_page: Callable[[int, int], List[Line]],
+            page_cache: PageCache,
+            page_size=DEFAULT_PAGE_SIZE):
+        assert size > 0
+        self.program = program
+        self.start_address = address
+        self.end_address = address + size
+        self.page_size = page_size
+        self.page_count = (size + page_size - 1) // page_size
+
+        self._decode_page = decode_page
+        self._page_cache = page_cache
+
+    def __str__(self):
+        return f'[0x{self.start_address:X}-0x{self.end_address:X}]'
+
+    def contains(self, address):
+        return self.start_address <= address < self.end_address
+
+    def _load_page(self, number):
+        start = self.start_address + number * self.page_size
+        end = min(start + self.page_size, self.end_address)
+        return CodePage(self, number, self._decode_page(start, end))
+
+    def get_page(self, number) -> CodePage:
+        return self._page_cache.get((self, number), lambda: self._load_page(number))
+
+    def find_cursor(self, address) -> Optional[LazyCursor]:
+        number = (address - self.start_address) // self.page_size
+        return self.get_page(number).find_cursor(address)
+
+    def cursor_after(self, number, cursor):
+        for n in range(number + 1, self.page_count):
+            cursors = self.get_page(n).cursors
+            if cursors:
+                return cursors[0]
+        return PostTermCursor(self.program, cursor)
+
+    def cursor_before(self, number, cursor):
+        for n in reversed(range(number)):
+            cursors = self.get_page(n).cursors
+            if cursors:
+                return cursors[-1]
+        return PreInitCursor(self.program, cursor)
+
+    def __iter__(self):
+        for number in range(self.page_count):
+            yield from self.get_page(number).cursors
+
+    def __reversed__(self):
+        for number in reversed(range(self.page_count)):
+            yield from reversed(self.get_page(number).cursors)
+
+
+class LazyCursorSequence:
+    """
+    Iterates (in either direction) over eagerly created cursors, followed by those of lazy code regions.
+    """
+
+    def __init__(self, cursors, regions):
+        self._cursors = cursors
+        self._regions = regions
+
+    def __iter__(self):
+        yield from self._cursors
+        for region in self._regions:
+            yield from region
+
+    def __reversed__(self):
+        for region in reversed(self._regions):
+            yield from reversed(region)
+        yield from reversed(self._cursors)
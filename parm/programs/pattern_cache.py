@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+DEFAULT_MAX_PATTERNS = 1024
+
+
+class PatternCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
+class PatternCache:
+    """
+    A bounded, thread-safe LRU cache of compiled patterns, keyed by their text.
+
+    Patterns are not modified once built, so a compiled pattern may be shared between programs and threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_PATTERNS):
+        assert max_size > 0
+        self.max_size = max_size
+        self._patterns = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def get(self, text: str, compile_pattern: Callable[[str], object]):
+        with self._lock:
+            try:
+                pattern = self._patterns[text]
+            except KeyError:
+                self._misses += 1
+            else:
+                self._patterns.move_to_end(text)
+                self._hits += 1
+                return pattern
+
+        # Compile outside the lock, a concurrent miss on the same text compiles it twice but keeps the first result
+        pattern = compile_pattern(text)
+        with self._lock:
+            pattern = self._patterns.setdefault(text, pattern)
+            self._patterns.move_to_end(text)
+            while len(self._patterns) > self.max_size:
+                self._patterns.popitem(last=False)
+        return pattern
+
+    def stats(self) -> PatternCacheStats:
+        with self._lock:
+            return PatternCacheStats(self._hits, self._misses, len(self._patterns), self.max_size)
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self._hits = 0
+            self._misses = 0
@@ -0,0 +1,210 @@
+import os
+import pickle
+import struct
+import weakref
+from array import array
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+from parm.api.parsing.arm_asm import Address
+from parm.programs.code_store import CodeStore, NO_ADDRESS
+
+IMAGE_MAGIC = b'PARMIMG\0'
+IMAGE_FORMAT_VERSION = 1
+
+# Magic, format version, then the sizes of the sections
+_HEADER = struct.Struct('=8s7Q')
+_DATA_BLOCK = struct.Struct('=QQ')
+_ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+class _Layout:
+    """
+    The offsets of the sections of an image, following its header (each aligned to 8 bytes):
+        * The columns of the code store: addresses ('I'), opcode ids ('H'), operand starts ('I') and operand ids ('I').
+        * The start ('I') and terminal address ('I', `NO_ADDRESS` if none) of each block of the store.
+        * The address and size of each data block (`_DATA_BLOCK`), followed by the data of all blocks.
+        * The tables of unique opcodes and operands of the store, pickled. These are bounded by the distinct values
+          rather than by the number of instructions, so are small even for large programs.
+    """
+
+    def __init__(self, instructions, operand_ids, blocks, data_blocks, data_size, tables_size):
+        self.sizes = (instructions, operand_ids, blocks, data_blocks, data_size, tables_size)
+        self.sections = {}
+        offset = _HEADER.size
+        for name, size in [
+                ('addresses', instructions * 4),
+                ('opcode_ids', instructions * 2),
+                ('operand_starts', (instructions + 1) * 4),
+                ('operand_ids', operand_ids * 4),
+                ('block_starts', blocks * 4),
+                ('terminals', blocks * 4),
+                ('data_blocks', data_blocks * _DATA_BLOCK.size),
+                ('data', data_size),
+                ('tables', tables_size)]:
+            offset = _aligned(offset)
+            self.sections[name] = (offset, offset + size)
+            offset += size
+        self.size = offset
+
+    def pack_header(self):
+        return _HEADER.pack(IMAGE_MAGIC, IMAGE_FORMAT_VERSION, *self.sizes)
+
+    @classmethod
+    def unpack_header(cls, buf):
+        magic, version, *sizes = _HEADER.unpack_from(buf)
+        if magic != IMAGE_MAGIC or version != IMAGE_FORMAT_VERSION:
+            raise ValueError('Not a program image of this version of parm')
+        return cls(*sizes)
+
+
+# The segments created by this process, which are tracked (to be unlinked on exit) until unlinked
+_created = set()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching (on posix) registers the segment to be unlinked once this process exits, as
+        # if it created it. Windows frees segments once no process has them open, and never registers them.
+        shm = shared_memory.SharedMemory(name)
+        if os.name == 'posix' and shm.name not in _created:
+            from multiprocessing import resource_tracker
+            # Registered by the name of the posix segment, which starts with a slash
+            resource_tracker.unregister('/' + shm.name, 'shared_memory')
+        return shm
+
+
+def _close(views: List[memoryview], shm: shared_memory.SharedMemory):
+    # The segment can't be closed while views of it exist
+    for view in views:
+        view.release()
+    views.clear()
+    shm.close()
+
+
+class SharedProgramImage:
+    """
+    The instructions and data of a program in a shared memory segment, in a fixed binary layout (see `_Layout`).
+
+    Any process may attach to the image by its name, and match against its instructions (see
+    `SnippetProgram.attach_shared`) without disassembling the program again or holding a copy of it. Attached
+    processes only read the segment, which is unlinked by the creating process once no longer needed.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self.owner = owner
+        self._views = []  # type: List[memoryview]
+        # Release the views before the segment is closed, also when exiting
+        self._finalizer = weakref.finalize(self, _close, self._views, shm)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def size(self) -> int:
+        return self._shm.size
+
+    @classmethod
+    def create(cls, store: CodeStore, data_blocks: Sequence[Tuple[int, bytes]], name: Optional[str] = None):
+        """
+        Create an image of the given store and data blocks (of their addresses and data) in a new segment.
+        """
+        tables = pickle.dumps((store.opcodes, store.operands), protocol=pickle.HIGHEST_PROTOCOL)
+        terminals = array('I', (NO_ADDRESS if t is None else t.address for t in store.terminals))
+        layout = _Layout(len(store), len(store.operand_ids), store.block_count, len(data_blocks),
+                         sum(len(data) for _address, data in data_blocks), len(tables))
+
+        shm = shared_memory.SharedMemory(name, create=True, size=layout.size)
+        buf = shm.buf
+        try:
+            buf[:_HEADER.size] = layout.pack_header()
+            for section, column in [
+                    ('addresses', store.addresses),
+                    ('opcode_ids', store.opcode_ids),
+                    ('operand_starts', store.operand_starts),
+                    ('operand_ids', store.operand_ids),
+                    ('block_starts', store.block_starts),
+                    ('terminals', terminals)]:
+                start, end = layout.sections[section]
+                buf[start:end] = memoryview(column).cast('B')
+
+            offset, _end = layout.sections['data_blocks']
+            data_offset, _end = layout.sections['data']
+            for address, data in data_blocks:
+                _DATA_BLOCK.pack_into(buf, offset, address, len(data))
+                buf[data_offset:data_offset + len(data)] = data
+                offset += _DATA_BLOCK.size
+                data_offset += len(data)
+
+            start, end = layout.sections['tables']
+            buf[start:end] = tables
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str):
+        return cls(_attach(name), owner=False)
+
+    def _view(self, start, end, fmt='B') -> memoryview:
+        view = self._shm.buf.toreadonly()[start:end].cast(fmt)
+        self._views.append(view)
+        return view
+
+    def load(self) -> Tuple[CodeStore, List[Tuple[int, memoryview]]]:
+        """
+        :returns: A store over (read-only views of) the columns of the image, and the addresses and data of its data
+        blocks. These remain valid until the image is closed.
+        """
+        layout = _Layout.unpack_header(self._shm.buf)
+        columns = {section: self._view(*layout.sections[section], fmt) for section, fmt in [
+            ('addresses', 'I'),
+            ('opcode_ids', 'H'),
+            ('operand_starts', 'I'),
+            ('operand_ids', 'I'),
+            ('block_starts', 'I')]}
+        terminals = self._view(*layout.sections['terminals'], 'I')
+        opcodes, operands = pickle.loads(self._shm.buf[slice(*layout.sections['tables'])])
+
+        data_blocks = []
+        offset, end = layout.sections['data_blocks']
+        data_offset, _end = layout.sections['data']
+        for address, size in _DATA_BLOCK.iter_unpack(self._shm.buf[offset:end]):
+            data_blocks.append((address, self._view(data_offset, data_offset + size)))
+            data_offset += size
+
+        store = CodeStore.from_columns(opcodes=opcodes, operands=operands, terminals=[
+            None if t == NO_ADDRESS else Address(t) for t in terminals], **columns)
+        return store, data_blocks
+
+    def close(self):
+        """
+        Detach from the image, after which the programs using it may no longer be used.
+        """
+        self._finalizer()
+
+    def unlink(self):
+        """
+        Remove the segment, once all processes closed it (by its creator).
+        """
+        self._shm.unlink()
+        _created.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        if self.owner:
+            self.unlink()
@@ -1,12 +1,24 @@
-from typing import List
-
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+from typing import List, Optional, Iterable, Iterator, Sequence, Tuple
+
+from parm.api.common import Search
 from parm.api.cursor import Cursor
-from parm.api.exceptions import InvalidAccess
+from parm.api.exceptions import InvalidAccess, UnresolvedSymbolException
+from parm.api.explanation import PatternExplanation
 from parm.api.match_result import MatchResult
-from parm.api.parsing.arm_asm import Instruction, ArmTransformer, Address, Block
+from parm.api.parsing.arm_asm import Instruction, ArmTransformer, Address, Block, Line
 from parm.api.parsing.arm_pat import ArmPatternTransformer
 from parm.api.program import Program
+from parm.api.symbols import Symbol, SymbolTable
 from parm.api.type_hints import ReversibleIterable
+from parm.programs.code_index import CodeIndex, describe_check
+from parm.programs.code_store import CodeStore, NO_ADDRESS
+from parm.programs.pattern_cache import PatternCache
+from parm.programs.shared_image import SharedProgramImage
 
 from parm import parsers
 
@@ -142,17 +154,210 @@ class SnippetCursor(Cursor):
         return self._prev
 
 
+class CodeCursor(Cursor):
+    """
+    A lightweight view of a single instruction in a `CodeStore`, created on demand.
+    """
+
+    def __init__(self, program, store: CodeStore, index: int, block: Optional[int] = None):
+        super().__init__(program)
+        self.env = program.env
+        self._store = store
+        self._index = index
+        if block is None:
+            block = store.block_of(index)
+        self._block = block
+
+    def __eq__(self, other):
+        if not isinstance(other, CodeCursor):
+            return False
+        return self._store is other._store and self._index == other._index
+
+    def __hash__(self):
+        return hash(self._index)
+
+    def __str__(self):
+        parts = []
+        address = self.address
+        if address:
+            parts.append(f'{address}: ')
+        instruction = self.instruction
+        if instruction:
+            parts.append(str(instruction))
+        return 'CodeCursor[{}]'.format(''.join(parts))
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def instruction(self) -> Instruction:
+        return self._store.instruction(self._index)
+
+    @property
+    def address(self):
+        return self._store.address(self._index)
+
+    @property
+    def address_val(self):
+        address = self._store.addresses[self._index]
+        assert address != NO_ADDRESS
+        return address
+
+    def read_bytes(self, count) -> bytes:
+        return self.program.read_bytes(self.address_val, count)
+
+    def get_cursor_by_offset(self, offset) -> Cursor:
+        return self.program.create_cursor(self.address_val + offset)
+
+    def match(self, pattern, match_result: MatchResult, **kwargs):
+        return pattern.match(self, match_result, **kwargs)
+
+    def skip(self, count):
+        store = self._store
+        block = self._block
+        start = store.block_start(block)
+        end = store.block_end(block)
+
+        target = self._index + count
+        if start <= target < end:
+            return CodeCursor(self.program, store, target, block)
+        if target == end:
+            return PostTermCursor(self.program, CodeCursor(self.program, store, end - 1, block), store.terminals[block])
+        if target == start - 1:
+            return PreInitCursor(self.program, CodeCursor(self.program, store, start, block))
+        if target > end:
+            raise InvalidAccess('No cursor comes after a PostTerm cursor')
+        raise InvalidAccess('No cursor comes before a PreInit cursor')
+
+    def next(self):
+        return self.skip(1)
+
+    def prev(self):
+        return self.skip(-1)
+
+
+class CodeCursorSequence:
+    """
+    A reversible view over (a range of) the instructions of a `CodeStore`, creating cursors as it is iterated.
+    """
+
+    def __init__(self, program, store: CodeStore, start=0, end=None):
+        self._program = program
+        self._store = store
+        self._start = start
+        self._end = end
+
+    @property
+    def end(self):
+        if self._end is None:
+            return len(self._store)
+        return self._end
+
+    def __len__(self):
+        return self.end - self._start
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, end, step = item.indices(len(self))
+            assert step == 1
+            return CodeCursorSequence(self._program, self._store, self._start + start, self._start + end)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(item)
+        return CodeCursor(self._program, self._store, self._start + item)
+
+    def __iter__(self):
+        return _iter_code_cursors(self._program, self._store, range(self._start, self.end))
+
+    def __reversed__(self):
+        return _iter_code_cursors(self._program, self._store, reversed(range(self._start, self.end)))
+
+
+class IndexedCodeCursorSequence:
+    """
+    A reversible view over the instructions of a `CodeStore` at given (ascending) indices, e.g. of an opcode index.
+    """
+
+    def __init__(self, program, store: CodeStore, indices: Sequence[int]):
+        self._program = program
+        self._store = store
+        self._indices = indices
+
+    def __len__(self):
+        return len(self._indices)
+
+    @property
+    def positions(self) -> Sequence[int]:
+        """
+        The positions of the cursors among all cursors of the code store (i.e. in the program's `asm_cursors`).
+        """
+        return self._indices
+
+    @property
+    def total(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return IndexedCodeCursorSequence(self._program, self._store, self._indices[item])
+        return CodeCursor(self._program, self._store, self._indices[item])
+
+    def __iter__(self):
+        return _iter_code_cursors(self._program, self._store, self._indices)
+
+    def __reversed__(self):
+        return _iter_code_cursors(self._program, self._store, reversed(self._indices))
+
+
+def _iter_code_cursors(program, store: CodeStore, indices: Iterable[int]):
+    block = None
+    block_start = block_end = 0
+    for i in indices:
+        if not block_start <= i < block_end:
+            block = store.block_of(i)
+            block_start, block_end = store.block_start(block), store.block_end(block)
+        yield CodeCursor(program, store, i, block)
+
+
 class DataBlock:
     def __init__(self, address, data):
         self.start_address = address
         self.data = data
 
+    @property
+    def is_view(self) -> bool:
+        """
+        Whether the block is a view of data it doesn't own (e.g. of a mapped file), rather than a copy.
+        """
+        return isinstance(self.data, memoryview)
+
+    def _buffer(self) -> bytearray:
+        # Copied once, when first modified, rather than on every merge
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        return self.data
+
     def prepend(self, data):
         self.start_address -= len(data)
-        self.data = data + self.data
+        self._buffer()[:0] = data
 
     def append(self, data):
-        self.data += data
+        self._buffer().extend(data)
+
+    def write(self, address, data):
+        """
+        Write data overlapping or adjacent to the block, extending it as needed.
+        """
+        assert self.start_address <= address + len(data) and address <= self.end_address
+        if address < self.start_address:
+            self.prepend(data[:self.start_address - address])
+        offset = address - self.start_address
+        tail = self.size - offset
+        if len(data) > tail:
+            self.append(data[tail:])
+        self._buffer()[offset:offset + min(tail, len(data))] = data[:tail]
 
     @property
     def size(self):
@@ -169,24 +374,92 @@ class DataBlock:
         offset = address - self.start_address
         result = self.data[offset: offset + count]
         assert len(result) == count
+        return bytes(result)
+
+    def view(self, address, count) -> memoryview:
+        """
+        Same as `read_bytes`, without copying the data (e.g. of a mapped file), unless the block is modified in place.
+        """
+        if isinstance(self.data, bytearray):
+            # Views would keep the block from being resized
+            return memoryview(self.read_bytes(address, count))
+        offset = address - self.start_address
+        result = memoryview(self.data)[offset: offset + count]
+        assert len(result) == count
         return result
 
 
 class BlockStream:
+    """
+    A binary stream of the data of a block (e.g. for construct to parse), positioned at addresses.
+    """
+
     def __init__(self, block: DataBlock, address):
         self.block = block
         self.address = address
 
-    def read(self, n):
-        result = self.block.read_bytes(self.address, n)
+    def _size(self, n):
+        return self.block.end_address - self.address if n is None or n < 0 else n
+
+    def read(self, n=-1) -> bytes:
+        result = self.block.read_bytes(self.address, self._size(n))
+        self.address += len(result)
+        return result
+
+    def view(self, n=-1) -> memoryview:
+        """
+        Same as `read`, without copying the data (see `DataBlock.view`).
+        """
+        result = self.block.view(self.address, self._size(n))
         self.address += len(result)
         return result
 
     def tell(self):
         return self.address
 
-    def seek(self, address):
+    def seek(self, address, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            address += self.address
+        elif whence == os.SEEK_END:
+            address += self.block.end_address
         self.address = address
+        return address
+
+
+DEFAULT_CHUNK_LINES = 0x1000
+
+# A line holding nothing but a label, only allowed at the end of a listing (as its terminal address)
+BARE_LABEL_RE = re.compile(r'\s*(0x[0-9a-fA-F]+|\d+)\s*:\s*')
+
+
+def _iter_listing_chunks(lines: Iterable[str], chunk_lines: int):
+    """
+    Split a listing into chunks of at most `chunk_lines` lines, skipping blank ones.
+
+    :returns: An iterator of (chunk, terminal) pairs, where the terminal is the address of a trailing bare label.
+    """
+    terminal = None
+    lines = (line.rstrip('\r\n') for line in lines if line.strip())
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            return
+
+        code_lines = []
+        for line in chunk:
+            m = BARE_LABEL_RE.fullmatch(line)
+            if terminal is not None or m:
+                if terminal is not None:
+                    raise ValueError(f'Code follows the terminal label 0x{terminal.address:X}')
+                terminal = Address(int(m.group(1), 0))
+            else:
+                code_lines.append(line)
+        yield code_lines, terminal
+
+
+def _anchor_run(pattern):
+    anchor_run = getattr(pattern, 'anchor_run', None)
+    return anchor_run() if anchor_run is not None else None
 
 
 class SnippetProgram(Program):
@@ -195,30 +468,101 @@ class SnippetProgram(Program):
         self._pattern_loader = pattern_loader
         self._code_loader = code_loader
 
-        self._asm_cursors = []
+        self._code = CodeStore()
+        self._code_index = CodeIndex(self._code)
+        self._asm_cursors = CodeCursorSequence(self, self._code)
         self._cursor_cache = {}
+        self._cursor_cache_lock = threading.Lock()
+        # Disjoint and non-adjacent blocks, sorted by their start addresses
         self._data_blocks = []  # type: List[DataBlock]
+        self._data_starts = []  # type: List[int]
+        self._symbols = SymbolTable()
+        self._shared_image = None  # type: Optional[SharedProgramImage]
+
+    def freeze(self):
+        self._code_index.update()
+        super().freeze()
+
+    def export_shared(self, name: Optional[str] = None) -> SharedProgramImage:
+        """
+        Export the instructions and data of the program to a new shared memory segment, for other processes to
+        attach to (see `attach_shared`). The caller owns the segment, and unlinks it once no longer needed.
+        """
+        return SharedProgramImage.create(
+            self._code, [(block.start_address, block.data) for block in self._data_blocks], name)
+
+    def attach_shared(self, image: SharedProgramImage):
+        """
+        Use the instructions and data of a shared image (see `export_shared`), rather than holding a copy of them.
+        The program must be empty, and is frozen once attached.
+        """
+        self._check_not_frozen()
+        if len(self._code) or self._data_blocks:
+            raise ValueError('Only an empty program may attach to a shared image')
+        store, data_blocks = image.load()
+        self._code = store
+        self._code_index = CodeIndex(store)
+        self._asm_cursors = CodeCursorSequence(self, store)
+        self._data_blocks = [DataBlock(address, data) for address, data in data_blocks]
+        self._data_starts = [block.start_address for block in self._data_blocks]
+        self._shared_image = image
+        self.freeze()
+
+    def _coalesced_blocks(self, address, data) -> Tuple[int, int]:
+        """
+        The range of the blocks to coalesce with data added at the given address: those it overlaps, and those it is
+        adjacent to, unless either is a view (e.g. of a mapped file), which would have to be copied.
+        """
+        blocks = self._data_blocks
+        starts = self._data_starts
+        end_address = address + len(data)
+        # The blocks ending at or after the address, and starting at or before the end of the data
+        first = bisect_right(starts, address) - 1
+        if first < 0 or blocks[first].end_address < address:
+            first += 1
+        last = bisect_right(starts, end_address)
+        is_view = isinstance(data, memoryview)
+        if first < last and blocks[first].end_address == address and (is_view or blocks[first].is_view):
+            first += 1
+        if first < last and blocks[last - 1].start_address == end_address and (is_view or blocks[last - 1].is_view):
+            last -= 1
+        return first, last
 
     def add_data_block(self, address, data):
-        try:
-            block = self.find_block(address)
-        except InvalidAccess:
-            self._data_blocks.append(DataBlock(address, data))
+        """
+        Add data at the given address, coalescing it with the blocks it overlaps or is adjacent to. Where it overlaps
+        them, the data added last is kept.
+
+        Adjacent views (e.g. the segments of a mapped file) are kept as separate blocks, rather than copied into one,
+        so data can't be read across them.
+        """
+        self._check_not_frozen()
+        blocks = self._data_blocks
+        starts = self._data_starts
+        first, last = self._coalesced_blocks(address, data)
+        if first == last:
+            if isinstance(data, bytearray):
+                # Blocks are extended in place once merged, so mustn't share a given buffer
+                data = bytes(data)
+            blocks.insert(first, DataBlock(address, data))
+            starts.insert(first, address)
             return
 
-        start_address = address
-        end_address = address + len(data)
-
-        if block.start_address == end_address:
-            block.prepend(data)
-        if block.end_address == start_address:
-            block.append(data)
-        self._data_blocks.remove(block)
-        self.add_data_block(block.start_address, block.data)
+        block = blocks[first]
+        for other in blocks[first + 1:last]:
+            # The gaps between the blocks are covered by the data
+            block.append(bytes(other.start_address - block.end_address))
+            block.append(other.data)
+        block.write(address, data)
+        del blocks[first + 1:last]
+        del starts[first + 1:last]
+        starts[first] = block.start_address
 
     def find_block(self, address):
-        for block in self._data_blocks:
-            if block.start_address <= address <= block.end_address:
+        ix = bisect_right(self._data_starts, address) - 1
+        if ix >= 0:
+            block = self._data_blocks[ix]
+            if address <= block.end_address:
                 return block
         raise InvalidAccess(f'No data found for address 0x{address:X}')
 
@@ -229,6 +573,7 @@ class SnippetProgram(Program):
         return block.read_bytes(address, size)
 
     def add_code_block(self, code_block, address=None):
+        self._check_not_frozen()
         if isinstance(code_block, str):
             code_block = self._code_loader.load(code_block)
 
@@ -245,31 +590,60 @@ class SnippetProgram(Program):
         else:
             first_address = address
 
-        first_cursor = SnippetCursor(self, address=first_address, instruction=first_line.instruction)
-        cursors = [first_cursor]
-        cursors.extend([
-            SnippetCursor(self, address=line.address, instruction=line.instruction)
-            for line in code_lines[1:]])
+        if first_line.address is None and first_address is not None:
+            code_lines[0] = Line(first_line.instruction, first_address)
+
+        self._check_code_lines(code_lines)
+        start = self._code.add_block(code_lines, code_block.terminal)
+        return CodeCursor(self, self._code, start)
+
+    def add_code_stream(self, lines: Iterable[str], chunk_lines: int = DEFAULT_CHUNK_LINES) -> Cursor:
+        """
+        Add a listing as a single code block, parsing it in chunks of lines.
+
+        Unlike `add_code_block`, the listing is never held in memory as a whole (neither as text nor as
+        a parse tree), so memory usage is proportional to the chunk size rather than to the listing.
+
+        :param lines: The lines of the listing, e.g. an open text file.
+        :param chunk_lines: The number of lines parsed at once.
+        :returns: A cursor to the first instruction of the listing.
+        """
+        self._check_not_frozen()
+        start = None
+        for code_lines, terminal in _iter_listing_chunks(lines, chunk_lines):
+            if code_lines:
+                block = self._code_loader.load('\n'.join(code_lines))
+                assert block.terminal is None
+                self._check_code_lines(block.lines)
+                if start is None:
+                    start = self._code.add_block(block.lines)
+                else:
+                    self._code.extend_block(block.lines)
+            if terminal is not None and start is not None:
+                self._code.set_terminal(terminal)
+
+        if start is None:
+            raise ValueError('No code lines given!')
+        return CodeCursor(self, self._code, start)
 
-        for i in range(len(cursors) - 1):
-            cursors[i + 1].set_prev(cursors[i])
-            cursors[i].set_next(cursors[i + 1])
-        self._asm_cursors.extend(cursors)
+    def _check_code_lines(self, code_lines):
+        if self._cursor_cache:
+            for line in code_lines:
+                if line.address is not None:
+                    assert line.address.address not in self._cursor_cache
 
-        term = cursors[-1]
-        term.set_next(PostTermCursor(self, term, code_block.terminal))
-        init = cursors[0]
-        init.set_prev(PreInitCursor(self, init))
+    def add_symbols(self, symbols: Iterable[Symbol]):
+        self._check_not_frozen()
+        self._symbols.update(symbols)
 
-        for c in cursors:
-            adr = c.address
-            if adr is not None:
-                assert isinstance(adr, Address)
-                adr = adr.address
-                assert adr not in self._cursor_cache
-                self._cursor_cache[adr] = c
+    def find_symbol(self, symbol_name) -> Cursor:
+        symbol = self._symbols.find(symbol_name)
+        if symbol is None:
+            raise UnresolvedSymbolException(symbol_name)
+        return self.create_cursor(symbol.address)
 
-        return first_cursor
+    def nearest_symbol(self, address: int) -> Optional[Symbol]:
+        return self._symbols.nearest(address)
 
     def get_instruction(self, address):
         return self.create_cursor(address).instruction
@@ -277,6 +651,9 @@ class SnippetProgram(Program):
     def create_cursor(self, address) -> Cursor:
         if address is None:
             raise InvalidAccess('Invalid cursor address!')
+        index = self._code.find(address)
+        if index is not None:
+            return CodeCursor(self, self._code, index)
         try:
             return self._cursor_cache[address]
         except KeyError:
@@ -285,8 +662,9 @@ class SnippetProgram(Program):
             except InvalidAccess:
                 raise InvalidAccess('Failed to find cursor with address "{}"'.format(address))
             result = SnippetCursor(self, address=Address(address))
-            self._cursor_cache[address] = result
-            return result
+            with self._cursor_cache_lock:
+                # Keep the cursor of a concurrent call, such that there's a single cursor per address
+                return self._cursor_cache.setdefault(address, result)
 
     def create_pattern(self, pattern):
         return self._pattern_loader.load(pattern)
@@ -295,6 +673,91 @@ class SnippetProgram(Program):
     def asm_cursors(self) -> ReversibleIterable[Cursor]:
         return self._asm_cursors
 
+    @property
+    def has_code_index(self) -> bool:
+        """
+        Whether the code index covers all the code of the program, such that searches may find their candidate
+        cursors through it. Otherwise, they scan all cursors (as `Program` does).
+        """
+        return True
+
+    def _index_run(self, pattern):
+        """
+        :returns: The run of lines the code index finds the candidate cursors of the pattern by, or None if all
+            cursors are to be scanned.
+        """
+        run = _anchor_run(pattern)
+        if not run or self._code_index.plan(run) is None:
+            return None
+        return run
+
+    def candidate_cursors(self, pattern) -> ReversibleIterable[Cursor]:
+        if not self.has_code_index:
+            return super().candidate_cursors(pattern)
+        run = self._index_run(pattern)
+        if run is None:
+            return self.asm_cursors
+        return IndexedCodeCursorSequence(self, self._code, self._code_index.run_postings(run))
+
+    def _dispatch_searches(self, searches: Sequence[Search]):
+        """
+        :returns: The searches to feed each candidate index (as found by the code index), and the searches that have
+            to scan the whole program.
+        """
+        dispatch = {}
+        scanning = []
+        for search in searches:
+            run = self._index_run(search.pattern)
+            if run is None:
+                scanning.append(search)
+                continue
+            for index in self._code_index.run_postings(run):
+                dispatch.setdefault(index, []).append(search)
+        return dispatch, scanning
+
+    def _search_indices(self, candidates: Sequence[int], scanning: Sequence[Search]) -> Iterator[int]:
+        # Every index while any search scans the whole program, then only the remaining candidates
+        index = 0
+        while index < len(self._code) and not all(s.done for s in scanning):
+            yield index
+            index += 1
+        yield from candidates[bisect_left(candidates, index):]
+
+    def run_searches(self, searches: Sequence[Search]):
+        if not self.has_code_index:
+            return super().run_searches(searches)
+
+        # Dispatch each cursor only to the searches it is a candidate of, or to all searches that scan the program
+        dispatch, scanning = self._dispatch_searches(searches)
+        indices = self._search_indices(sorted(dispatch), scanning)
+        active = sum(not s.done for s in searches)
+        for cursor in _iter_code_cursors(self, self._code, indices):
+            if active == 0:
+                break
+            for search in chain(dispatch.get(cursor.index, ()), scanning):
+                if search.done:
+                    continue
+                search.feed(cursor)
+                if search.done:
+                    active -= 1
+
+    def _explain_search(self, pattern) -> PatternExplanation:
+        run = self._index_run(pattern) if self.has_code_index else None
+        if run is None:
+            return super()._explain_search(pattern)
+        plan = self._code_index.plan(run)
+        checks = [describe_check(line) for line in run if line is not plan.line]
+        return PatternExplanation(
+            self._code_index.estimate(run, plan), len(self.asm_cursors), plan.line.source, plan.postings,
+            plan.estimate, checks)
+
+    def referencing_cursors(self, address: int) -> ReversibleIterable[Cursor]:
+        """
+        :returns: The cursors of the instructions referencing the address, as a branch target (or any other address
+            operand) or as a PC-relative literal.
+        """
+        return IndexedCodeCursorSequence(self, self._code, self._code_index.reference_postings(address))
+
     def create_data_stream(self, cursor: Cursor):
         adr = cursor.address
         address = adr.address
@@ -302,17 +765,39 @@ class SnippetProgram(Program):
 
 
 class ArmPatternLoader:
-    def __init__(self):
-        self.parser = parsers.create_arm_pattern_parser()
+    # Patterns are shared by all programs, nested patterns (e.g. of `find_next`) are loaded again for every match
+    SHARED_CACHE = PatternCache()
+
+    def __init__(self, cache: Optional[PatternCache] = None):
+        """
+        :param cache: The cache of compiled patterns, defaults to one shared by all loaders.
+        """
+        self.parser = parsers.get_arm_pattern_parser()
         self.transformer = ArmPatternTransformer()
+        self.cache = self.SHARED_CACHE if cache is None else cache
 
-    def load(self, pattern):
+    def compile(self, pattern):
         return self.transformer.transform(self.parser.parse(pattern))
 
+    def load(self, pattern):
+        return self.cache.get(pattern, self.compile)
+
 
 class ArmCodeLoader:
-    def __init__(self):
-        self.parser = parsers.create_arm_parser()
+    PARSERS = {
+        'earley': parsers.get_arm_parser,
+        'lalr': parsers.get_arm_lalr_parser,
+    }
+
+    def __init__(self, parser='earley'):
+        """
+        :param parser: Either 'earley', or 'lalr' for the much faster LALR variant of the grammar.
+        """
+        try:
+            get_parser = self.PARSERS[parser]
+        except KeyError:
+            raise ValueError(f'Unknown parser {parser!r}, expected one of {", ".join(self.PARSERS)}')
+        self.parser = get_parser()
         self.transformer = ArmTransformer()
 
     def load(self, code_block) -> Block:
@@ -320,5 +805,5 @@ class ArmCodeLoader:
 
 
 class ArmSnippetProgram(SnippetProgram):
-    def __init__(self, env=None):
-        super().__init__(env=env, pattern_loader=ArmPatternLoader(), code_loader=ArmCodeLoader())
+    def __init__(self, env=None, parser='earley'):
+        super().__init__(env=env, pattern_loader=ArmPatternLoader(), code_loader=ArmCodeLoader(parser))
@@ -1,5 +1,6 @@
 import argparse
 
+from parm.caching import default_cache_dir
 from parm.signature_files.sig_files import match_signature_files
 
 
@@ -8,6 +9,19 @@ def main():
     parser.add_argument('target')
     parser.add_argument('-s', '--signatures', default='.')
     parser.add_argument('-o', '--output', default=None)
+    parser.add_argument(
+        '-c', '--cache-dir', nargs='?', default=None, const=default_cache_dir(),
+        help='Cache the disassembled target in this directory (defaults to $PARM_CACHE_DIR or ~/.cache/parm)')
+    parser.add_argument(
+        '--explain', action='store_true',
+        help='Explain how the pattern of each signature is searched for, in its match results')
+    parser.add_argument(
+        '--analyze', action='store_true',
+        help='Explain, also searching for each pattern to report its actual candidates, matches and search time')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='Match in a pool of this many worker processes, forked once the target is loaded')
     args = parser.parse_args()
 
-    match_signature_files(args.target, args.signatures, args.output)
+    match_signature_files(
+        args.target, args.signatures, args.output, args.cache_dir, args.explain, args.analyze, args.workers)
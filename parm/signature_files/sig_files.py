@@ -4,9 +4,12 @@ import pydantic
 from typing import Optional, List, Dict
 from pathlib import Path
 
+from parm.api.common import FirstSearch, SingleSearch
 from parm.api.match_result import MatchResult
 from parm.api.exceptions import PatternMismatchException
+from parm.api.parallel import ProgramPool
 from parm.programs.capstone import CapstoneProgram
+from parm.programs.disassembly_cache import DisassemblyCache
 
 
 class Signature(pydantic.BaseModel):
@@ -54,9 +57,21 @@ class BadPassedDependencyException(DependencyException):
     pass
 
 
+# The searches of the methods that `MatchingCtx.perform_matches` runs together, in a single pass over the target
+BATCHED_SEARCHES = {
+    'find_first': FirstSearch,
+    'find_single': SingleSearch,
+}
+
+
 class MatchingCtx:
-    def __init__(self, match_target):
+    def __init__(self, match_target, explain=False, analyze=False, pool: Optional[ProgramPool] = None):
         self.match_target = match_target
+        # If given, batched searches run in the workers of this pool (of the target)
+        self.pool = pool
+        # Explain how the pattern of each signature is searched for (see `Program.explain`) before matching it
+        self.explain = explain or analyze
+        self.analyze = analyze
 
         self.signatures = []
         self.passed_signatures = []
@@ -69,6 +84,7 @@ class MatchingCtx:
         self.importer_map = {}
 
         self.match_results = {}
+        self.explanations = {}
 
     def add_signature(self, signature):
         self.signatures.append(signature)
@@ -77,15 +93,47 @@ class MatchingCtx:
         for imp in signature.imports:
             self.importer_map.setdefault(imp, []).append(signature)
 
-    def perform_match(self, signature):
+    def _create_match_result(self, signature):
         mr = MatchResult()
         for imp in signature.imports:
             mr[imp] = self.match_results[imp]
-        method = getattr(self.match_target, signature.method)
+        if self.explain:
+            self.explanations[signature] = self.match_target.explain(
+                signature.pattern, match_result=mr, analyze=self.analyze)
+        return mr
 
+    def perform_match(self, signature):
+        mr = self._create_match_result(signature)
+        method = getattr(self.match_target, signature.method)
+        self._record_match(signature, mr, lambda: method(signature.pattern, match_result=mr))
+
+    def perform_matches(self, signatures):
+        """
+        Match signatures whose imports are resolved, searching for those using batched methods (see
+        `BATCHED_SEARCHES`) in a single pass over the target, rather than a pass per signature.
+        """
+        searches = {}
+        for signature in signatures:
+            search_type = BATCHED_SEARCHES.get(signature.method)
+            if search_type is None:
+                self.perform_match(signature)
+                continue
+            mr = self._create_match_result(signature)
+            searches[signature] = search_type(self.match_target.create_pattern(signature.pattern), mr)
+
+        if self.pool is None:
+            self.match_target.run_searches(list(searches.values()))
+        else:
+            self.pool.run_searches([
+                (search, signature.pattern, {imp: self.match_results[imp] for imp in signature.imports})
+                for signature, search in searches.items()])
+        for signature, search in searches.items():
+            self._record_match(signature, search.match_result, search.result)
+
+    def _record_match(self, signature, mr, match):
         try:
             with mr.transact():
-                method(signature.pattern, match_result=mr)
+                match()
             self.passed_signatures.append(signature)
         except PatternMismatchException:
             self.failed_signatures.append(signature)
@@ -104,6 +152,27 @@ class MatchingCtx:
                 assert old_result == result
                 self.match_results[exp] = result
 
+    def _is_resolved(self, signature):
+        return signature in self.passed_signatures or signature in self.failed_signatures or \
+            signature in self.not_run_signatures
+
+    def resolve_all(self, signatures):
+        """
+        Resolve the signatures, matching those whose imports are resolved together (see `perform_matches`), in waves
+        as their exporters pass. The remaining signatures are resolved one by one, through their exporters.
+        """
+        pending = [s for s in signatures if not self._is_resolved(s)]
+        while True:
+            ready = [s for s in pending if all(imp in self.match_results for imp in s.imports)]
+            if not ready:
+                break
+            self.perform_matches(ready)
+            pending = [s for s in pending if not self._is_resolved(s)]
+
+        for signature in pending:
+            if not self._is_resolved(signature):
+                self.resolve(signature)
+
     def resolve(self, signature, active_set=None):
         if active_set is None:
             active_set = set()
@@ -150,6 +219,12 @@ class MatchingCtx:
         self.add_signature_error(signature, reason)
 
 
+def _format_explanation(explanation) -> List[str]:
+    if explanation is None:
+        return []
+    return ['explain: |'] + [f'  {line}' for line in str(explanation).split('\n')]
+
+
 def format_signature_results(signature, ctx: MatchingCtx):
     lines = []
     if signature.name:
@@ -182,6 +257,7 @@ def format_signature_results(signature, ctx: MatchingCtx):
         lines.append('matches:')
         lines.extend(match_lines)
 
+    lines.extend(_format_explanation(ctx.explanations.get(signature)))
     return '---\n{}\n...\n\n'.format('\n'.join(lines))
 
 
@@ -242,21 +318,34 @@ def _create_match_map(signatures_path, output_path):
     return match_map
 
 
-def match_signatures(target_path, match_map):
+def match_signatures(target_path, match_map, cache_dir=None, explain=False, analyze=False, workers=None):
+    """
+    :param workers: If given, match in a pool of that many worker processes (see `ProgramPool`).
+    """
     assert isinstance(match_map, dict)
 
-    target = CapstoneProgram.load_arm_elf(Path(target_path))
+    cache = None
+    if cache_dir is not None:
+        cache = DisassemblyCache(cache_dir)
+    target = CapstoneProgram.load_arm_elf(Path(target_path), cache=cache)
     groups = load_signature_matching_groups(match_map)
-    match_ctx = MatchingCtx(target)
 
-    for group in groups:
-        group.append_to_context(match_ctx)
-    for group in groups:
-        for signature in group.signatures:
-            match_ctx.resolve(signature)
-        group.save_matches(match_ctx)
-
-
-def match_signature_files(target_path, signatures_path, output_path=None):
+    pool = None
+    if workers is not None:
+        pool = ProgramPool(target, workers)
+    try:
+        match_ctx = MatchingCtx(target, explain, analyze, pool)
+        for group in groups:
+            group.append_to_context(match_ctx)
+        for group in groups:
+            match_ctx.resolve_all(group.signatures)
+            group.save_matches(match_ctx)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def match_signature_files(target_path, signatures_path, output_path=None, cache_dir=None, explain=False,
+                          analyze=False, workers=None):
     match_map = _create_match_map(signatures_path, output_path)
-    match_signatures(target_path, match_map)
+    match_signatures(target_path, match_map, cache_dir, explain, analyze, workers)
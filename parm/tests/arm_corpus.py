@@ -0,0 +1,185 @@
+"""
+A small corpus of ARM mode instruction encodings, used to test the different program loaders, and helpers for
+searching it.
+"""
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+from parm.api.match_result import MatchResult
+from parm.programs.capstone import CapstoneProgram, LazyCapstoneProgram, perform_disassembly
+from parm.programs.snippet import ArmSnippetProgram
+
+ARM_CORPUS_ADDRESS = 0x1000
+
+# Instructions that are fully supported by the arm_asm grammar
+ARM_CORPUS = b''.join(bytes.fromhex(h) for h in [
+    '30482de9',  # push {r4, r5, fp, lr}
+    '08b08de2',  # add fp, sp, #8
+    '10d04de2',  # sub sp, sp, #0x10
+    '120ca0e3',  # mov r0, #0x1200
+    '0210a0e1',  # mov r1, r2
+    '0210b0e1',  # movs r1, r2
+    '0010a003',  # moveq r1, #0
+    'ff04a0e3',  # mov r0, #0xff000000
+    '001090e5',  # ldr r1, [r0]
+    '042090e5',  # ldr r2, [r0, #4]
+    '043030e5',  # ldr r3, [r0, #-4]!
+    '043090e4',  # ldr r3, [r0], #4
+    '043010e4',  # ldr r3, [r0], #-4
+    '013090e6',  # ldr r3, [r0], r1
+    '012190e7',  # ldr r2, [r0, r1, lsl #2]
+    '4122b0e7',  # ldr r2, [r0, r1, asr #4]!
+    '0120d0e5',  # ldrb r2, [r0, #1]
+    'b220d0e1',  # ldrh r2, [r0, #2]
+    'b220c0e1',  # strh r2, [r0, #2]
+    '0820c405',  # strbeq r2, [r4, #8]
+    '4102b417',  # ldrne r0, [r4, r1, asr #4]!
+    '032081e7',  # str r2, [r1, r3]
+    '3d4090e8',  # ldm r0, {r0, r2, r3, r4, r5, lr}
+    '70002de9',  # push {r4, r5, r6}
+    '060080e8',  # stm r0, {r1, r2}
+    'e3ffffeb',  # bl #0x1000
+    'f2ffff1a',  # bne #0x1040
+    'ddffffea',  # b #0xff0
+    '33ff2fe1',  # blx r3
+    '1eff2f01',  # bxeq lr
+    '050050e3',  # cmp r0, #5
+    '010050e1',  # cmp r0, r1
+    '010070e3',  # cmn r0, #1
+    '010150e1',  # cmp r0, r1, lsl #2
+    '8101a0e1',  # lsl r0, r1, #3
+    '3102a0e1',  # lsr r0, r1, r2
+    '6100a0e1',  # rrx r0, r1
+    '020091e0',  # adds r0, r1, r2
+    '0100a0e0',  # adc r0, r0, r1
+    '000061e2',  # rsb r0, r1, #0
+    'c201d1e0',  # sbcs r0, r1, r2, asr #3
+    '010080e3',  # orr r0, r0, #1
+    '020001e0',  # and r0, r1, r2
+    '620421e0',  # eor r0, r1, r2, ror #8
+    'ff00c0e3',  # bic r0, r0, #0xff
+    '910200e0',  # mul r0, r1, r2
+    '910210e0',  # muls r0, r1, r2
+    '08009fe5',  # ldr r0, [pc, #8]
+    '08001fe5',  # ldr r0, [pc, #-8]
+    '3088bde8',  # pop {r4, r5, fp, pc}
+])
+
+# Instructions that the arm_asm grammar cannot parse
+ARM_EXTRA_CORPUS = b''.join(bytes.fromhex(h) for h in [
+    '0000e0e3',  # mvn r0, #0
+    '012010e7',  # ldr r2, [r0, -r1]
+    '010010e3',  # tst r0, #1
+    '000000ef',  # svc #0
+    '00f020e3',  # nop
+])
+
+
+def _align(data: bytes, alignment=4):
+    return data + b'\0' * (-len(data) % alignment)
+
+
+def build_arm_elf(text: bytes, address: int = ARM_CORPUS_ADDRESS, data: Optional[Tuple[int, bytes]] = None,
+                  symbols: Sequence[Tuple[str, int, int]] = (), relocatable: bool = False) -> bytes:
+    """
+    Build a minimal 32-bit little-endian ARM ELF file, with the given code as its .text section.
+
+    :param data: The address and contents of a .data section. If given, the file also has a loadable segment per
+        section.
+    :param symbols: The names, addresses and sizes of global functions in the .text section, in a .symtab section.
+    :param relocatable: Build a relocatable object (as a .o file), without segments.
+    """
+    ehdr_size, phdr_size, shdr_size = 0x34, 0x20, 0x28
+    phnum = 0 if data is None or relocatable else 2
+
+    # Name, type, flags, address, contents, alignment, link, info, entry size
+    sections = [('.text', 1, 6, address, text, 4, 0, 0, 0), ('.shstrtab', 3, 0, 0, None, 1, 0, 0, 0)]
+    if data is not None:
+        sections.append(('.data', 1, 3, data[0], data[1], 4, 0, 0, 0))
+    if symbols:
+        strtab = b'\0' + b''.join(name.encode() + b'\0' for name, _address, _size in symbols)
+        # st_name, st_value, st_size, st_info=GLOBAL FUNC, st_other, st_shndx=.text
+        symtab = bytes(0x10) + b''.join(
+            struct.pack('<IIIBBH', strtab.index(b'\0' + name.encode() + b'\0') + 1, sym_address, size, 0x12, 0, 1)
+            for name, sym_address, size in symbols)
+        sections.append(('.symtab', 2, 0, 0, symtab, 4, len(sections) + 2, 1, 0x10))
+        sections.append(('.strtab', 3, 0, 0, strtab, 1, 0, 0, 0))
+
+    shstrtab = b'\0' + b''.join(name.encode() + b'\0' for name, *_ in sections)
+    sections[1] = sections[1][:4] + (shstrtab, ) + sections[1][5:]
+
+    offset = ehdr_size + phnum * phdr_size
+    offsets = []
+    for section in sections:
+        offsets.append(offset)
+        offset += len(_align(section[4]))
+
+    # e_ident, e_type=EXEC or REL, e_machine=ARM, e_version, e_entry, e_phoff, e_shoff, e_flags, e_ehsize,
+    # e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx
+    header = struct.pack(
+        '<16sHHIIIIIHHHHHH', b'\x7fELF\x01\x01\x01', 1 if relocatable else 2, 40, 1, address,
+        ehdr_size if phnum else 0, offset, 0x5000000, ehdr_size, phdr_size if phnum else 0, phnum, shdr_size,
+        len(sections) + 1, 2)
+
+    # p_type=LOAD, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags=R+X or R+W, p_align
+    phdrs = b''.join(
+        struct.pack('<IIIIIIII', 1, offsets[i], sections[i][3], sections[i][3], len(sections[i][4]),
+                    len(sections[i][4]), flags, 4)
+        for i, flags in [(0, 5), (2, 6)][:phnum])
+
+    shdrs = bytes(shdr_size) + b''.join(
+        struct.pack('<IIIIIIIIII', shstrtab.index(name.encode() + b'\0'), sh_type, flags, sh_address, sh_offset,
+                    len(contents), link, info, align, entry_size)
+        for (name, sh_type, flags, sh_address, contents, align, link, info, entry_size), sh_offset
+        in zip(sections, offsets))
+    return header + phdrs + b''.join(_align(section[4]) for section in sections) + shdrs
+
+
+def create_program():
+    """
+    Create a program with the corpus as its code, and a data block at 0x8000.
+    """
+    program = ArmSnippetProgram(parser='lalr')
+    program.add_code_block(perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32))
+    program.add_data_block(0x8000, bytes(range(64)))
+    return program
+
+
+def load_both(ops: bytes, page_size: int, max_pages: int):
+    """
+    Load the given ARM code as both an eager and a lazy capstone program.
+    """
+    fobj = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        fobj.write(ops)
+        fobj.close()
+        eager = CapstoneProgram.load_arm_binary(Path(fobj.name))
+        lazy = LazyCapstoneProgram.load_arm_binary(Path(fobj.name), page_size=page_size, max_pages=max_pages)
+    finally:
+        os.remove(fobj.name)
+    return eager, lazy
+
+
+def all_matches(program, pattern, **kwargs):
+    """
+    The addresses and the match result of finding all matches of the pattern, or the type of the raised exception.
+    """
+    match_result = MatchResult()
+    try:
+        return [c.address_val for c in program.find_all(pattern, match_result, **kwargs)], match_result.to_obj()
+    except Exception as e:
+        return type(e)
+
+
+def single_match(program, pattern, **kwargs):
+    """
+    The address and the match result of finding the single match of the pattern, or the type of the raised exception.
+    """
+    match_result = MatchResult()
+    try:
+        return program.find_single(pattern, match_result, **kwargs).address_val, match_result.to_obj()
+    except Exception as e:
+        return type(e)
@@ -0,0 +1,148 @@
+from unittest import TestCase
+
+from parm.api.common import find_all
+from parm.api.exceptions import PatternMismatchException
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_pat import BlockPat
+from parm.programs.capstone import perform_disassembly
+from parm.programs.snippet import ArmSnippetProgram
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
+
+PATTERNS = [
+    'mov @:rd, @:rs',
+    'mov* *',
+    'mov @:rd, #@:imm',
+    'add fp, *:rest',
+    'cmp r0, #5',
+    'cmp @:rn, #@:imm',
+    'b* @:target',
+    'bl 0xFF8',
+    'bne #0x1000',
+    'bl* #@',
+    '* @:a, @:b',
+    'mov @:reg, @:reg',
+    'orr @:rd, @:rd, #@',
+    'mul @, @, @',
+    'eor r0, r1, r2, ror#@:n',
+    'push {r4, r5, *:regs}',
+    'push {r4-r6}',
+    'push {r4-r5, fp, *}',
+    'pop {r4, r5, fp, *}',
+    'pop {*:regs}',
+    'lsl r0, r1, #3',
+    'bic r0, r0, #0xff',
+    'label: push {*}',
+    """
+    0x1004:
+    add fp, sp, #@:size
+    """,
+    """
+    add fp, sp, #8
+    sub sp, sp, #@:size
+    """,
+    """
+    push {*}
+    ...
+    pop {*:regs}
+    """,
+    """
+    cmp r0, @:rm
+    ... {2, 5}
+    adds @:rd, @:rm, @
+    """,
+    """
+    mov r0, #@
+    ... {, 2}
+    mov r1, r2
+    """,
+    """
+    push {*}
+    ... {2}
+    mov r0, #@:imm
+    """,
+    """
+    push {*}
+  > add fp, sp, #8
+    """,
+    """
+    mov r1, r2
+    ...
+  > add* @:rd, *
+    """,
+    """
+    mov r1, r2
+    ... {1}
+  > moveq r1, #@:imm
+    """,
+    """
+    movs r1, r2
+    % goto_next('cmp @:rn, #@')
+    ... {1}
+    cmp @:rn, r1
+    """,
+]
+
+
+class Interpreted:
+    def __init__(self, pattern: BlockPat):
+        self.pattern = pattern
+
+    def match(self, cursor, match_result, **kwargs):
+        self.pattern.match_interpreted(cursor, match_result, **kwargs)
+
+
+def outcome(cursor, pattern):
+    match_result = MatchResult()
+    try:
+        with match_result.transact():
+            cursor.match(pattern, match_result)
+    except Exception as e:
+        return type(e)
+    return match_result.to_obj()
+
+
+# noinspection PyMethodMayBeStatic
+class ArmPatCompilerTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = ArmSnippetProgram(parser='lalr')
+        self.program.add_code_block(perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32))
+
+    def test_differential(self):
+        matched = 0
+        for text in PATTERNS:
+            pattern = self.program.create_pattern(text)
+            compiled = [outcome(c, pattern) for c in self.program.asm_cursors]
+            interpreted = [outcome(c, Interpreted(pattern)) for c in self.program.asm_cursors]
+            assert compiled == interpreted, text
+            for cursor, result in zip(self.program.asm_cursors, compiled):
+                if pattern.rejects(cursor):
+                    assert isinstance(result, type) and issubclass(result, PatternMismatchException), text
+            matched += sum(isinstance(o, dict) for o in compiled)
+        # Make sure the patterns do match somewhere
+        assert matched >= len(PATTERNS)
+
+    def test_find_all(self):
+        pattern = self.program.create_pattern("""
+            mov @:rd, @
+            ...
+            add* @:rd, *
+        """)
+        compiled_result = MatchResult()
+        compiled = list(self.program.find_all(pattern, compiled_result))
+        interpreted_result = MatchResult()
+        cursors = self.program.candidate_cursors(pattern)
+        interpreted = list(find_all(Interpreted(pattern), cursors, interpreted_result))
+        assert compiled == interpreted
+        assert compiled_result.to_obj() == interpreted_result.to_obj()
+
+    def test_relink(self):
+        pattern = self.program.create_pattern("""
+            push {r4, r5, fp, lr}
+            add fp, sp, #8
+        """)
+        cursor = self.program.create_cursor(ARM_CORPUS_ADDRESS + 4)
+        assert outcome(cursor, pattern) is not None
+        pattern.anchor_index = 1
+        pattern.relink_lines()
+        assert outcome(cursor, pattern) == {}
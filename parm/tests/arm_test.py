@@ -1,8 +1,14 @@
+import pickle
+
+import pytest
 from unittest import TestCase
 
 from parm import parsers
 from parm.api.parsing.arm_asm import ArmTransformer, Block, Line, Instruction, Reg, Immediate, MemMulti, ShiftedReg
 from parm.api.parsing.arm_asm import Address, MemAccessOffset, RegList, MemAccessPreIndexed
+from parm.programs.capstone import perform_disassembly
+from parm.programs.snippet import ArmCodeLoader
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
 
 
 class ArmTest(TestCase):
@@ -44,15 +50,14 @@ class ArmTest(TestCase):
         assert self._pt('LDM R0, {R0-R2}') == expected
 
     def test_conditional(self):
-        inst = Instruction('mov', [Reg('r0'), ShiftedReg(Reg('r1'))])
-        expected = Block([Line(inst)])
+        operands = [Reg('r0'), ShiftedReg(Reg('r1'))]
 
         # test ne condition code
-        inst.opcode = 'movne'
+        expected = Block([Line(Instruction('movne', operands))])
         assert self._pt('movne r0, r1') == expected
 
         # test eq condition code
-        inst.opcode = 'moveq'
+        expected = Block([Line(Instruction('moveq', operands))])
         assert self._pt('moveq r0, r1') == expected
 
     def test_ldr_simple(self):
@@ -97,3 +102,57 @@ class ArmTest(TestCase):
             RegList([Reg('r0'), Reg('r2'), Reg('r3'), Reg('r4'), Reg('r5'), Reg('lr'), Reg('pc')]))]),
                                Address(0x1000))])
         assert self._pt('0x1000: ldm r0, {r0, r2-r5, lr, pc}') == expected
+
+
+class ArmLalrTest(ArmTest):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parser = parsers.create_arm_lalr_parser()
+        self.earley_parser = parsers.get_arm_parser()
+
+    def test_identical_to_earley(self):
+        listing = perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32)
+        for code in [listing, '\n    mov r0, r1\n\n    0x10: bx lr\n    0x14:\n    ', 'LDM R0, {R0-R2}\r\n']:
+            expected = self.transformer.transform(self.earley_parser.parse(code))
+            assert self._pt(code) == expected
+            assert repr(self._pt(code)) == repr(expected)
+
+    def test_code_loader(self):
+        assert ArmCodeLoader('lalr').load('bl 0x2000') == ArmCodeLoader().load('bl 0x2000')
+        with pytest.raises(ValueError):
+            ArmCodeLoader('cyk')
+
+
+# noinspection PyMethodMayBeStatic
+class ArmOperandTest(TestCase):
+    def test_interned_regs(self):
+        assert Reg('R0') is Reg('r0')
+        assert Reg('sp') is not Reg('r13')
+        assert Reg('sp').index == Reg('r13').index == 13
+        assert ShiftedReg(Reg('r1'), 'lsl #2') is ShiftedReg(Reg('R1'), 'lsl #2')
+        assert Immediate(4) is Immediate(4)
+        assert Immediate(0x12345678) == Immediate(0x12345678)
+        assert Immediate(1) != Immediate(1.0)
+
+    def test_hashable(self):
+        operands = [Reg('r0'), ShiftedReg(Reg('r0')), Immediate(0x12345678), Address(0x1000),
+                    MemAccessOffset(Reg('r1'), Immediate(4)), MemMulti(RegList([Reg('r0'), Reg('r2')]))]
+        index = {op: i for i, op in enumerate(operands)}
+        rebuilt = [Reg('r0'), ShiftedReg(Reg('r0')), Immediate(0x12345678), Address(0x1000),
+                   MemAccessOffset(Reg('r1'), Immediate(4)), MemMulti(RegList([Reg('r0'), Reg('r2')]))]
+        assert [index[op] for op in rebuilt] == list(range(len(operands)))
+
+    def test_immutable(self):
+        with pytest.raises(AttributeError):
+            Reg('r0').name = 'r1'
+        with pytest.raises(AttributeError):
+            Immediate(1).value = 2
+        with pytest.raises(AttributeError):
+            Instruction('mov', [Reg('r0'), Reg('r1')]).opcode = 'movne'
+
+    def test_pickle(self):
+        block = ArmCodeLoader().load('ldr r0, [r1, #4]\nmov r2, r3, lsl #2')
+        loaded = pickle.loads(pickle.dumps(block))
+        assert loaded == block
+        assert loaded.lines[0].instruction.operands[0] is Reg('r0')
+        assert loaded.lines[1].instruction.operands[1] is block.lines[1].instruction.operands[1]
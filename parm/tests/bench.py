@@ -0,0 +1,549 @@
+import gc
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from parm.programs.capstone import (
+    CapstoneProgram, LazyCapstoneProgram, perform_disassembly, perform_decoding, perform_parallel_decoding,
+    read_elf_code, is_elf_file, map_elf_data, DEFAULT_CHUNK_SIZE)
+from parm.programs.disassembly_cache import DisassemblyCache
+from parm.programs.shared_image import SharedProgramImage
+from parm.programs.snippet import ArmCodeLoader, ArmSnippetProgram, DEFAULT_CHUNK_LINES
+from parm.api.common import SingleSearch, find_all
+from parm.api.exceptions import NoMatches, TooManyMatches
+from parm.api.match_result import MatchResult
+from parm.api.symbols import Symbol, SymbolTable
+from parm.api.parallel import ProgramPool, _merge_matches, _parallel_matches
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, build_arm_elf
+from parm.tests.arm_pat_compiler_test import Interpreted
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def load_code(args):
+    if args.binary is None:
+        return ARM_CORPUS_ADDRESS, ARM_CORPUS * args.copies
+
+    path = Path(args.binary)
+    with path.open('rb') as bf:
+        is_elf = is_elf_file(bf)
+    if is_elf:
+        return read_elf_code(path)
+    return 0, path.read_bytes()
+
+
+def report(name, count, elapsed, baseline=None):
+    line = f'{name:<24} {elapsed:10.3f}s {count / elapsed:14.0f} inst/s'
+    if baseline is not None:
+        line += f'  (x{baseline / elapsed:.1f})'
+    print(line)
+
+
+def bench_decoding(args):
+    offset, ops = load_code(args)
+    code_loader = ArmCodeLoader()
+
+    def text_path():
+        return code_loader.load(perform_disassembly(offset, ops, 'arm', 32))
+
+    text_block, text_time = timed(text_path)
+    block, decode_time = timed(perform_decoding, offset, ops, 'arm', 32)
+    assert block == text_block
+
+    count = len(block.lines)
+    report('text round-trip', count, text_time)
+    report('direct decoding', count, decode_time, text_time)
+
+
+def bench_lazy(args):
+    offset, ops = load_code(args)
+    fobj = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        fobj.write(ops)
+        fobj.close()
+        path = Path(fobj.name)
+
+        def touch(program, count=16):
+            step = len(ops) // count // 4 * 4
+            for i in range(count):
+                program.create_cursor(offset + i * step).next()
+            return program
+
+        eager, eager_time = timed(lambda: touch(CapstoneProgram.load_binary(path, 'arm', 32, offset)))
+        lazy, lazy_time = timed(lambda: touch(LazyCapstoneProgram.load_binary(path, 'arm', 32, offset)))
+    finally:
+        os.remove(fobj.name)
+
+    count = len(ops) // 4
+    report('eager load + touch', count, eager_time)
+    report('lazy open + touch', count, lazy_time, eager_time)
+    print(f'lazy pages decoded: {len(lazy.page_cache)} / {lazy.page_cache.max_pages} max')
+
+
+def bench_parallel(args):
+    offset, ops = load_code(args)
+
+    block, serial_time = timed(perform_decoding, offset, ops, 'arm', 32)
+    count = len(block.lines)
+    report('serial decoding', count, serial_time)
+
+    for workers in args.workers:
+        parallel, parallel_time = timed(
+            perform_parallel_decoding, offset, ops, 'arm', 32, workers, args.chunk_size)
+        assert parallel == block
+        report(f'{workers} workers', count, parallel_time, serial_time)
+
+
+def bench_cache(args):
+    offset, ops = load_code(args)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'target.elf'
+        path.write_bytes(build_arm_elf(ops, offset))
+        cache = DisassemblyCache(Path(tmp_dir) / 'cache')
+
+        _, cold_time = timed(CapstoneProgram.load_arm_elf, path, cache=cache)
+        program, warm_time = timed(CapstoneProgram.load_arm_elf, path, cache=cache)
+
+    count = len(program.asm_cursors)
+    report('cold load (decode)', count, cold_time)
+    report('warm load (cache)', count, warm_time, cold_time)
+
+
+def bench_memory(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    block = perform_decoding(offset, ops, 'arm', 32)
+    gc.collect()
+    graph_size = tracemalloc.get_traced_memory()[0] - base
+
+    program.add_code_block(block)
+    del block
+    gc.collect()
+    store_size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    count = len(program.asm_cursors)
+    print(f'{"instruction objects":<24} {graph_size / count:10.1f} bytes/inst')
+    print(f'{"columnar store":<24} {store_size / count:10.1f} bytes/inst  (x{graph_size / store_size:.1f})')
+
+
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+from parm.programs.snippet import ArmSnippetProgram
+ArmSnippetProgram()
+first = time.perf_counter()
+ArmSnippetProgram()
+print(first - start, time.perf_counter() - first)
+'''
+
+
+def bench_startup(args):
+    def run(cache_dir):
+        env = dict(os.environ, PARM_CACHE_DIR=cache_dir)
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], env=env)
+        return [float(t) for t in output.split()]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold, cold_second = run(cache_dir)
+        warm, warm_second = run(cache_dir)
+
+    print(f'{"cold start":<24} {cold:10.3f}s')
+    print(f'{"warm start (disk cache)":<24} {warm:10.3f}s  (x{cold / warm:.1f})')
+    print(f'{"another program":<24} {max(cold_second, warm_second):10.3f}s')
+
+
+def bench_grammar(args):
+    offset, ops = load_code(args)
+    listing = perform_disassembly(offset, ops, 'arm', 32)
+    count = listing.count('\n') + 1
+
+    earley_block, earley_time = timed(ArmCodeLoader('earley').load, listing)
+    lalr_block, lalr_time = timed(ArmCodeLoader('lalr').load, listing)
+    assert lalr_block == earley_block
+
+    print(f'{"earley":<24} {earley_time:10.3f}s {count / earley_time:14.0f} lines/s')
+    print(f'{"lalr":<24} {lalr_time:10.3f}s {count / lalr_time:14.0f} lines/s  (x{earley_time / lalr_time:.1f})')
+
+
+def bench_stream(args):
+    offset, ops = load_code(args)
+    listing = perform_disassembly(offset, ops, 'arm', 32)
+    count = listing.count('\n') + 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'listing.txt'
+        path.write_text(listing)
+        del listing
+
+        def whole():
+            ArmSnippetProgram(parser='lalr').add_code_block(path.read_text())
+
+        def streamed():
+            with path.open() as f:
+                ArmSnippetProgram(parser='lalr').add_code_stream(f, args.chunk_lines)
+
+        for name, func in [('whole listing', whole), (f'stream ({args.chunk_lines} lines)', streamed)]:
+            tracemalloc.start()
+            _, elapsed = timed(func)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{name:<24} {elapsed:10.3f}s {count / elapsed:14.0f} lines/s {peak / 2 ** 20:10.1f} MiB peak')
+
+
+MATCHING_PATTERNS = {
+    'single instruction': 'cmp r0, #5',
+    'any opcode': '* r0, r1',
+    'opcode wildcard': 'b* @:target',
+    'captures': 'mov @:rd, @:rs',
+    'magic constant': 'mov @:rd, #0x1200',
+    'branch target': 'bl 0xFF8',
+    'explicit anchor': """
+        mov* @, @
+        ... {, 4}
+      > bl 0xFF8
+        """,
+    'late branch': """
+        mov* @, @
+        ... {, 4}
+        bl 0xFF8
+        """,
+    'prologue': """
+        push {*}
+        add fp, sp, #@
+        ... {1}
+        mov r0, #@
+        """,
+    'skip': """
+        push {*}
+        ...
+        pop {*:regs}
+        """,
+}
+
+
+def bench_matching(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+
+    for name, text in MATCHING_PATTERNS.items():
+        pattern = program.create_pattern(text)
+        interpreted, interpreted_time = timed(lambda: list(program.find_all(Interpreted(pattern), MatchResult())))
+        compiled, compiled_time = timed(lambda: list(program.find_all(pattern, MatchResult())))
+        assert compiled == interpreted
+        report(f'{name} (interpreted)', count, interpreted_time)
+        report(f'{name} (compiled)', count, compiled_time, interpreted_time)
+
+
+def bench_index(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+
+    for name, text in MATCHING_PATTERNS.items():
+        pattern = program.create_pattern(text)
+        gc.collect()
+        scanned, scanned_time = timed(lambda: list(find_all(pattern, program.asm_cursors, MatchResult())))
+        # The first search builds the index
+        gc.collect()
+        _, build_time = timed(lambda: list(program.find_all(pattern, MatchResult())))
+        gc.collect()
+        indexed, indexed_time = timed(lambda: list(program.find_all(pattern, MatchResult())))
+        assert indexed == scanned
+        report(f'{name} (scan)', count, scanned_time)
+        report(f'{name} (1st index)', count, build_time, scanned_time)
+        report(f'{name} (index)', count, indexed_time, scanned_time)
+
+
+def bench_batch(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+    patterns = [program.create_pattern(text) for text in MATCHING_PATTERNS.values()] * args.repeat
+
+    def separately():
+        searches = [SingleSearch(pattern, MatchResult()) for pattern in patterns]
+        for search in searches:
+            program.run_searches([search])
+        return searches
+
+    def together():
+        searches = [SingleSearch(pattern, MatchResult()) for pattern in patterns]
+        program.run_searches(searches)
+        return searches
+
+    # Build the index
+    together()
+    gc.collect()
+    single, single_time = timed(separately)
+    gc.collect()
+    batched, batched_time = timed(together)
+    assert [s.done for s in single] == [s.done for s in batched]
+    report(f'{len(patterns)} separate passes', count, single_time)
+    report('single pass', count, batched_time, single_time)
+
+
+def bench_parallel_matching(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+
+    for name in ['any opcode', 'late branch', 'skip']:
+        pattern = program.create_pattern(MATCHING_PATTERNS[name])
+        # Build the index
+        program.candidate_cursors(pattern)
+        serial_result = MatchResult()
+        serial, serial_time = timed(lambda: list(program.find_all(pattern, serial_result)))
+        report(f'{name} (serial)', count, serial_time)
+        for workers in args.workers:
+            parallel_result = MatchResult()
+            parallel, parallel_time = timed(lambda: list(program.find_all(pattern, parallel_result, workers=workers)))
+            assert parallel == serial and parallel_result.to_obj() == serial_result.to_obj()
+            report(f'{name} ({workers} workers)', count, parallel_time, serial_time)
+
+        # The part run by this process, merging the scopes pickled by the workers (rather than matching again at the
+        # matches), bounds the speedup
+        cursors = program.candidate_cursors(pattern)
+        matched = _parallel_matches(pattern, cursors, MatchResult(), 1, {})
+        for merged, scopes in [('merge', matched), ('replay', dict.fromkeys(matched))]:
+            merge_time = min(timed(lambda: list(_merge_matches(pattern, cursors, MatchResult(), scopes, {})))[1]
+                             for _ in range(3))
+            print(f'{name} ({merged}, {len(matched)} matches) {merge_time:.3f}s, '
+                  f'at most x{serial_time / merge_time:.0f} faster')
+
+
+def bench_parallel_single(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+
+    def find_single(pattern, **kwargs):
+        try:
+            return program.find_single(pattern, MatchResult(), **kwargs)
+        except (NoMatches, TooManyMatches) as e:
+            return type(e)
+
+    # Scanning the whole program without a match, and stopping at a second match
+    for name, text in [('no match', '* r12, r11'), ('any opcode', MATCHING_PATTERNS['any opcode'])]:
+        pattern = program.create_pattern(text)
+        program.candidate_cursors(pattern)
+        serial, serial_time = timed(find_single, pattern)
+        report(f'{name} (serial)', count, serial_time)
+        for workers in args.workers:
+            parallel, parallel_time = timed(find_single, pattern, workers=workers)
+            assert parallel == serial
+            report(f'{name} ({workers} workers)', count, parallel_time, serial_time)
+
+
+def bench_threads(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    program.freeze()
+    count = len(program.asm_cursors)
+    patterns = [program.create_pattern(text) for text in MATCHING_PATTERNS.values()] * args.repeat
+
+    def search(pattern):
+        return list(program.find_all(pattern, MatchResult()))
+
+    serial, serial_time = timed(lambda: [search(pattern) for pattern in patterns])
+    report(f'{len(patterns)} searches', count, serial_time)
+    for threads in args.threads:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            threaded, threaded_time = timed(lambda: list(executor.map(search, patterns)))
+        assert threaded == serial
+        report(f'{threads} threads', count, threaded_time, serial_time)
+
+
+def worker_memory(pid):
+    """
+    :returns: The memory of a process shared with others, and private to it (in bytes).
+    """
+    sizes = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                sizes[name] = int(value.split()[0]) * 1024
+    return sizes['Shared_Clean'] + sizes['Shared_Dirty'], sizes['Private_Clean'] + sizes['Private_Dirty']
+
+
+def bench_pool_memory(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    program.add_code_block(perform_decoding(offset, ops, 'arm', 32))
+    count = len(program.asm_cursors)
+    texts = list(MATCHING_PATTERNS.values()) * args.repeat
+
+    for freeze_gc in [False, True]:
+        with ProgramPool(program, args.workers, freeze_gc=freeze_gc) as pool:
+            _, elapsed = timed(lambda: [list(pool.find_all(text, MatchResult())) for text in texts])
+            memory = [worker_memory(pid) for pid in pool.pids]
+        shared = sum(s for s, _ in memory) / len(memory) / 2 ** 20
+        private = sum(p for _, p in memory) / len(memory) / 2 ** 20
+        name = 'gc frozen' if freeze_gc else 'gc not frozen'
+        report(f'{name}', count, elapsed)
+        print(f'{"":<24} {shared:10.1f} MB shared, {private:.1f} MB private per worker')
+
+
+def bench_symbols(args):
+    for count in args.symbols:
+        symbols = [Symbol(f'sub_{address:X}', address, 0x40) for address in range(0, count * 0x40, 0x40)]
+        table, build_time = timed(SymbolTable, symbols)
+        _, find_time = timed(lambda: [table.find(symbol.name) for symbol in symbols])
+        _, nearest_time = timed(lambda: [table.nearest(symbol.address + 0x20) for symbol in symbols])
+        print(f'{count:>8} symbols  build {build_time * 1000:8.3f}ms  find {find_time / count * 1e6:6.3f}us  '
+              f'nearest {nearest_time / count * 1e6:6.3f}us')
+
+
+def bench_data_blocks(args):
+    for regions in args.regions:
+        program = ArmSnippetProgram()
+        addresses = list(range(0, regions * 0x100, 0x100))
+        _, add_time = timed(lambda: [program.add_data_block(a, b'\x00' * 0x10) for a in addresses])
+        _, read_time = timed(lambda: [program.read_bytes(a + 4, 4) for a in addresses])
+        # Coalescing all regions into one, a chunk at a time
+        _, merge_time = timed(lambda: [program.add_data_block(a + 0x10, b'\x00' * 0xF0) for a in addresses])
+        assert len(program._data_blocks) == 1
+        print(f'{regions:>6} regions  add {add_time / regions * 1e6:6.2f}us  read {read_time / regions * 1e6:6.2f}us  '
+              f'merge {merge_time / regions * 1e6:6.2f}us')
+
+
+def private_size():
+    # Resident pages, other than those of mapped files (which are clean, shared and may be reclaimed)
+    with open('/proc/self/statm') as f:
+        _size, resident, shared, *_ = map(int, f.read().split())
+    return (resident - shared) * os.sysconf('SC_PAGE_SIZE')
+
+
+def bench_mapped_data(args):
+    size = args.size << 20
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'target.elf'
+        path.write_bytes(build_arm_elf(ARM_CORPUS, data=(0x100000, os.urandom(size))))
+        addresses = range(0x100000, 0x100000 + size - 4, size // 1000)
+
+        def load_and_read(blocks):
+            program = ArmSnippetProgram()
+            _, load_time = timed(lambda: [program.add_data_block(address, data) for address, data in blocks()])
+            _, read_time = timed(lambda: [program.read_bytes(address, 4) for address in addresses])
+            return load_time, read_time, private_size()
+
+        for name, blocks in [
+                ('mapped', lambda: map_elf_data(path)),
+                ('read', lambda: [(address, bytes(data)) for address, data in map_elf_data(path)])]:
+            gc.collect()
+            before = private_size()
+            load_time, read_time, after = load_and_read(blocks)
+            print(f'{name:<24} load {load_time * 1000:8.3f}ms  {len(addresses)} reads {read_time * 1000:8.3f}ms  '
+                  f'private +{(after - before) / 2 ** 20:.1f} MB')
+
+
+def bench_shared(args):
+    offset, ops = load_code(args)
+    program = CapstoneProgram()
+    block, decode_time = timed(perform_decoding, offset, ops, 'arm', 32)
+    program.add_code_block(block)
+    count = len(program.asm_cursors)
+    report('decode', count, decode_time)
+
+    image, export_time = timed(program.export_shared)
+    with image:
+        report('export', count, export_time)
+        print(f'{"image size":<24} {image.size / count:10.1f} bytes/inst')
+        # Including building the code index of the attached program
+        attached = CapstoneProgram()
+        _, attach_time = timed(attached.attach_shared, SharedProgramImage.attach(image.name))
+        report('attach', count, attach_time, decode_time)
+
+        for name, text in MATCHING_PATTERNS.items():
+            expected = [c.address_val for c in program.find_all(text, MatchResult())]
+            assert [c.address_val for c in attached.find_all(text, MatchResult())] == expected, name
+        attached._shared_image.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='parm benchmarks')
+    parser.add_argument('-b', '--binary', default=None, help='An ELF or raw ARM binary (defaults to a synthetic one)')
+    parser.add_argument('-c', '--copies', type=int, default=20, help='Copies of the builtin corpus to use')
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    subparsers.add_parser('decoding').set_defaults(func=bench_decoding)
+    subparsers.add_parser('lazy').set_defaults(func=bench_lazy)
+    subparsers.add_parser('cache').set_defaults(func=bench_cache)
+    subparsers.add_parser('memory').set_defaults(func=bench_memory)
+    subparsers.add_parser('startup').set_defaults(func=bench_startup)
+    subparsers.add_parser('grammar').set_defaults(func=bench_grammar)
+    subparsers.add_parser('matching').set_defaults(func=bench_matching)
+    subparsers.add_parser('index').set_defaults(func=bench_index)
+
+    batch = subparsers.add_parser('batch')
+    batch.add_argument('-r', '--repeat', type=int, default=10, help='Copies of the matching patterns to search for')
+    batch.set_defaults(func=bench_batch)
+
+    stream = subparsers.add_parser('stream')
+    stream.add_argument('--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES)
+    stream.set_defaults(func=bench_stream)
+
+    parallel = subparsers.add_parser('parallel')
+    parallel.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parallel.add_argument('--chunk-size', type=lambda x: int(x, 0), default=DEFAULT_CHUNK_SIZE)
+    parallel.set_defaults(func=bench_parallel)
+
+    parallel_matching = subparsers.add_parser('parallel-matching')
+    parallel_matching.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parallel_matching.set_defaults(func=bench_parallel_matching)
+
+    parallel_single = subparsers.add_parser('parallel-single')
+    parallel_single.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parallel_single.set_defaults(func=bench_parallel_single)
+
+    threads = subparsers.add_parser('threads')
+    threads.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    threads.add_argument('-r', '--repeat', type=int, default=4, help='Copies of the matching patterns to search for')
+    threads.set_defaults(func=bench_threads)
+
+    subparsers.add_parser('shared').set_defaults(func=bench_shared)
+
+    mapped_data = subparsers.add_parser('mapped-data')
+    mapped_data.add_argument('-s', '--size', type=int, default=256, help='The size of the data segment (in MB)')
+    mapped_data.set_defaults(func=bench_mapped_data)
+
+    symbols = subparsers.add_parser('symbols')
+    symbols.add_argument('-n', '--symbols', type=int, nargs='+', default=[1000, 100000, 1000000])
+    symbols.set_defaults(func=bench_symbols)
+
+    data_blocks = subparsers.add_parser('data-blocks')
+    data_blocks.add_argument('-n', '--regions', type=int, nargs='+', default=[1000, 10000, 100000])
+    data_blocks.set_defaults(func=bench_data_blocks)
+
+    pool_memory = subparsers.add_parser('pool-memory')
+    pool_memory.add_argument('-w', '--workers', type=int, default=4)
+    pool_memory.add_argument('-r', '--repeat', type=int, default=4, help='Copies of the matching patterns to search for')
+    pool_memory.set_defaults(func=bench_pool_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
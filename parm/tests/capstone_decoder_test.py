@@ -0,0 +1,85 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import pytest
+
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_asm import Instruction, Reg, Immediate, ShiftedReg, MemAccessOffset, MemAccessPostIndexed
+from parm.programs.capstone import CapstoneProgram, perform_disassembly, perform_decoding, perform_parallel_decoding
+from parm.programs.snippet import ArmCodeLoader
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, ARM_EXTRA_CORPUS
+
+
+# noinspection PyMethodMayBeStatic
+class CapstoneDecoderTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.code_loader = ArmCodeLoader()
+
+    def test_identical_to_text_path(self):
+        listing = perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32)
+        expected = self.code_loader.load(listing)
+        decoded = perform_decoding(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32)
+
+        assert len(decoded.lines) == len(expected.lines)
+        for dec_line, exp_line in zip(decoded, expected):
+            assert dec_line == exp_line
+            assert repr(dec_line) == repr(exp_line)
+        assert decoded.terminal == expected.terminal
+
+    def test_shifted_operands(self):
+        block = perform_decoding(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32)
+        insts = {str(line.address): line.instruction for line in block}
+        assert insts['0x1034'] == Instruction('ldr', [Reg('r3'), MemAccessPostIndexed(Reg('r0'), ShiftedReg(Reg('r1')))])
+        assert insts['0x1088'] == Instruction('lsl', [Reg('r0'), Reg('r1'), Immediate(3)])
+        assert insts['0x108C'] == Instruction('lsr', [Reg('r0'), Reg('r1'), Reg('r2')])
+
+    def test_unsupported_instructions(self):
+        block = perform_decoding(0, ARM_EXTRA_CORPUS, 'arm', 32)
+        insts = [line.instruction for line in block]
+        assert insts == [
+            Instruction('mvn', [Reg('r0'), Immediate(0)]),
+            Instruction('ldr', ['r2, [r0, -r1]']),
+            Instruction('tst', [Reg('r0'), Immediate(1)]),
+            Instruction('svc', [Immediate(0)]),
+            Instruction('nop', []),
+        ]
+
+    def test_load_binary(self):
+        fobj = tempfile.NamedTemporaryFile(delete=False)
+        try:
+            fobj.write(ARM_CORPUS)
+            fobj.close()
+            prg = CapstoneProgram.load_arm_binary(Path(fobj.name))
+        finally:
+            os.remove(fobj.name)
+
+        mr = MatchResult()
+        prg.find_single('test: cmp r0, #@:val', match_result=mr)
+        assert mr['test'].address == 0x78
+        assert mr['val'] == 5
+
+        assert prg.create_cursor(0x20).instruction == Instruction('ldr', [Reg('r1'), MemAccessOffset(Reg('r0'))])
+
+    def test_parallel_decoding(self):
+        ops = ARM_CORPUS * 3
+        expected = perform_decoding(ARM_CORPUS_ADDRESS, ops, 'arm', 32)
+        decoded = perform_parallel_decoding(ARM_CORPUS_ADDRESS, ops, 'arm', 32, workers=2, chunk_size=0x24)
+        assert decoded == expected
+
+        prg = CapstoneProgram(decoded)
+        seam = prg.create_cursor(ARM_CORPUS_ADDRESS + 0x24)
+        assert seam.prev().address_val == ARM_CORPUS_ADDRESS + 0x20
+        assert seam.prev().next() == seam
+
+    def test_parallel_decoding_stops_at_invalid(self):
+        ops = ARM_CORPUS[:0x28] + bytes.fromhex('ffffffff') + ARM_CORPUS
+        expected = perform_decoding(0, ops, 'arm', 32)
+        decoded = perform_parallel_decoding(0, ops, 'arm', 32, workers=2, chunk_size=0x10)
+        assert len(decoded.lines) == 10
+        assert decoded == expected
+
+        with pytest.raises(ValueError):
+            perform_parallel_decoding(0, ops, 'arm', 32, chunk_size=6)
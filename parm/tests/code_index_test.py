@@ -0,0 +1,227 @@
+import pytest
+from unittest import TestCase
+
+from parm.api.common import find_all, find_first, find_single
+from parm.api.exceptions import NoMatches, TooManyMatches
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_asm import Address, Line, Instruction, Reg, Immediate
+from parm.api.pattern import AnchorLine
+from parm.programs.capstone import perform_disassembly
+from parm.programs.code_index import CodeIndex
+from parm.programs.code_store import CodeStore
+from parm.programs.snippet import ArmSnippetProgram
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
+from parm.tests.arm_pat_compiler_test import PATTERNS
+
+RUN_PATTERNS = [
+    """
+    push {*}
+    ... {2, 4}
+    mov r0, #@:imm
+    ...
+    cmp r0, #@
+    """,
+    """
+    push {*}
+    ...
+  > bl 0xFF8
+    """,
+    """
+    sub sp, sp, #@
+    ... {, 6}
+  > movs @, @
+    ... {1}
+    mov r0, #@
+    """,
+    'bl* 0xFF8',
+    'b* 0xFE8',
+    'mov* @:rd, #0xff000000',
+    """
+    adds @, @, @
+    ... {1}
+    rsb @:rd, @, #0
+    """,
+    """
+    push {*}
+    add @, @, #@
+    ... {1}
+    mov r0, #@
+    """,
+    """
+    cmn r0, #@
+    ... {4}
+    adds @, @, @
+    """,
+    """
+    * r0, r1
+    ... {1}
+    adc @:rd, @, @
+    """,
+]
+
+
+def _line(address, opcode):
+    return Line(Instruction(opcode, [Reg('r0')]), Address(address))
+
+
+def search(find, pattern, cursors):
+    try:
+        if find is find_all:
+            return [c.address_val for c in find(pattern, cursors, MatchResult())]
+        return find(pattern, cursors, MatchResult()).address_val
+    except Exception as e:
+        return type(e)
+
+
+# noinspection PyMethodMayBeStatic
+class CodeIndexTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = ArmSnippetProgram(parser='lalr')
+        self.program.add_code_block(perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32))
+
+    def test_postings(self):
+        store = CodeStore()
+        index = CodeIndex(store)
+        store.add_block([_line(0, 'ldr'), _line(4, 'LDRB'), _line(8, 'str'), _line(12, 'ldr')])
+        assert list(index.opcode_postings('ldr'.__eq__)) == [0, 3]
+        assert list(index.opcode_postings(lambda opcode: opcode.startswith('ldr'))) == [0, 1, 3]
+        assert list(index.opcode_postings('push'.__eq__)) == []
+
+        # The index is extended as code is added
+        store.extend_block([_line(16, 'ldrb')])
+        store.add_block([_line(32, 'str'), _line(36, 'ldr')])
+        assert list(index.opcode_postings('ldr'.__eq__)) == [0, 3, 6]
+        assert list(index.opcode_postings(lambda opcode: opcode.startswith('ldr'))) == [0, 1, 3, 4, 6]
+
+    def test_run_postings(self):
+        store = CodeStore()
+        index = CodeIndex(store)
+        store.add_block([_line(0, 'push'), _line(4, 'mov'), _line(8, 'ldr'), _line(12, 'push'), _line(16, 'mov')])
+        store.add_block([_line(32, 'ldr'), _line(36, 'push'), _line(40, 'str'), _line(44, 'ldr')])
+        assert list(index.run_postings([AnchorLine(0, 'push'.__eq__), AnchorLine(1, 'mov'.__eq__)])) == [0, 3]
+        # Runs don't cross blocks
+        assert list(index.run_postings([AnchorLine(0, 'mov'.__eq__), AnchorLine(1, 'ldr'.__eq__)])) == [1]
+        # Gaps of exact skips
+        assert list(index.run_postings([AnchorLine(0, 'push'.__eq__), AnchorLine(2, 'ldr'.__eq__)])) == [0, 6]
+        assert list(index.run_postings([AnchorLine(1, 'mov'.__eq__)])) == [0, 3]
+        assert list(index.run_postings([AnchorLine(0, 'push'.__eq__), AnchorLine(3, lambda opcode: True)])) == [0]
+
+    def test_operands(self):
+        program = ArmSnippetProgram()
+        program.add_code_block("""
+            0x1000: mov r0, #0x1234
+            0x1004: bl 0x2000
+            0x1008: ldr r1, [pc, #4]
+            0x100C: mov r1, #0x1234
+            0x1010: ldr r2, [pc, #-16]
+            0x1014: b 0x1008
+            0x1018: bx lr
+            """)
+        index = program._code_index
+        assert list(index.operand_postings(Immediate(0x1234))) == [0, 3]
+        assert list(index.operand_postings(Immediate(0x4321))) == []
+        assert list(index.reference_postings(0x2000)) == [1]
+        # PC-relative literals, and branch targets
+        assert [c.address_val for c in program.referencing_cursors(0x1014)] == [0x1008]
+        assert [c.address_val for c in program.referencing_cursors(0x1008)] == [0x1010, 0x1014]
+
+        assert [c.address_val for c in program.candidate_cursors(program.create_pattern('mov* @, #0x1234'))] == [
+            0x1000, 0x100C]
+        assert len(program.candidate_cursors(program.create_pattern('mov @, #0x4321'))) == 0
+        assert [c.address_val for c in program.candidate_cursors(program.create_pattern('bl 0x2000'))] == [0x1004]
+        # Address patterns also accept operands of other types
+        assert [c.address_val for c in program.candidate_cursors(program.create_pattern('b* 0x2000'))] == [
+            0x1004, 0x1018]
+
+    def test_candidates(self):
+        cursors = self.program.candidate_cursors(self.program.create_pattern('b* @'))
+        assert len(cursors) > 0
+        assert all(c.instruction.opcode.startswith('b') for c in cursors)
+        assert [c.address_val for c in reversed(cursors)] == [c.address_val for c in cursors][::-1]
+
+        pattern = self.program.create_pattern("""
+            push {*}
+            add fp, sp, #@
+            """)
+        cursors = self.program.candidate_cursors(pattern)
+        assert 0 < len(cursors) < len(self.program.candidate_cursors(self.program.create_pattern('push {*}')))
+        assert all(c.next().instruction.opcode == 'add' for c in cursors)
+
+        # Lines before an explicit anchor, and past skips, filter the cursors as well
+        pattern = self.program.create_pattern("""
+            push {*}
+            ...
+          > bl 0xFF8
+            """)
+        assert [c.address_val for c in self.program.candidate_cursors(pattern)] == [0x1064]
+
+        # Patterns that start with code (or only have instructions past it) search all cursors
+        for text in ["% goto_next('mov r0, r1')", '* r0, r1', "mov r0, r1\n% goto_next('mov r0, r1')\n  > bx lr"]:
+            assert self.program.candidate_cursors(self.program.create_pattern(text)) is self.program.asm_cursors
+
+    def test_plan(self):
+        program = ArmSnippetProgram()
+        program.add_code_block("""
+            0x1000: mov r0, r1
+            0x1004: mov r1, #1
+            0x1008: mov r2, #1
+            0x100C: bl 0x2000
+            0x1010: mov r3, #1
+            0x1014: mov r0, r1
+            0x1018: bl 0x3000
+            """)
+        pattern = program.create_pattern("""
+            mov @, @
+            mov @, #1
+            ... {, 2}
+            bl @
+            """)
+        plan = program._code_index.plan(pattern.anchor_run())
+        assert (plan.line.offset, plan.postings, plan.estimate) == (1, 'immediate', 3)
+        assert [c.address_val for c in program.candidate_cursors(pattern)] == [0x1000, 0x1004]
+        assert [c.address_val for c in program.find_all(pattern, MatchResult())] == [0x1000]
+
+        pattern = program.create_pattern("""
+            mov @, @
+          > bl 0x2000
+            """)
+        plan = program._code_index.plan(pattern.anchor_run())
+        assert (plan.line.offset, plan.postings, plan.estimate) == (0, 'address', 1)
+        assert [c.address_val for c in program.candidate_cursors(pattern)] == [0x100C]
+
+    def test_equivalence(self):
+        all_cursors = self.program.asm_cursors
+        for text in PATTERNS + RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            candidates = self.program.candidate_cursors(pattern)
+
+            for find, cursors, all_cursors_ in [
+                    (find_all, candidates, all_cursors),
+                    (find_first, candidates, all_cursors),
+                    (find_first, reversed(candidates), reversed(all_cursors)),
+                    (find_single, candidates, all_cursors)]:
+                assert search(find, pattern, cursors) == search(find, pattern, all_cursors_), text
+
+    def test_scopes(self):
+        # find_all opens a scope per cursor of the program, whether it scans them all or only the candidates
+        for text in ['mov @:rd, #@:imm', 'b* @:target', 'push {*}\nadd fp, sp, #@:size', '* r0, @:reg']:
+            scanned = MatchResult()
+            scanned_matches = list(find_all(self.program.create_pattern(text), self.program.asm_cursors, scanned))
+            indexed = MatchResult()
+            assert list(self.program.find_all(text, indexed)) == scanned_matches
+            assert len(indexed.subs[0]) == len(self.program.asm_cursors)
+            assert indexed.to_obj() == scanned.to_obj(), text
+
+    def test_find_single(self):
+        program = ArmSnippetProgram()
+        program.add_code_block("""
+            0x1000: mov r0, r1
+            0x1004: mov r1, r2
+            0x1008: bx lr
+            """)
+        assert program.find_single('mov r1, @', MatchResult()).address_val == 0x1004
+        with pytest.raises(TooManyMatches):
+            program.find_single('mov* @, @', MatchResult())
+        with pytest.raises(NoMatches):
+            program.find_single('push {*}', MatchResult())
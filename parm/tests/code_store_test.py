@@ -0,0 +1,92 @@
+import pytest
+from unittest import TestCase
+
+from parm.api.exceptions import InvalidAccess
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_asm import Address, Line, Instruction, Reg, Immediate, ShiftedReg
+from parm.programs.code_store import CodeStore
+from parm.programs.snippet import ArmSnippetProgram, CodeCursor, PreInitCursor, PostTermCursor
+
+
+# noinspection PyMethodMayBeStatic
+class CodeStoreTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = ArmSnippetProgram()
+        self.program.add_code_block("""
+            0x1000: mov r0, #1
+            0x1004: mov r1, #1
+            0x1008: add r0, r0, r1
+            0x100C: bx lr
+            """)
+        self.program.add_code_block("""
+            0x2008: mov r1, #1
+            0x2000: mov r0, #1
+            """)
+
+    def test_instructions(self):
+        assert [str(c.instruction) for c in self.program.asm_cursors] == [
+            'mov r0, #1', 'mov r1, #1', 'add r0, r0, r1', 'bx lr', 'mov r1, #1', 'mov r0, #1']
+        assert [c.address_val for c in reversed(self.program.asm_cursors)] == [
+            0x2000, 0x2008, 0x100C, 0x1008, 0x1004, 0x1000]
+
+    def test_interning(self):
+        store = CodeStore()
+        store.add_block([
+            Line(Instruction('mov', [Reg('r0'), Immediate(1)]), Address(0)),
+            Line(Instruction('mov', [Reg('r0'), Immediate(1)]), Address(4)),
+            Line(Instruction('mov', [Reg('r1'), Immediate(1)]), Address(8)),
+        ])
+        assert store.opcodes == ['mov']
+        assert store.operands == [Reg('r0'), Immediate(1), Reg('r1')]
+        assert store.instruction(2) == Instruction('mov', [Reg('r1'), Immediate(1)])
+        assert store.find(4) == 1
+        assert store.find(6) is None
+
+    def test_find(self):
+        for address in [0x1000, 0x1004, 0x1008, 0x100C, 0x2000, 0x2008]:
+            cursor = self.program.create_cursor(address)
+            assert isinstance(cursor, CodeCursor)
+            assert cursor.address_val == address
+            assert cursor == self.program.create_cursor(address)
+        with pytest.raises(InvalidAccess):
+            self.program.create_cursor(0x1010)
+
+    def test_unaddressed_block(self):
+        cursor = self.program.add_code_block('mov r0, r1\nmov r1, r2')
+        assert cursor.address is None
+        assert cursor.next().instruction == Instruction('mov', [Reg('r1'), ShiftedReg(Reg('r2'))])
+        assert cursor.next().prev() == cursor
+
+    def test_next_prev(self):
+        cursor = self.program.create_cursor(0x100C)
+        assert cursor.prev().address_val == 0x1008
+        assert isinstance(cursor.next(), PostTermCursor)
+        assert cursor.next().prev() == cursor
+
+        cursor = self.program.create_cursor(0x2008)
+        assert isinstance(cursor.prev(), PreInitCursor)
+        assert cursor.prev().next() == cursor
+        assert cursor.next().address_val == 0x2000
+
+    def test_skip(self):
+        cursor = self.program.create_cursor(0x1000)
+        assert cursor.skip(3).address_val == 0x100C
+        assert cursor.skip(3).skip(-2).address_val == 0x1004
+        assert isinstance(cursor.skip(4), PostTermCursor)
+        assert isinstance(cursor.skip(-1), PreInitCursor)
+        with pytest.raises(InvalidAccess):
+            cursor.skip(5)
+        with pytest.raises(InvalidAccess):
+            cursor.skip(-2)
+
+    def test_exact_skip_pattern(self):
+        pattern = self.program.create_pattern("""
+            a: mov r0, #1
+            ...{2}
+            b: bx lr
+            """)
+        mr = MatchResult()
+        self.program.find_single(pattern, match_result=mr)
+        assert mr['a'].address == 0x1000
+        assert mr['b'].address == 0x100C
@@ -0,0 +1,60 @@
+import io
+import pytest
+from unittest import TestCase
+
+from parm.api.parsing.arm_asm import Address
+from parm.programs.capstone import perform_disassembly
+from parm.programs.snippet import ArmSnippetProgram, PostTermCursor
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
+
+
+# noinspection PyMethodMayBeStatic
+class CodeStreamTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listing = perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32)
+
+    def test_identical_to_code_block(self):
+        expected = ArmSnippetProgram(parser='lalr')
+        expected.add_code_block(self.listing)
+        program = ArmSnippetProgram(parser='lalr')
+        first = program.add_code_stream(io.StringIO(self.listing), chunk_lines=7)
+
+        assert first.address_val == ARM_CORPUS_ADDRESS
+        assert [(c.address, c.instruction) for c in program.asm_cursors] == \
+               [(c.address, c.instruction) for c in expected.asm_cursors]
+        assert first.skip(20).prev().address_val == ARM_CORPUS_ADDRESS + 19 * 4
+        assert program.create_cursor(ARM_CORPUS_ADDRESS + 0x78).instruction == \
+               expected.create_cursor(ARM_CORPUS_ADDRESS + 0x78).instruction
+
+    def test_incremental(self):
+        program = ArmSnippetProgram(parser='lalr')
+        lines = self.listing.splitlines()
+
+        def read_lines():
+            for i, line in enumerate(lines):
+                # Chunks are parsed and added as soon as they are read
+                assert len(program.asm_cursors) >= i // 5 * 5 - 5
+                yield line
+
+        program.add_code_stream(read_lines(), chunk_lines=5)
+        assert len(program.asm_cursors) == len(lines)
+
+    def test_terminal(self):
+        program = ArmSnippetProgram(parser='lalr')
+        first = program.add_code_stream(['\n', '0x10: mov r0, r1\n', '\n', '0x14: bx lr\n', '0x18:\n', '  \n'], chunk_lines=2)
+        last = first.next()
+        assert isinstance(last.next(), PostTermCursor)
+        assert last.next().address == 0x18
+
+        with pytest.raises(ValueError):
+            program.add_code_stream(['0x20: mov r0, r1', '0x24:', '0x28: bx lr'])
+        with pytest.raises(ValueError):
+            program.add_code_stream(['', '0x30:'])
+
+    def test_unordered_chunks(self):
+        program = ArmSnippetProgram(parser='lalr')
+        program.add_code_stream(['0x10: mov r0, r1', '0x14: mov r0, r1', '0x4: mov r0, r1', '0x8: bx lr'], chunk_lines=2)
+        assert [program.create_cursor(a).address for a in (0x4, 0x8, 0x10, 0x14)] == \
+               [Address(0x4), Address(0x8), Address(0x10), Address(0x14)]
+        assert program.create_cursor(0x14).next().address_val == 0x4
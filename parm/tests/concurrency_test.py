@@ -0,0 +1,77 @@
+import pytest
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+
+from parm.api.exceptions import ProgramFrozen, PatternMismatchException
+from parm.api.match_result import MatchResult
+from parm.api.parsing.arm_pat import PythonCodeBase
+from parm.programs.capstone import LazyCapstoneProgram
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, all_matches, create_program, single_match
+from parm.tests.arm_pat_compiler_test import PATTERNS
+from parm.tests.code_index_test import RUN_PATTERNS
+
+THREADS = 8
+
+
+# noinspection PyMethodMayBeStatic
+class ConcurrencyTest(TestCase):
+    def concurrently(self, func, items, repeat=4):
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            return list(executor.map(func, items * repeat))
+
+    def test_frozen(self):
+        program = create_program()
+        assert not program.frozen
+        program.freeze()
+        assert program.frozen
+        with pytest.raises(ProgramFrozen):
+            program.add_code_block('mov r0, r1')
+        with pytest.raises(ProgramFrozen):
+            program.add_data_block(0x9000, b'\x00')
+        with pytest.raises(ProgramFrozen):
+            program.add_code_stream(['mov r0, r1'])
+        assert list(program.find_all('mov r0, #@', MatchResult()))
+
+    def test_find_all(self):
+        serial_program = create_program()
+        texts = PATTERNS + RUN_PATTERNS
+        expected = [all_matches(serial_program, text) for text in texts]
+
+        program = create_program()
+        program.freeze()
+        results = self.concurrently(lambda text: all_matches(program, text), texts)
+        assert results == expected * 4
+
+    def test_find_single(self):
+        serial_program = create_program()
+        texts = PATTERNS + RUN_PATTERNS
+        expected = [single_match(serial_program, text) for text in texts]
+
+        # Not frozen, the code index is built by the first searches
+        program = create_program()
+        results = self.concurrently(lambda text: single_match(program, text), texts)
+        assert results == expected * 4
+
+    def test_data_cursors(self):
+        program = create_program()
+        program.freeze()
+        addresses = list(range(0x8000, 0x8040, 4))
+        cursors = self.concurrently(program.create_cursor, addresses)
+        for address, cursor in zip(addresses * 4, cursors):
+            assert cursor is program.create_cursor(address)
+
+    def test_var_names(self):
+        def create_vars(_):
+            return [PythonCodeBase._gen_var() for _ in range(1000)]
+
+        names = [name for names in self.concurrently(create_vars, list(range(THREADS)), repeat=1) for name in names]
+        assert len(set(names)) == len(names)
+
+    def test_lazy_program(self):
+        program = LazyCapstoneProgram(page_size=0x40, max_pages=2)
+        program.add_lazy_code(ARM_CORPUS_ADDRESS, ARM_CORPUS)
+        expected = [all_matches(program, text) for text in RUN_PATTERNS]
+        program.freeze()
+        results = self.concurrently(lambda text: all_matches(program, text), RUN_PATTERNS)
+        assert results == expected * 4
+        assert not any(isinstance(r, type) and not issubclass(r, PatternMismatchException) for r in results)
@@ -0,0 +1,81 @@
+import pytest
+from unittest import TestCase
+
+from parm.api.exceptions import InvalidAccess
+from parm.programs.snippet import ArmSnippetProgram
+
+
+# noinspection PyMethodMayBeStatic
+class DataBlocksTest(TestCase):
+    def setUp(self):
+        self.program = ArmSnippetProgram(parser='lalr')
+
+    def blocks(self):
+        return [(block.start_address, bytes(block.data)) for block in self.program._data_blocks]
+
+    def test_disjoint(self):
+        for address in [0x3000, 0x1000, 0x2000]:
+            self.program.add_data_block(address, bytes([address >> 12]) * 4)
+        assert self.blocks() == [(0x1000, b'\x01' * 4), (0x2000, b'\x02' * 4), (0x3000, b'\x03' * 4)]
+        assert self.program.read_bytes(0x2002, 2) == b'\x02\x02'
+        # The end of a block is found, as for streams reading nothing more
+        assert self.program.find_block(0x2004).start_address == 0x2000
+        for address in [0xFFF, 0x2005, 0x4000]:
+            with pytest.raises(InvalidAccess):
+                self.program.find_block(address)
+        with pytest.raises(InvalidAccess):
+            self.program.read_bytes(0x2002, 4)
+
+    def test_adjacent(self):
+        self.program.add_data_block(0x1004, b'\x02\x02')
+        self.program.add_data_block(0x1006, b'\x03')
+        self.program.add_data_block(0x1000, b'\x01' * 4)
+        assert self.blocks() == [(0x1000, b'\x01\x01\x01\x01\x02\x02\x03')]
+
+    def test_adjacent_views(self):
+        # Views are kept as separate blocks rather than copied, unless overlapped
+        data = memoryview(bytes(range(8)))
+        self.program.add_data_block(0x1000, data[:4])
+        self.program.add_data_block(0x1004, data[4:])
+        self.program.add_data_block(0x0FFE, b'\xAA\xAA')
+        assert self.blocks() == [(0x0FFE, b'\xAA\xAA'), (0x1000, bytes(range(4))), (0x1004, bytes(range(4, 8)))]
+        assert all(block.is_view for block in self.program._data_blocks[1:])
+        assert self.program.find_block(0x1004).view(0x1005, 2).obj is data.obj
+        with pytest.raises(InvalidAccess):
+            self.program.read_bytes(0x1002, 4)
+
+        self.program.add_data_block(0x1003, b'\xBB\xBB')
+        assert self.blocks() == [(0x0FFE, b'\xAA\xAA'), (0x1000, b'\x00\x01\x02\xBB\xBB\x05\x06\x07')]
+
+    def test_bridging(self):
+        self.program.add_data_block(0x1000, b'\x01\x01')
+        self.program.add_data_block(0x1004, b'\x02\x02')
+        self.program.add_data_block(0x1008, b'\x03\x03')
+        self.program.add_data_block(0x2000, b'\x04')
+        self.program.add_data_block(0x1002, b'\xAA' * 6)
+        assert self.blocks() == [(0x1000, b'\x01\x01' + b'\xAA' * 6 + b'\x03\x03'), (0x2000, b'\x04')]
+
+    def test_overlapping(self):
+        self.program.add_data_block(0x1000, b'\x01' * 4)
+        self.program.add_data_block(0x0FFE, b'\x02' * 4)
+        self.program.add_data_block(0x1003, b'\x03' * 2)
+        self.program.add_data_block(0x1001, b'\x04')
+        assert self.blocks() == [(0x0FFE, b'\x02\x02\x02\x04\x01\x03\x03')]
+        assert self.program.read_bytes(0x1002, 3) == b'\x01\x03\x03'
+
+    def test_given_data_unchanged(self):
+        data = bytearray(b'\x01\x01')
+        self.program.add_data_block(0x1000, data)
+        self.program.add_data_block(0x1002, b'\x02')
+        self.program.add_data_block(0x1000, b'\x03')
+        assert data == b'\x01\x01'
+        assert self.blocks() == [(0x1000, b'\x03\x01\x02')]
+
+    def test_many_blocks(self):
+        for address in reversed(range(0, 0x10000, 0x10)):
+            self.program.add_data_block(address, address.to_bytes(4, 'little'))
+        assert len(self.program._data_blocks) == 0x1000
+        for address in range(0, 0x10000, 0x10):
+            assert self.program.read_bytes(address, 4) == address.to_bytes(4, 'little')
+            self.program.add_data_block(address + 4, b'\x00' * 12)
+        assert self.blocks() == [(0, b''.join(a.to_bytes(4, 'little') + b'\x00' * 12 for a in range(0, 0x10000, 0x10)))]
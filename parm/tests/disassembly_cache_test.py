@@ -0,0 +1,70 @@
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from parm.api.parsing.arm_asm import Block
+from parm.programs.capstone import CapstoneProgram, decode_cached, decode_elf
+from parm.programs.disassembly_cache import DisassemblyCache
+from parm.tests.arm_corpus import ARM_CORPUS, build_arm_elf
+
+
+# noinspection PyMethodMayBeStatic
+class DisassemblyCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.cache = DisassemblyCache(self.root / 'cache')
+        self.elf_path = self.root / 'target.elf'
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_reload_from_cache(self):
+        expected = decode_elf(self.elf_path, 'arm', 32)
+        decoded = []
+
+        def decode():
+            decoded.append(None)
+            return decode_elf(self.elf_path, 'arm', 32)
+
+        assert decode_cached(self.elf_path, 'arm', 32, self.cache, decode) == expected
+        assert decode_cached(self.elf_path, 'arm', 32, self.cache, decode) == expected
+        assert len(decoded) == 1
+
+    def test_load_arm_elf(self):
+        CapstoneProgram.load_arm_elf(self.elf_path, cache=self.cache)
+        assert len(list(self.cache.cache_dir.iterdir())) == 1
+
+        prg = CapstoneProgram.load_arm_elf(self.elf_path, cache=self.cache)
+        assert str(prg.create_cursor(0x1078).instruction) == 'cmp r0, #5'
+
+    def test_content_change(self):
+        key = DisassemblyCache.key(self.elf_path, 'arm', 32)
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS[:0x10]))
+        assert DisassemblyCache.key(self.elf_path, 'arm', 32) != key
+
+        self.cache.store(key, Block([]))
+        prg = CapstoneProgram.load_arm_elf(self.elf_path, cache=self.cache)
+        assert len(list(prg.asm_cursors)) == 4
+
+    def test_stale_entries(self):
+        key = DisassemblyCache.key(self.elf_path, 'arm', 32)
+        self.cache.store(key, Block([]))
+        entry = self.cache.entry_path(key)
+
+        with entry.open('wb') as f:
+            pickle.dump((0, '0.0.0', '0.0'), f)
+            pickle.dump(Block([]), f)
+        assert self.cache.load(key) is None
+        assert not entry.exists()
+
+        entry.write_bytes(b'garbage')
+        assert self.cache.load(key) is None
+        assert not entry.exists()
+
+        self.cache.store(key, Block([]))
+        assert self.cache.load(key) == Block([])
+        self.cache.clear()
+        assert self.cache.load(key) is None
@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from parm.api.match_result import MatchResult
+from parm.programs.capstone import perform_disassembly
+from parm.programs.snippet import ArmSnippetProgram
+from parm.signature_files.sig_files import MatchingCtx, Signature, format_signature_results
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
+from parm.tests.code_index_test import RUN_PATTERNS
+
+
+# noinspection PyMethodMayBeStatic
+class ExplainTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = ArmSnippetProgram(parser='lalr')
+        self.program.add_code_block(perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32))
+
+    def test_scan(self):
+        explanation = self.program.explain('* r0, r1')
+        assert explanation.anchor is None
+        assert explanation.estimate == explanation.instructions == len(self.program.asm_cursors)
+        assert not explanation.analyzed
+        assert 'scan all cursors' in str(explanation)
+
+    def test_index(self):
+        explanation = self.program.explain("""
+            mov @:rd, @
+            ... {1}
+            add* @:rd, *
+        """)
+        assert explanation.anchor in ('mov @:rd, @', 'add* @:rd, *')
+        assert explanation.postings == 'opcodes'
+        assert len(explanation.checks) == 1
+        assert 0 < explanation.estimate <= explanation.postings_size
+
+    def test_analyze(self):
+        for text in RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            match_result = MatchResult()
+            explanation = self.program.explain(pattern, match_result, analyze=True)
+            assert match_result.to_obj() == MatchResult().to_obj(), text
+            assert explanation.candidates == len(self.program.candidate_cursors(pattern)), text
+            assert explanation.matches == len(list(self.program.find_all(pattern, MatchResult()))), text
+            assert explanation.matches <= explanation.candidates <= explanation.postings_size, text
+            assert 'actual candidates' in str(explanation), text
+
+    def test_backtracking_points(self):
+        explanation = self.program.explain("""
+            push {r4-r5, fp, *}
+            ... {2, 5}
+          > mov r0, #@
+            % x = 1
+            ...
+            add @, *
+        """)
+        assert [i for i, _ in explanation.backtracking_points] == [0, 0, 1, 4, 5]
+        assert explanation.code_lines == [(3, '%x = 1')]
+        assert 'line 5: `...` tries skipping 0 or more instructions' in str(explanation)
+
+    def test_signature(self):
+        ctx = MatchingCtx(self.program, analyze=True)
+        signature = Signature(exports=['imm'], method='find_first', pattern='mov r0, #@:imm')
+        ctx.add_signature(signature)
+        ctx.resolve(signature)
+        assert signature in ctx.passed_signatures
+        assert ctx.explanations[signature].matches >= 1
+        assert '\nexplain: |\n  search: opcodes index of `mov r0, #@:imm`' in format_signature_results(signature, ctx)
@@ -0,0 +1,94 @@
+from unittest import TestCase
+
+from parm.api.common import FirstSearch, SingleSearch
+from parm.api.match_result import MatchResult
+from parm.programs.paging import LazyCursor
+from parm.programs.snippet import PreInitCursor, PostTermCursor
+from parm.tests.arm_corpus import ARM_CORPUS, load_both
+
+PAGE_SIZE = 0x10
+MAX_PAGES = 2
+
+
+def _load_both(ops):
+    return load_both(ops, PAGE_SIZE, MAX_PAGES)
+
+
+# noinspection PyMethodMayBeStatic
+class LazyProgramTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.eager, self.lazy = _load_both(ARM_CORPUS)
+
+    def test_nothing_decoded_on_load(self):
+        _, lazy = _load_both(ARM_CORPUS)
+        assert len(lazy.page_cache) == 0
+
+    def test_asm_cursors(self):
+        eager = [(c.address_val, c.instruction) for c in self.eager.asm_cursors]
+        lazy = [(c.address_val, c.instruction) for c in self.lazy.asm_cursors]
+        assert lazy == eager
+        assert len(self.lazy.page_cache) <= MAX_PAGES
+
+        lazy_rev = [(c.address_val, c.instruction) for c in reversed(self.lazy.asm_cursors)]
+        assert lazy_rev == eager[::-1]
+
+    def test_walk_across_pages(self):
+        cursor = self.lazy.create_cursor(0)
+        count = 1
+        while True:
+            nxt = cursor.next()
+            if isinstance(nxt, PostTermCursor):
+                break
+            assert nxt.address_val == cursor.address_val + 4
+            assert nxt.prev() == cursor
+            cursor = nxt
+            count += 1
+        assert count * 4 == len(ARM_CORPUS)
+        assert nxt.prev() == cursor
+
+        first = self.lazy.create_cursor(0)
+        assert isinstance(first.prev(), PreInitCursor)
+        assert first.prev().next() == first
+
+    def test_create_cursor(self):
+        cursor = self.lazy.create_cursor(0x78)
+        assert isinstance(cursor, LazyCursor)
+        assert cursor.instruction == self.eager.create_cursor(0x78).instruction
+        assert cursor.get_cursor_by_offset(-4) == self.lazy.create_cursor(0x74)
+
+    def test_eviction(self):
+        cursor = self.lazy.create_cursor(0)
+        for c in self.lazy.asm_cursors:
+            pass
+        assert len(self.lazy.page_cache) == MAX_PAGES
+        again = self.lazy.create_cursor(0)
+        assert again is not cursor
+        assert again == cursor
+        assert hash(again) == hash(cursor)
+
+    def test_skips_undecodable_words(self):
+        ops = ARM_CORPUS[:8] + bytes.fromhex('ffffffff') + ARM_CORPUS[8:16]
+        _, lazy = _load_both(ops)
+        assert [c.address_val for c in lazy.asm_cursors] == [0, 4, 0xC, 0x10]
+        assert lazy.create_cursor(0).next().next().address_val == 0xC
+
+    def test_find_single(self):
+        emr = MatchResult()
+        self.eager.find_single('test: cmp r0, #@:val', match_result=emr)
+        mr = MatchResult()
+        self.lazy.find_single('test: cmp r0, #@:val', match_result=mr)
+        assert mr['test'].address == emr['test'].address == 0x78
+        assert mr['val'] == emr['val'] == 5
+
+    def test_scanned_searches(self):
+        # Searches scan all cursors, as the code index doesn't cover the code that isn't decoded yet
+        _, lazy = _load_both(ARM_CORPUS)
+        pattern = lazy.create_pattern('test: cmp r0, #@:val')
+        assert sum(1 for _ in lazy.candidate_cursors(pattern)) == len(ARM_CORPUS) // 4
+        assert lazy.explain(pattern).anchor is None
+
+        searches = [SingleSearch(pattern, MatchResult()), FirstSearch(lazy.create_pattern('mov* @, #@'), MatchResult())]
+        lazy.run_searches(searches)
+        assert searches[0].result().address_val == 0x78
+        assert searches[1].result().address_val == self.eager.find_first('mov* @, #@', MatchResult()).address_val
@@ -0,0 +1,101 @@
+import mmap
+import tempfile
+from pathlib import Path
+from struct import pack
+from unittest import TestCase
+
+from construct import Struct, Int16ul, Int32ul, PaddedString, Int8ub, GreedyBytes
+
+from parm.api.match_result import MatchResult
+from parm.programs.capstone import CapstoneProgram, LazyCapstoneProgram, map_binary_data, map_elf_data
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, build_arm_elf
+
+DATA_ADDRESS = 0x8000
+DATA = pack('<IHH', 0xDEADBEEF, 0x1234, 0x5678) + b'\x05hello'
+
+
+def is_mapped(data):
+    return isinstance(data, memoryview) and isinstance(data.obj, mmap.mmap)
+
+
+# noinspection PyMethodMayBeStatic
+class MappedDataTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.elf_path = self.root / 'target.elf'
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS, data=(DATA_ADDRESS, DATA)))
+        self.binary_path = self.root / 'target.bin'
+        self.binary_path.write_bytes(ARM_CORPUS)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_segments(self):
+        blocks = map_elf_data(self.elf_path)
+        assert [(address, bytes(data)) for address, data in blocks] == [
+            (ARM_CORPUS_ADDRESS, ARM_CORPUS), (DATA_ADDRESS, DATA)]
+        assert all(is_mapped(data) and data.readonly for _address, data in blocks)
+
+    def test_sections(self):
+        # Without segments, the allocated sections are mapped
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS))
+        assert [(address, bytes(data)) for address, data in map_elf_data(self.elf_path)] == [
+            (ARM_CORPUS_ADDRESS, ARM_CORPUS)]
+
+    def test_adjacent_segments(self):
+        # Adjacent segments are kept as separate views of the file, rather than copied into one block
+        data_address = ARM_CORPUS_ADDRESS + len(ARM_CORPUS)
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS, data=(data_address, DATA)))
+        program = CapstoneProgram.load_arm_elf(self.elf_path)
+        assert [block.start_address for block in program._data_blocks] == [ARM_CORPUS_ADDRESS, data_address]
+        assert all(is_mapped(block.data) for block in program._data_blocks)
+        assert program.read_bytes(data_address, len(DATA)) == DATA
+
+    def test_relocatable(self):
+        # The sections of an object file are all at 0, so only the first (.text) is mapped
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS, address=0, data=(0, DATA), relocatable=True))
+        assert [(address, bytes(data)) for address, data in map_elf_data(self.elf_path)] == [(0, ARM_CORPUS)]
+
+        program = CapstoneProgram.load_arm_elf(self.elf_path)
+        assert program.read_bytes(0, 16) == ARM_CORPUS[:16]
+
+    def test_binary(self):
+        assert [(address, bytes(data)) for address, data in map_binary_data(self.binary_path, 8, 8)] == [
+            (8, ARM_CORPUS[8:16])]
+        assert map_binary_data(self.binary_path, len(ARM_CORPUS)) == []
+
+        program = CapstoneProgram.load_arm_binary(self.binary_path, offset=4)
+        assert program.read_bytes(4, 8) == ARM_CORPUS[4:12]
+
+    def test_data_patterns(self):
+        for program in [CapstoneProgram.load_arm_elf(self.elf_path), LazyCapstoneProgram.load_arm_elf(self.elf_path)]:
+            assert all(is_mapped(block.data) for block in program._data_blocks)
+            assert program.read_bytes(ARM_CORPUS_ADDRESS, 4) == ARM_CORPUS[:4]
+
+            mr = MatchResult()
+            program.create_cursor(DATA_ADDRESS).match(program.create_pattern("""
+                .dd 0xDEADBEEF
+                .dw @:first, 0x5678
+                .obj name:$name_type
+            """), mr, name_type=Struct(size=Int8ub, text=PaddedString(5, 'ascii')))
+            assert mr['first'] == 0x1234 and mr['name']['text'] == 'hello'
+
+            # The code can be read as data too
+            mr = MatchResult()
+            program.create_cursor(ARM_CORPUS_ADDRESS).match(program.create_pattern("""
+                .obj header:$header_type
+            """), mr, header_type=Struct(low=Int16ul, high=Int16ul))
+            assert mr['header']['low'] | mr['header']['high'] << 16 == int.from_bytes(ARM_CORPUS[:4], 'little')
+
+    def test_stream(self):
+        program = CapstoneProgram.load_arm_elf(self.elf_path)
+        stream = program.create_data_stream(program.create_cursor(DATA_ADDRESS))
+        view = stream.view(4)
+        assert isinstance(view.obj, mmap.mmap)
+        assert view.tobytes() == DATA[:4]
+        assert Int32ul.parse_stream(stream) == 0x56781234
+        assert stream.tell() == DATA_ADDRESS + 8
+        assert GreedyBytes.parse_stream(stream) == b'\x05hello'
+        stream.seek(-4, 2)
+        assert stream.read() == b'ello'
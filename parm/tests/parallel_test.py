@@ -0,0 +1,89 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from parm.api.match_result import MatchResult
+from parm.api.exceptions import PatternMismatchException
+from parm.api.parallel import _dump_scope, can_fork
+from parm.programs.snippet import CodeCursor
+from parm.tests.arm_corpus import ARM_CORPUS_ADDRESS, all_matches, create_program, single_match
+from parm.tests.arm_pat_compiler_test import PATTERNS
+from parm.tests.code_index_test import RUN_PATTERNS
+
+WORKERS = 3
+
+
+# noinspection PyMethodMayBeStatic
+@skipUnless(can_fork(), 'Parallel searches fork worker processes')
+class ParallelTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = create_program()
+
+    def test_find_all(self):
+        for text in PATTERNS + RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            serial = all_matches(self.program, pattern)
+            if isinstance(serial, type):
+                # Matching fails at some cursors (as for `ror#@`)
+                assert not issubclass(serial, PatternMismatchException), text
+                continue
+            assert all_matches(self.program, pattern, workers=WORKERS) == serial, text
+
+    def test_find_all_imports(self):
+        first = MatchResult()
+        self.program.find_first('mov @:rd, @', first)
+        match_result = MatchResult()
+        match_result['rd'] = first['rd']
+        parallel = MatchResult()
+        parallel['rd'] = match_result['rd']
+        pattern = 'mov @:rd, @'
+        serial = list(self.program.find_all(pattern, match_result))
+        assert serial
+        assert list(self.program.find_all(pattern, parallel, workers=WORKERS)) == serial
+        assert parallel.to_obj() == match_result.to_obj()
+
+    def test_few_candidates(self):
+        pattern = self.program.create_pattern('bl 0xFF8')
+        assert len(self.program.candidate_cursors(pattern)) < WORKERS * 2
+        assert all_matches(self.program, pattern, workers=WORKERS) == all_matches(self.program, pattern)
+
+    def test_find_single(self):
+        for text in PATTERNS + RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            serial = single_match(self.program, pattern)
+            if isinstance(serial, type) and not issubclass(serial, PatternMismatchException):
+                continue
+            assert single_match(self.program, pattern, workers=WORKERS) == serial, text
+
+    def test_concurrent_searches(self):
+        self.program.freeze()
+        patterns = ['b* @', 'mov @:rd, @', 'push {*}', 'ldr @, [@]']
+        serial = [all_matches(self.program, pattern) for pattern in patterns]
+        with ThreadPoolExecutor(len(patterns)) as executor:
+            parallel = list(executor.map(lambda pattern: all_matches(self.program, pattern, workers=2), patterns))
+        assert parallel == serial
+
+    def test_merged_scopes(self):
+        # The scopes of the matches (here capturing cursors) are merged from the workers, rather than matched again
+        pattern = self.program.create_pattern('call:\n    bl @:target')
+        serial = all_matches(self.program, pattern)
+        with patch.object(CodeCursor, 'match', autospec=True, side_effect=CodeCursor.match) as match:
+            assert all_matches(self.program, pattern, workers=WORKERS) == serial
+        assert match.call_count == 0
+
+    def test_unpicklable_scope(self):
+        match_result = MatchResult()
+        scope = match_result.new_temp_scope()
+        scope['cursor'] = self.program.create_cursor(ARM_CORPUS_ADDRESS)
+        assert _dump_scope(scope, match_result) is not None
+        scope['func'] = lambda: None
+        assert _dump_scope(scope, match_result) is None
+
+    def test_no_fork(self):
+        with patch.object(multiprocessing, 'get_all_start_methods', return_value=['spawn']):
+            assert not can_fork()
+            for pattern in ['mov @:rd, @', 'bl 0xFF8']:
+                assert all_matches(self.program, pattern, workers=WORKERS) == all_matches(self.program, pattern)
+                assert single_match(self.program, pattern, workers=WORKERS) == single_match(self.program, pattern)
@@ -0,0 +1,67 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from parm import parsers
+from parm.programs.snippet import ArmSnippetProgram
+
+ARM_GRAMMAR = 'lark_files/arm_asm.lark'
+CODE = """
+    0x1000: mov r0, #1
+    0x1004: ldr r1, [r0, #4]!
+    0x1008: bl 0x2000
+    """
+
+
+# noinspection PyMethodMayBeStatic
+class ParsersTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load_parser(self):
+        return parsers.load_parser(ARM_GRAMMAR, rel_to=parsers.__file__, start='block', cache_dir=self.cache_dir)
+
+    def cache_entries(self):
+        return list((self.cache_dir / parsers.PARSER_CACHE_SUBDIR).iterdir())
+
+    def test_shared_parsers(self):
+        assert parsers.get_arm_parser() is parsers.get_arm_parser()
+        assert ArmSnippetProgram()._code_loader.parser is ArmSnippetProgram()._code_loader.parser
+        assert ArmSnippetProgram()._pattern_loader.parser is parsers.get_arm_pattern_parser()
+
+    def test_disk_cache(self):
+        built = self.load_parser()
+        assert len(self.cache_entries()) == 1
+
+        cached = self.load_parser()
+        assert cached is not built
+        assert cached.parse(CODE) == parsers.create_arm_parser().parse(CODE)
+
+    def test_lalr_disk_cache(self):
+        def load():
+            return parsers.load_parser(
+                'lark_files/arm_asm_lalr.lark', rel_to=parsers.__file__, start='block', parser='lalr',
+                lexer='contextual', cache_dir=self.cache_dir)
+
+        expected = parsers.create_arm_lalr_parser().parse(CODE)
+        assert load().parse(CODE) == expected
+        (entry, ) = self.cache_entries()
+        built_at = entry.stat().st_mtime_ns
+
+        # Loaded from the warm cache, rather than built again
+        assert load().parse(CODE) == expected
+        assert self.cache_entries() == [entry]
+        assert entry.stat().st_mtime_ns == built_at
+
+    def test_corrupt_cache(self):
+        self.load_parser()
+        (entry, ) = self.cache_entries()
+        entry.write_bytes(b'garbage')
+
+        assert self.load_parser().parse(CODE) == parsers.create_arm_parser().parse(CODE)
+        assert self.load_parser().parse(CODE) == parsers.create_arm_parser().parse(CODE)
+        assert self.cache_entries() == [entry]
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from parm.api.match_result import MatchResult
+from parm.programs.pattern_cache import PatternCache, PatternCacheStats
+from parm.programs.snippet import ArmPatternLoader, ArmSnippetProgram
+
+
+# noinspection PyMethodMayBeStatic
+class PatternCacheTest(TestCase):
+    def test_stats(self):
+        cache = PatternCache(max_size=2)
+        assert cache.get('a', str.upper) == 'A'
+        assert cache.get('a', str.upper) == 'A'
+        assert cache.get('b', str.upper) == 'B'
+        assert cache.stats() == PatternCacheStats(hits=1, misses=2, size=2, max_size=2)
+        cache.clear()
+        assert cache.stats() == PatternCacheStats(hits=0, misses=0, size=0, max_size=2)
+
+    def test_eviction(self):
+        cache = PatternCache(max_size=2)
+        compiled = []
+
+        def compile_pattern(text):
+            compiled.append(text)
+            return text
+
+        for text in ['a', 'b', 'a', 'c', 'a', 'b']:
+            cache.get(text, compile_pattern)
+        # 'b' is the least recently used when 'c' is added
+        assert compiled == ['a', 'b', 'c', 'b']
+        assert len(cache) == 2
+
+    def test_threads(self):
+        cache = PatternCache()
+        loader = ArmPatternLoader(cache)
+        texts = [f'mov r0, #{i}' for i in range(8)] * 4
+        with ThreadPoolExecutor(4) as executor:
+            patterns = list(executor.map(loader.load, texts))
+        for text, pattern in zip(texts, patterns):
+            assert pattern is loader.load(text)
+        assert cache.stats().size == 8
+
+    def test_loader(self):
+        loader = ArmPatternLoader(PatternCache())
+        assert loader.load('mov r0, r1') is loader.load('mov r0, r1')
+        assert loader.compile('mov r0, r1') is not loader.load('mov r0, r1')
+        assert loader.cache.stats() == PatternCacheStats(hits=2, misses=1, size=1, max_size=loader.cache.max_size)
+
+    def test_nested_patterns(self):
+        program = ArmSnippetProgram()
+        program._pattern_loader = ArmPatternLoader(PatternCache())
+        program.add_code_block("""
+            0x1000: mov r5, r0
+                    mov r0, r5
+                    bleq 0x2000
+                    mov r5, r0
+                    mov r0, r5
+                    bleq 0x3000
+            """)
+        pattern = program.create_pattern("""
+            mov @:reg, r0
+            % find_next('''
+                mov r0, @:reg
+                bleq @:target
+            ''')
+            """)
+        mr = MatchResult()
+        assert len(list(program.find_all(pattern, match_result=mr))) == 2
+        ms = mr.subs[0]
+        assert ms[0]['target'].address == 0x2000
+        assert ms[3]['target'].address == 0x3000
+        # The nested pattern is only parsed once
+        assert program._pattern_loader.cache.stats().misses == 2
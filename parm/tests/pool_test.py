@@ -0,0 +1,137 @@
+import pytest
+import multiprocessing
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from parm.api.common import FirstSearch, SingleSearch, find_first, find_single
+from parm.api.exceptions import PatternMismatchException, ProgramFrozen
+from parm.api.match_result import MatchResult
+from parm.api.parallel import ProgramPool, can_fork
+from parm.signature_files.sig_files import MatchingCtx, Signature
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, all_matches, create_program, load_both, single_match
+from parm.tests.arm_pat_compiler_test import PATTERNS
+from parm.tests.code_index_test import RUN_PATTERNS
+from parm.tests.run_searches_test import outcome, searched
+
+WORKERS = 3
+
+
+def matching_texts(program, find):
+    # Matching fails at some cursors of some patterns (as for `ror#@`)
+    for text in PATTERNS + RUN_PATTERNS:
+        result = find(program, text)
+        if isinstance(result, type) and not issubclass(result, PatternMismatchException):
+            continue
+        yield text, result
+
+
+# noinspection PyMethodMayBeStatic
+@skipUnless(can_fork(), 'Pools fork worker processes')
+class ProgramPoolTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.program = create_program()
+        cls.pool = ProgramPool(cls.program, WORKERS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_workers(self):
+        assert len(set(self.pool.pids)) == WORKERS
+        assert self.program.frozen
+        with pytest.raises(ProgramFrozen):
+            self.program.add_code_block('mov r0, r1')
+
+    def test_find_all(self):
+        for text, serial in matching_texts(self.program, all_matches):
+            assert all_matches(self.pool, text) == serial, text
+
+    def test_find_single(self):
+        for text, serial in matching_texts(self.program, single_match):
+            assert single_match(self.pool, text) == serial, text
+
+    def test_imports(self):
+        first = MatchResult()
+        self.program.find_first('mov @:rd, @', first)
+        serial = MatchResult()
+        serial['rd'] = first['rd']
+        expected = list(self.program.find_all('mov @:rd, @', serial))
+        assert expected
+
+        pooled = MatchResult()
+        pooled['rd'] = first['rd']
+        assert list(self.pool.find_all('mov @:rd, @', pooled, imports={'rd': first['rd']})) == expected
+        assert pooled.to_obj() == serial.to_obj()
+
+    def test_unpicklable_imports(self):
+        # Cursors can't be sent to the workers, so the search runs in this process
+        cursor = self.program.create_cursor(ARM_CORPUS_ADDRESS)
+        match_result = MatchResult()
+        match_result['start'] = cursor
+        assert self.pool.find_single('bl 0xFF8', match_result, imports={'start': cursor}) == \
+            self.program.find_single('bl 0xFF8', MatchResult())
+
+    def test_run_searches(self):
+        expected = []
+        searches = []
+        for text in PATTERNS + RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            for search_type, find in [(FirstSearch, find_first), (SingleSearch, find_single)]:
+                result = searched(find, pattern, self.program.candidate_cursors(pattern))
+                if isinstance(result, type) and not issubclass(result, PatternMismatchException):
+                    continue
+                expected.append(result)
+                searches.append((search_type(pattern, MatchResult()), text, {}))
+
+        self.pool.run_searches(searches)
+        assert [outcome(search) for search, _text, _imports in searches] == expected
+
+    def test_signatures(self):
+        signatures = [
+            Signature(name='cmp', exports=['imm'], method='find_first', pattern='cmp r0, #@:imm'),
+            Signature(name='cmp_reg', imports=['imm'], exports=['rd'], method='find_single', pattern='cmp @:rd, #@:imm'),
+            Signature(name='too_many', exports=['reg'], method='find_single', pattern='mov @:reg, #@'),
+            Signature(name='call', exports=['call'], method='find_all', pattern='call:\n    bl 0xFF8'),
+        ]
+
+        results = []
+        for pool in [None, self.pool]:
+            ctx = MatchingCtx(self.program, pool=pool)
+            for signature in signatures:
+                ctx.add_signature(signature)
+            ctx.resolve_all(signatures)
+            results.append(([s.name for s in ctx.passed_signatures], [s.name for s in ctx.failed_signatures],
+                            ctx.match_results))
+        assert results[0] == results[1]
+        assert results[0][0] == ['call', 'cmp', 'cmp_reg']
+
+    def test_unsliceable_candidates(self):
+        # The cursors of lazy programs can only be iterated, so are listed once per search
+        _, program = load_both(ARM_CORPUS, page_size=0x10, max_pages=2)
+        texts = ['mov* @:rd, @', 'call:\n    bl @', 'cmp r0, #@:val']
+        expected = [all_matches(program, text) for text in texts]
+        with ProgramPool(program, WORKERS) as pool:
+            assert [all_matches(pool, text) for text in texts] == expected
+            searches = [(FirstSearch(program.create_pattern(text), MatchResult()), text, {}) for text in texts]
+            pool.run_searches(searches)
+        assert [outcome(search) for search, _text, _imports in searches] == [
+            searched(find_first, program.create_pattern(text), program.asm_cursors) for text in texts]
+
+
+# noinspection PyMethodMayBeStatic
+class NoForkPoolTest(TestCase):
+    def test_no_workers(self):
+        program = create_program()
+        with patch.object(multiprocessing, 'get_all_start_methods', return_value=['spawn']):
+            with ProgramPool(program, WORKERS) as pool:
+                assert pool.pids == []
+                assert program.frozen
+                for text in ['mov @:rd, @', 'bl 0xFF8', 'push {*}']:
+                    assert all_matches(pool, text) == all_matches(program, text)
+                    assert single_match(pool, text) == single_match(program, text)
+
+                pattern = program.create_pattern('cmp r0, #@:val')
+                search = FirstSearch(pattern, MatchResult())
+                pool.run_searches([(search, 'cmp r0, #@:val', {})])
+                assert search.result() == find_first(pattern, program.asm_cursors, MatchResult())
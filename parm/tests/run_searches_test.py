@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from parm.api.common import FirstSearch, SingleSearch, find_first, find_single
+from parm.api.exceptions import PatternMismatchException
+from parm.api.match_result import MatchResult
+from parm.api.program import Program
+from parm.programs.capstone import perform_disassembly
+from parm.programs.snippet import ArmSnippetProgram
+from parm.signature_files.sig_files import MatchingCtx, Signature
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS
+from parm.tests.arm_pat_compiler_test import PATTERNS
+from parm.tests.code_index_test import RUN_PATTERNS
+
+
+def outcome(search):
+    try:
+        return search.result(), search.match_result.to_obj()
+    except Exception as e:
+        return type(e)
+
+
+def searched(find, pattern, cursors):
+    match_result = MatchResult()
+    try:
+        return find(pattern, cursors, match_result), match_result.to_obj()
+    except Exception as e:
+        return type(e)
+
+
+# noinspection PyMethodMayBeStatic
+class RunSearchesTest(TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.program = ArmSnippetProgram(parser='lalr')
+        self.program.add_code_block(perform_disassembly(ARM_CORPUS_ADDRESS, ARM_CORPUS, 'arm', 32))
+
+    def check_equivalence(self, run_searches):
+        expected = []
+        searches = []
+        for text in PATTERNS + RUN_PATTERNS:
+            pattern = self.program.create_pattern(text)
+            for search_type, find in [(FirstSearch, find_first), (SingleSearch, find_single)]:
+                result = searched(find, pattern, self.program.asm_cursors)
+                if isinstance(result, type) and not issubclass(result, PatternMismatchException):
+                    # Matching fails at some cursors (as for `ror#@`)
+                    continue
+                expected.append(result)
+                searches.append(search_type(pattern, MatchResult()))
+
+        run_searches(searches)
+        assert [outcome(search) for search in searches] == expected
+
+    def test_indexed(self):
+        self.check_equivalence(self.program.run_searches)
+
+    def test_scan(self):
+        self.check_equivalence(lambda searches: Program.run_searches(self.program, searches))
+
+    def test_resolve_all(self):
+        signatures = [
+            Signature(name='cmp', exports=['imm'], method='find_first', pattern='cmp r0, #@:imm'),
+            Signature(name='cmp_reg', imports=['imm'], exports=['rd'], method='find_single', pattern='cmp @:rd, #@:imm'),
+            Signature(name='missing', imports=['nothing'], exports=['rn'], method='find_first', pattern='mov @:rn, @'),
+            Signature(name='too_many', exports=['reg'], method='find_single', pattern='mov @:reg, #@'),
+        ]
+
+        batched = MatchingCtx(self.program)
+        for signature in signatures:
+            batched.add_signature(signature)
+        batched.resolve_all(signatures)
+
+        for signature in signatures:
+            if signature.name == 'missing':
+                assert signature in batched.not_run_signatures
+                continue
+            result = MatchResult()
+            for imp in signature.imports:
+                result[imp] = batched.match_results[imp]
+            try:
+                getattr(self.program, signature.method)(signature.pattern, result)
+            except Exception as e:
+                assert signature in batched.failed_signatures, type(e)
+                continue
+            assert signature in batched.passed_signatures
+            for exp in signature.exports:
+                assert batched.match_results[exp] == result[exp]
+
+        assert [s.name for s in batched.passed_signatures] == ['cmp', 'cmp_reg']
+        assert batched.error_map[signatures[2]] == ['unresolved import [nothing]']
@@ -0,0 +1,76 @@
+import sys
+import pytest
+import subprocess
+from unittest import TestCase
+
+from parm.api.exceptions import ProgramFrozen
+from parm.programs.shared_image import SharedProgramImage
+from parm.programs.snippet import ArmSnippetProgram
+from parm.tests.arm_corpus import all_matches, create_program, single_match
+from parm.tests.arm_pat_compiler_test import PATTERNS
+from parm.tests.code_index_test import RUN_PATTERNS
+
+ATTACH_SCRIPT = '''
+import sys
+from parm.api.match_result import MatchResult
+from parm.programs.shared_image import SharedProgramImage
+from parm.programs.snippet import ArmSnippetProgram
+
+program = ArmSnippetProgram(parser='lalr')
+program.attach_shared(SharedProgramImage.attach(sys.argv[1]))
+print([c.address_val for c in program.find_all('bl @', MatchResult())])
+print(program.read_bytes(0x8010, 4).hex())
+'''
+
+
+def create_shared_program():
+    program = create_program()
+    program.add_code_block('0x10: mov r0, r1\n0x14: bx lr\n0x20:')
+    return program
+
+
+# noinspection PyMethodMayBeStatic
+class SharedImageTest(TestCase):
+    def setUp(self):
+        self.program = create_shared_program()
+        self.image = self.program.export_shared()
+        self.attached = ArmSnippetProgram(parser='lalr')
+        self.attached.attach_shared(SharedProgramImage.attach(self.image.name))
+
+    def tearDown(self):
+        self.attached._shared_image.close()
+        self.image.close()
+        self.image.unlink()
+
+    def test_matches(self):
+        for text in PATTERNS + RUN_PATTERNS:
+            assert all_matches(self.attached, text) == all_matches(self.program, text), text
+            assert single_match(self.attached, text) == single_match(self.program, text), text
+
+    def test_cursors(self):
+        for original, attached in zip(self.program.asm_cursors, self.attached.asm_cursors):
+            assert (attached.address, attached.instruction) == (original.address, original.instruction)
+        terminal = self.attached.create_cursor(0x14).next()
+        assert terminal.address == 0x20
+
+    def test_data(self):
+        assert self.attached.read_bytes(0x8004, 8) == bytes(range(4, 12))
+        assert self.attached.create_cursor(0x8008).read_bytes(2) == b'\x08\x09'
+
+    def test_read_only(self):
+        assert self.attached.frozen
+        with pytest.raises(ProgramFrozen):
+            self.attached.add_code_block('mov r0, r1')
+        with pytest.raises(TypeError):
+            self.attached._code.addresses[0] = 0
+
+        program = create_shared_program()
+        with pytest.raises(ValueError):
+            program.attach_shared(SharedProgramImage.attach(self.image.name))
+
+    def test_other_process(self):
+        output = subprocess.run([sys.executable, '-c', ATTACH_SCRIPT, self.image.name], capture_output=True,
+                                text=True, check=True)
+        expected = all_matches(self.program, 'bl @')[0]
+        assert output.stdout.splitlines() == [str(expected), '10111213']
+        assert not output.stderr
@@ -0,0 +1,75 @@
+import pytest
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from parm.api.exceptions import UnresolvedSymbolException
+from parm.api.match_result import MatchResult
+from parm.api.symbols import Symbol, SymbolTable
+from parm.programs.capstone import CapstoneProgram, LazyCapstoneProgram, read_elf_symbols
+from parm.tests.arm_corpus import ARM_CORPUS, ARM_CORPUS_ADDRESS, build_arm_elf
+
+SYMBOLS = [('main', ARM_CORPUS_ADDRESS, 0x10), ('helper', ARM_CORPUS_ADDRESS + 0x10, 0x10)]
+
+
+# noinspection PyMethodMayBeStatic
+class SymbolTableTest(TestCase):
+    def test_find(self):
+        table = SymbolTable([Symbol('a', 0x10), Symbol('b', 0x20), Symbol('a', 0x30)])
+        assert len(table) == 2
+        assert table.find('a') == Symbol('a', 0x10)
+        assert table.find('c') is None
+
+    def test_nearest(self):
+        table = SymbolTable([Symbol('b', 0x20, 0x10), Symbol('a', 0x10, 0x8)])
+        assert table.nearest(0xF) is None
+        assert table.nearest(0x10).name == 'a'
+        assert table.nearest(0x1F).name == 'a'
+        assert not table.nearest(0x1F).contains(0x1F)
+        assert table.nearest(0x2F).name == 'b' and table.nearest(0x2F).contains(0x2F)
+        assert table.nearest(0x1000).name == 'b'
+
+        # The largest of the symbols at an address is the nearest
+        table.update([Symbol('label', 0x20), Symbol('func', 0x20, 0x40)])
+        assert table.nearest(0x24).name == 'func'
+
+
+# noinspection PyMethodMayBeStatic
+class ElfSymbolsTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.elf_path = Path(self.tmp_dir.name) / 'target.elf'
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS, symbols=SYMBOLS))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read(self):
+        assert read_elf_symbols(self.elf_path) == [Symbol(*symbol) for symbol in SYMBOLS]
+        self.elf_path.write_bytes(build_arm_elf(ARM_CORPUS))
+        assert read_elf_symbols(self.elf_path) == []
+
+    def test_programs(self):
+        for program in [CapstoneProgram.load_arm_elf(self.elf_path), LazyCapstoneProgram.load_arm_elf(self.elf_path)]:
+            assert program.find_symbol('helper') == program.create_cursor(ARM_CORPUS_ADDRESS + 0x10)
+            with pytest.raises(UnresolvedSymbolException):
+                program.find_symbol('missing')
+            assert program.nearest_symbol(ARM_CORPUS_ADDRESS + 0x14).name == 'helper'
+            assert program.nearest_symbol(ARM_CORPUS_ADDRESS - 4) is None
+
+    def test_patterns(self):
+        program = CapstoneProgram.load_arm_elf(self.elf_path)
+        mr = MatchResult()
+        program.match("""
+            % goto('helper')
+            mov @:reg, r2
+            % match_result['func'] = nearest_symbol().name
+        """, mr)
+        assert mr['reg'].name == 'r1'
+        assert mr['func'] == 'helper'
+
+        with pytest.raises(UnresolvedSymbolException):
+            program.match("""
+                % goto('missing')
+                mov @:reg, r2
+            """, MatchResult())